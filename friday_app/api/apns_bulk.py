@@ -0,0 +1,156 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import frappe
+from frappe import _
+
+from .apns_client import get_transport
+from .auth_context import get_auth_context, get_current_user_id
+from .device_tokens import invalidate_device_tokens, is_config_error, log_config_errors
+from .metrics import observe_outbound
+from .utils import apns_result, build_apns_request, get_apns_settings, log_error, log_info
+
+# ============= BULK PUSH =============
+# Hromadné pushe (admin broadcast, "čaká volajúci" pre všetkých poradcov, zvonenie na viac zariadení).
+# Pushe idú paralelne ako HTTP/2 streamy cez zdieľaný APNs transport.
+# Vlákna robia len HTTP – frappe.local je thread-local, takže logovanie a DB ostávajú v hlavnom vlákne.
+# site_config.json:
+#   apns_bulk_concurrency – max. súbežných streamov
+
+DEFAULT_CONCURRENCY = 100
+# h2 klient pred prvým SETTINGS od servera povolí len 100 otvorených streamov
+MAX_CONCURRENCY = 100
+MAX_BROADCAST_TOKENS = 50000
+
+
+def send_bulk_notifications(device_tokens: list, title: str, body: str, extra: dict | None = None,
+                            concurrency: int | None = None, expiration: int | None = None,
+                            push_type: str = "alert") -> list:
+    """
+    Pošle rovnaký alert na všetky device_tokens.
+    Vráti výsledky v poradí tokenov: {"device_token", "success", "status", "reason", "retryable"}.
+    """
+    device_tokens = [t for t in dict.fromkeys(device_tokens or []) if t]
+    if not device_tokens:
+        return []
+
+    settings = get_apns_settings()
+    if not settings:
+        return [
+            {"device_token": t, "success": False, "status": None, "reason": "MissingSettings",
+             "retryable": False, "dead": False}
+            for t in device_tokens
+        ]
+
+    headers, content = build_apns_request(settings, title, body, extra, expiration, push_type)
+    transport = get_transport(settings.is_sandbox)
+    concurrency = min(
+        int(concurrency or frappe.conf.get("apns_bulk_concurrency") or DEFAULT_CONCURRENCY),
+        MAX_CONCURRENCY,
+        len(device_tokens),
+    )
+
+    def send(device_token):
+        start = time.perf_counter()
+        try:
+            return device_token, transport.post(device_token, headers, content), None, time.perf_counter() - start
+        except Exception as e:
+            return device_token, None, e, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="apns-bulk") as pool:
+        responses = list(pool.map(send, device_tokens))
+
+    results = []
+    for device_token, res, error, seconds in responses:
+        result = apns_result(settings, res, error)
+        result["device_token"] = device_token
+        results.append(result)
+        # vlákna poolu nemajú frappe.local – metriky zapisuje hlavné vlákno
+        observe_outbound("apns", "push", seconds, str(res.status_code) if res is not None else "error")
+
+    dead = {r["device_token"]: r["reason"] for r in results if r["dead"]}
+    invalidate_device_tokens(dead)
+
+    log_config_errors(results, headers)
+
+    errors = [r for r in results if not r["success"] and not r["dead"]]
+    log_info(f"APNs bulk push: {len(results) - len(errors) - len(dead)} ok, {len(dead)} dead, {len(errors)} failed")
+    errors = [r for r in errors if not is_config_error(r)]
+    if errors:
+        log_error(
+            "\n".join(f"{r['device_token'][:8]}… {r['status']} {r['reason']}" for r in errors)[:10000],
+            "APNs Bulk Push Errors"
+        )
+    return results
+
+
+def get_device_tokens(user_ids: list | None = None, role: str | None = None) -> list:
+    """APNs tokeny aktívnych používateľov podľa filtra – jeden dotaz."""
+    conditions = ["u.status = 'active'", "ifnull(d.apns_token, '') != ''"]
+    values = {}
+    if user_ids:
+        conditions.append("u.name in %(user_ids)s")
+        values["user_ids"] = tuple(user_ids)
+    if role:
+        conditions.append("u.role = %(role)s")
+        values["role"] = role
+
+    return frappe.db.sql_list(
+        f"""
+        select d.apns_token
+        from `tabDevice` d
+        join `tabFriday User` u on u.name = d.user
+        where {" and ".join(conditions)}
+        limit {MAX_BROADCAST_TOKENS}
+        """,
+        values,
+    )
+
+
+def notify_advisors(caller_id: str, caller_name: str):
+    """Upozorní všetkých poradcov (rola admin), že čaká volajúci."""
+    return send_bulk_notifications(
+        get_device_tokens(role="admin"),
+        title="Čakajúci klient",
+        body=f"{caller_name} čaká na hovor",
+        extra={"caller_id": caller_id, "type": "waiting_caller"},
+    )
+
+
+@frappe.whitelist(allow_guest=False, methods=["POST"])
+def broadcast_push():
+    """
+    Admin → hromadný push.
+    Body: title, body, extra, a buď device_tokens, alebo filter user_ids / role.
+    """
+    get_current_user_id()
+    if get_auth_context().role != "admin":
+        frappe.throw(_("Access denied: admin only"), frappe.PermissionError)
+
+    data = frappe.request.get_json() or {}
+    title = data.get("title")
+    body = data.get("body")
+    if not title or not body:
+        frappe.throw(_("Missing title or body"))
+
+    device_tokens = data.get("device_tokens")
+    if device_tokens:
+        if not isinstance(device_tokens, list):
+            frappe.throw(_("device_tokens must be a list"))
+        device_tokens = [t for t in dict.fromkeys(device_tokens) if t and isinstance(t, str)]
+        if len(device_tokens) > MAX_BROADCAST_TOKENS:
+            frappe.throw(_("Too many device tokens (max {0})").format(MAX_BROADCAST_TOKENS))
+    else:
+        device_tokens = get_device_tokens(user_ids=data.get("user_ids"), role=data.get("role"))
+
+    results = send_bulk_notifications(device_tokens, title, body, extra=data.get("extra"))
+    sent = sum(1 for r in results if r["success"])
+    return {
+        "success": True,
+        "sent": sent,
+        "failed": len(results) - sent,
+        "results": [
+            {"device_token": r["device_token"], "success": r["success"], "status": r["status"], "reason": r["reason"]}
+            for r in results
+        ],
+    }
@@ -0,0 +1,259 @@
+import hashlib
+import os
+import threading
+import time
+
+import frappe
+import httpx
+import jwt
+
+# ============= APNs TRANSPORT =============
+# Jeden dlho žijúci HTTP/2 klient na host a worker. Pushe idú ako streamy
+# cez to isté spojenie, takže TCP+TLS+HTTP/2 handshake platíme raz, nie pri každom hovore.
+# site_config.json:
+#   apns_base_url      – prepíše host (napr. lokálny stub server, http://127.0.0.1:8443)
+#   apns_timeout       – timeout jedného pushu (sekundy)
+#   apns_idle_timeout  – po koľkých sekundách nečinnosti spojenie zahodíme
+
+APNS_PRODUCTION_URL = "https://api.push.apple.com"
+APNS_SANDBOX_URL = "https://api.sandbox.push.apple.com"
+DEFAULT_TIMEOUT = 10.0
+# Apple zatvára nečinné spojenia, radšej skôr ako neskôr
+DEFAULT_IDLE_TIMEOUT = 300.0
+MAX_CONNECTIONS = 4
+
+# chyby, pri ktorých request z klienta ešte neodišiel (spojenie sa nepodarilo otvoriť).
+# Stream nad last_stream_id z GOAWAY httpcore zopakuje na novom spojení sám.
+# ReadError / RemoteProtocolError po odoslaní sa neopakujú – Apple mohol push už prijať
+# a VoIP hovor by zazvonil dvakrát.
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+
+class APNsTransport:
+    def __init__(self, base_url: str, timeout: float = DEFAULT_TIMEOUT,
+                 idle_timeout: float = DEFAULT_IDLE_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self._client = None
+        self._pid = None
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            "requests": 0,
+            "connections": 0,
+            "reconnects": 0,
+            "errors": 0,
+        }
+
+    def _new_client(self):
+        # APNs je len HTTP/2 – http1=False zapne prior knowledge aj pre h2c stub
+        return httpx.Client(
+            base_url=self.base_url,
+            http1=False,
+            http2=True,
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_CONNECTIONS,
+                keepalive_expiry=self.idle_timeout,
+            ),
+        )
+
+    def _get_client(self):
+        with self._lock:
+            now = time.monotonic()
+            stale = self._client is not None and (
+                self._pid != os.getpid() or now - self._last_used > self.idle_timeout
+            )
+            if stale:
+                self._close_client()
+            if self._client is None:
+                self._client = self._new_client()
+                self._pid = os.getpid()
+            self._last_used = now
+            return self._client
+
+    def _close_client(self):
+        client, self._client = self._client, None
+        if client is not None and self._pid == os.getpid():
+            try:
+                client.close()
+            except Exception:
+                pass
+
+    def _bump(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def reset(self):
+        with self._lock:
+            self._close_client()
+
+    def post(self, device_token: str, headers: dict, content: bytes) -> httpx.Response:
+        """
+        Pošle jeden push. Ak sa nepodarilo otvoriť spojenie, raz to skúsi znova.
+        """
+        path = f"/3/device/{device_token}"
+        for attempt in range(2):
+            client = self._get_client()
+            try:
+                res = client.post(path, headers=headers, content=content)
+            except RETRYABLE_ERRORS:
+                self._bump("errors")
+                if attempt:
+                    raise
+                self._bump("reconnects")
+                continue
+            except httpx.HTTPError:
+                self._bump("errors")
+                raise
+
+            self._bump("requests")
+            # prvý stream na HTTP/2 spojení má id 1 → nové spojenie
+            if res.extensions.get("stream_id") == 1:
+                self._bump("connections")
+            return res
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats["base_url"] = self.base_url
+        stats["reused"] = max(stats["requests"] - stats["connections"], 0)
+        return stats
+
+
+# ============= PROVIDER TOKEN =============
+# Apple berie provider JWT hodinu a pri príliš častom pretláčaní nových tokenov škrtí.
+# Podpisujeme raz za ~50 minút pre (team_id, key_id, odtlačok kľúča), token zdieľame cez Redis.
+
+PROVIDER_TOKEN_TTL = 50 * 60
+PROVIDER_TOKEN_KEY = "friday:apns:provider_token:"
+
+# (site, cache_key) -> (token, issued_at)
+_provider_tokens = {}
+_provider_lock = threading.Lock()
+provider_token_stats = {"signed": 0}
+
+
+def _provider_cache_key(team_id: str, key_id: str, auth_key: str) -> str:
+    fingerprint = hashlib.sha256(auth_key.strip().encode()).hexdigest()[:16]
+    return f"{team_id}:{key_id}:{fingerprint}"
+
+
+def _sign_provider_token(team_id: str, key_id: str, auth_key: str, issued_at: int) -> str:
+    provider_token_stats["signed"] += 1
+    return jwt.encode(
+        {"iss": team_id, "iat": issued_at},
+        auth_key,
+        algorithm="ES256",
+        headers={"alg": "ES256", "kid": key_id}
+    )
+
+
+def _is_fresh(entry, now: float) -> bool:
+    return bool(entry) and now - entry[1] < PROVIDER_TOKEN_TTL
+
+
+def get_provider_token(team_id: str, key_id: str, auth_key: str) -> str:
+    """
+    Vráti platný APNs provider JWT. Poradie: pamäť procesu → Redis → nový podpis
+    (pod Redis zámkom, aby naraz podpisoval len jeden worker).
+    """
+    cache_key = _provider_cache_key(team_id, key_id, auth_key)
+    local_key = (frappe.local.site, cache_key)
+    now = time.time()
+    entry = _provider_tokens.get(local_key)
+    if _is_fresh(entry, now):
+        return entry[0]
+
+    with _provider_lock:
+        entry = _provider_tokens.get(local_key)
+        if _is_fresh(entry, now):
+            return entry[0]
+
+        redis_key = PROVIDER_TOKEN_KEY + cache_key
+        entry = frappe.cache().get_value(redis_key)
+        if not _is_fresh(entry, now):
+            try:
+                with frappe.cache().lock(frappe.cache().make_key(redis_key + ":lock"),
+                                         timeout=10, blocking_timeout=5):
+                    entry = frappe.cache().get_value(redis_key)
+                    if not _is_fresh(entry, now):
+                        entry = _issue_provider_token(redis_key, team_id, key_id, auth_key)
+            except Exception as e:
+                # Redis zámok nedostupný – radšej podpíšeme lokálne ako neposlať push
+                frappe.logger().warning(f"[FRIDAY] APNs provider token lock failed: {e}")
+                entry = _issue_provider_token(redis_key, team_id, key_id, auth_key)
+
+        _provider_tokens[local_key] = entry
+        return entry[0]
+
+
+def _issue_provider_token(redis_key: str, team_id: str, key_id: str, auth_key: str):
+    issued_at = int(time.time())
+    entry = (_sign_provider_token(team_id, key_id, auth_key, issued_at), issued_at)
+    frappe.cache().set_value(redis_key, entry, expires_in_sec=PROVIDER_TOKEN_TTL)
+    return entry
+
+
+def invalidate_provider_token(team_id: str | None = None, key_id: str | None = None,
+                              auth_key: str | None = None):
+    """
+    Zahodí cachovaný provider token (napr. po ExpiredProviderToken alebo zmene kľúča).
+    Bez argumentov zahodí všetky tokeny tohto situ.
+    """
+    site = frappe.local.site
+    with _provider_lock:
+        if team_id and key_id and auth_key:
+            cache_key = _provider_cache_key(team_id, key_id, auth_key)
+            _provider_tokens.pop((site, cache_key), None)
+            frappe.cache().delete_value(PROVIDER_TOKEN_KEY + cache_key)
+            return
+        for local_key in [k for k in _provider_tokens if k[0] == site]:
+            _provider_tokens.pop(local_key, None)
+            frappe.cache().delete_value(PROVIDER_TOKEN_KEY + local_key[1])
+
+
+_transports = {}
+_transports_lock = threading.Lock()
+
+
+def get_base_url(use_sandbox: bool) -> str:
+    return frappe.conf.get("apns_base_url") or (APNS_SANDBOX_URL if use_sandbox else APNS_PRODUCTION_URL)
+
+
+def get_transport(use_sandbox: bool = False) -> APNsTransport:
+    """Zdieľaný transport pre daný APNs host (jeden na worker proces)."""
+    base_url = get_base_url(use_sandbox)
+    transport = _transports.get(base_url)
+    if transport is None:
+        with _transports_lock:
+            transport = _transports.get(base_url)
+            if transport is None:
+                transport = APNsTransport(
+                    base_url,
+                    timeout=float(frappe.conf.get("apns_timeout") or DEFAULT_TIMEOUT),
+                    idle_timeout=float(frappe.conf.get("apns_idle_timeout") or DEFAULT_IDLE_TIMEOUT),
+                )
+                _transports[base_url] = transport
+    return transport
+
+
+def close_transports():
+    with _transports_lock:
+        for transport in _transports.values():
+            transport.reset()
+        _transports.clear()
+
+
+@frappe.whitelist()
+def transport_stats():
+    """Štatistiky znovupoužitia APNs spojení v tomto workeri."""
+    frappe.only_for("System Manager")
+    return {
+        "success": True,
+        "transports": [t.get_stats() for t in _transports.values()],
+        "provider_tokens_signed": provider_token_stats["signed"],
+    }
@@ -0,0 +1,226 @@
+import frappe
+from frappe.utils import add_days, add_months, cint, get_datetime, now_datetime
+
+from .auth_context import get_auth_context, get_current_user_id
+from .utils import log_info
+
+# ============= CALL LOG ARCHIVE =============
+# Call Log je "horúca" tabuľka: bežiace a nedávne hovory. Skončené hovory staršie ako horizont
+# (a už započítané do súhrnov, viď rollups.py) presúva denný job po dávkach do Call Log Archive
+# (rovnaké stĺpce + archive_month = YYYYMM).
+# Archív je na MariaDB partíciovaný podľa mesiaca (RANGE na archive_month), takže dotaz
+# s obmedzením na mesiace číta len príslušné partície a staré mesiace sa dajú zahodiť celé.
+# História (call_history) číta horúcu tabuľku a archív len keď treba.
+# site_config.json:
+#   friday_call_archive_days – po koľkých dňoch od konca ide hovor do archívu (default 90)
+
+HOT_TABLE = "tabCall Log"
+ARCHIVE_TABLE = "tabCall Log Archive"
+ARCHIVABLE_STATUSES = ("ended", "declined", "missed", "failed")
+DEFAULT_HORIZON_DAYS = 90
+ARCHIVE_CHUNK = 500
+MAX_CHUNKS_PER_RUN = 200
+PARTITIONS_AHEAD = 3
+HISTORY_FIELDS = (
+    "name", "caller", "advisor", "status", "started_at", "ended_at", "duration", "billed_minutes",
+)
+HISTORY_MAX_LIMIT = 200
+
+
+def horizon_days() -> int:
+    return cint(frappe.conf.get("friday_call_archive_days")) or DEFAULT_HORIZON_DAYS
+
+
+def _month(value) -> int:
+    value = get_datetime(value)
+    return value.year * 100 + value.month
+
+
+def _next_month(month: int) -> int:
+    return month + 1 if month % 100 < 12 else (month // 100 + 1) * 100 + 1
+
+
+# ---------- partície ----------
+
+
+def _partitions() -> list:
+    return frappe.db.sql_list(
+        """
+        select partition_name
+        from information_schema.partitions
+        where table_schema = database() and table_name = %s and partition_name is not null
+        order by partition_ordinal_position
+        """,
+        ARCHIVE_TABLE,
+    )
+
+
+def _partition_clause(months: list) -> str:
+    parts = [f"partition p{m} values less than ({_next_month(m)})" for m in months]
+    parts.append("partition pmax values less than maxvalue")
+    return ", ".join(parts)
+
+
+def ensure_archive_partitions():
+    """
+    Mesačné partície archívu (after_migrate + pred každou archiváciou), PARTITIONS_AHEAD dopredu.
+    Prvé spustenie prerobí primárny kľúč na (name, archive_month) – kľúč partície
+    musí byť súčasťou každého unikátneho kľúča.
+    """
+    if frappe.db.db_type != "mariadb":
+        return
+
+    last = _month(add_months(now_datetime(), PARTITIONS_AHEAD))
+    existing = _partitions()
+    if not existing:
+        oldest = frappe.db.sql(f"select min(coalesce(started_at, creation)) from `{HOT_TABLE}`")[0][0]
+        months = [_month(oldest or now_datetime())]
+        while months[-1] < last:
+            months.append(_next_month(months[-1]))
+        # archív je pred prvým spustením prázdny (alebo malý), prestavba tabuľky je lacná
+        frappe.db.sql_ddl(
+            f"""
+            alter table `{ARCHIVE_TABLE}`
+                drop primary key,
+                add primary key (name, archive_month)
+            partition by range (archive_month) ({_partition_clause(months)})
+            """
+        )
+        log_info(f"Partitioned {ARCHIVE_TABLE} by month ({len(months)} partitions)")
+        return
+
+    months = sorted(int(p[1:]) for p in existing if p != "pmax")
+    new = []
+    while (new or months)[-1] < last:
+        new.append(_next_month((new or months)[-1]))
+    if new:
+        # pmax je prázdna (dáta majú vždy svoj mesiac vopred), rozdelenie nič nepresúva
+        frappe.db.sql_ddl(
+            f"alter table `{ARCHIVE_TABLE}` reorganize partition pmax into ({_partition_clause(new)})"
+        )
+        log_info(f"Added {len(new)} partition(s) to {ARCHIVE_TABLE}")
+
+
+# ---------- archivácia ----------
+
+
+def _shared_columns() -> list:
+    archive = set(frappe.db.get_table_columns("Call Log Archive"))
+    return [c for c in frappe.db.get_table_columns("Call Log") if c in archive]
+
+
+def archive_calls(horizon=None, chunk=ARCHIVE_CHUNK, max_chunks=MAX_CHUNKS_PER_RUN) -> int:
+    """
+    Scheduler (denne): presunie skončené hovory staršie ako horizont do archívu.
+    Každá dávka = zamknúť max `chunk` riadkov, INSERT ... SELECT, DELETE, commit –
+    zámky držíme len na jednu dávku, nie na celý beh. Vráti počet presunutých hovorov.
+    """
+    ensure_archive_partitions()
+    cutoff = add_days(now_datetime(), -(cint(horizon) or horizon_days()))
+    columns = ", ".join(f"`{c}`" for c in _shared_columns())
+
+    moved = 0
+    for _chunk in range(max_chunks):
+        names = frappe.db.sql_list(
+            f"""
+            select name
+            from `{HOT_TABLE}`
+            where status in %(statuses)s and rolled_up = 1 and modified < %(cutoff)s
+            order by modified asc
+            limit %(chunk)s
+            for update skip locked
+            """,
+            {"statuses": ARCHIVABLE_STATUSES, "cutoff": cutoff, "chunk": chunk},
+        )
+        if not names:
+            break
+
+        frappe.db.sql(
+            f"""
+            insert into `{ARCHIVE_TABLE}` ({columns}, archive_month, archived_at)
+            select {columns}, extract(year_month from coalesce(started_at, creation)), %(now)s
+            from `{HOT_TABLE}`
+            where name in %(names)s
+            """,
+            {"names": tuple(names), "now": now_datetime()},
+        )
+        frappe.db.sql(f"delete from `{HOT_TABLE}` where name in %(names)s", {"names": tuple(names)})
+        frappe.db.commit()
+
+        moved += len(names)
+        if len(names) < chunk:
+            break
+
+    if moved:
+        log_info(f"Archived {moved} call(s) older than {cutoff}")
+    return moved
+
+
+# ---------- čítanie ----------
+
+
+def _history_query(table: str, user: str, before, limit: int) -> list:
+    fields = ", ".join(f"`{f}`" for f in HISTORY_FIELDS)
+    conditions, params = [], {"user": user, "limit": limit}
+    if before:
+        conditions.append("(started_at < %(at)s or (started_at = %(at)s and name < %(name)s))")
+        params.update(at=before["at"], name=before["name"])
+        if table == ARCHIVE_TABLE:
+            # partition pruning – mesiace po kurzore netreba čítať
+            conditions.append("archive_month <= %(month)s")
+            params["month"] = _month(before["at"])
+    where = "".join(f" and {c}" for c in conditions)
+
+    # dve vetvy (caller / advisor), každá ide po svojom indexe (x, started_at)
+    return frappe.db.sql(
+        f"""
+        select * from (
+            (select {fields} from `{table}` where caller = %(user)s{where}
+                order by started_at desc, name desc limit %(limit)s)
+            union all
+            (select {fields} from `{table}` where advisor = %(user)s and caller != %(user)s{where}
+                order by started_at desc, name desc limit %(limit)s)
+        ) calls
+        order by started_at desc, name desc
+        limit %(limit)s
+        """,
+        params,
+        as_dict=True,
+    )
+
+
+def call_history(user: str, before=None, limit: int = 50) -> list:
+    """
+    Hovory používateľa od najnovších, horúca tabuľka + archív.
+    before = {"at": started_at, "name": name} posledného riadku predošlej stránky.
+    """
+    calls = _history_query(HOT_TABLE, user, before, limit)
+    # archivujú sa len hovory staršie ako horizont – ak je stránka plná a končí novším
+    # hovorom, v archíve nemôže byť nič, čo by na ňu patrilo
+    horizon_start = add_days(now_datetime(), -horizon_days())
+    if len(calls) == limit and calls[-1].started_at and get_datetime(calls[-1].started_at) >= horizon_start:
+        return calls
+
+    calls += _history_query(ARCHIVE_TABLE, user, before, limit)
+    calls.sort(key=lambda c: (get_datetime(c.started_at or "1970-01-01"), c.name), reverse=True)
+    return calls[:limit]
+
+
+@frappe.whitelist(allow_guest=False)
+def history(user_id=None, before_at=None, before_name=None, limit=50):
+    """
+    História hovorov (vlastná, admin aj cudzia). Stránkovanie kurzorom before_at + before_name.
+    """
+    current = get_current_user_id()
+    if user_id and user_id != current and get_auth_context().role != "admin":
+        return {"success": False, "error": "Forbidden"}
+
+    limit = min(max(cint(limit), 1), HISTORY_MAX_LIMIT)
+    before = {"at": get_datetime(before_at), "name": before_name or ""} if before_at else None
+    calls = call_history(user_id or current, before, limit)
+    last = calls[-1] if len(calls) == limit else None
+    return {
+        "success": True,
+        "calls": calls,
+        "next": {"before_at": str(last.started_at), "before_name": last.name} if last else None,
+    }
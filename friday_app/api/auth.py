@@ -1,6 +1,7 @@
 import frappe
 from frappe import _
-from .utils import verify_clerk_token, log_info, log_error
+from .utils import log_info, log_error
+from .auth_context import get_auth_context, get_current_user_id, invalidate_auth_cache
 from frappe.utils import now
 
 
@@ -10,22 +11,10 @@ def sync_user():
     iOS → po prihlásení cez Clerk pošle JWT.
     My overíme u Clerka a uložíme / aktualizujeme Friday User.
     """
-    auth_header = frappe.get_request_header("Authorization")
-    if not auth_header:
-        frappe.throw(_("Missing Authorization header"))
-
-    jwt_token = (
-        auth_header.replace("Bearer ", "")
-        .replace("Token ", "")
-        .replace("token ", "")
-        .strip()
-    )
-
-    clerk_user = verify_clerk_token(jwt_token)
-    if not clerk_user:
-        frappe.throw(_("Invalid Clerk token"))
+    ctx = get_auth_context()
+    clerk_user = ctx.claims
 
-    clerk_id = clerk_user.get("sub") or clerk_user.get("id")
+    clerk_id = ctx.clerk_id
     email = clerk_user.get("email") or (
         clerk_user.get("email_addresses", [{}])[0].get("email_address")
         if isinstance(clerk_user.get("email_addresses"), list)
@@ -38,7 +27,7 @@ def sync_user():
     if not clerk_id:
         frappe.throw(_("Clerk user id not found"))
 
-    existing = frappe.db.get_value("Friday User", {"clerk_id": clerk_id}, "name")
+    existing = ctx.user_id
     if not existing:
         doc = frappe.get_doc({
             "doctype": "Friday User",
@@ -52,6 +41,7 @@ def sync_user():
         })
         doc.insert(ignore_permissions=True)
         frappe.db.commit()
+        invalidate_auth_cache(clerk_id)
         log_info(f"Created Friday User for {email}")
         return {"success": True, "created": True, "user_id": doc.name}
     else:
@@ -63,6 +53,7 @@ def sync_user():
             "status": "active"
         })
         frappe.db.commit()
+        invalidate_auth_cache(clerk_id)
         log_info(f"Updated Friday User {existing}")
         return {"success": True, "updated": True, "user_id": existing}
 
@@ -70,42 +61,50 @@ def sync_user():
 @frappe.whitelist(allow_guest=True, methods=["POST"])
 def register_device():
     """
-    iOS → pošle voip_token + apns_token.
+    iOS → pošle voip_token + apns_token (a voliteľne device_id = identifierForVendor).
     My si z JWT zistíme, kto je používateľ a uložíme zariadenie.
+    Používateľ môže mať viac zariadení – zariadenie sa hľadá podľa device_id alebo tokenu,
+    nie podľa používateľa. Každá registrácia posunie last_seen_at (hovor zvoní len na živých).
     """
-    auth_header = frappe.get_request_header("Authorization")
-    if not auth_header:
-        frappe.throw(_("Missing Authorization header"))
-
-    jwt_token = (
-        auth_header.replace("Bearer ", "")
-        .replace("Token ", "")
-        .replace("token ", "")
-        .strip()
-    )
-    clerk_user = verify_clerk_token(jwt_token)
-    if not clerk_user:
-        frappe.throw(_("Invalid Clerk token"))
-
-    clerk_id = clerk_user.get("sub") or clerk_user.get("id")
-    user_id = frappe.db.get_value("Friday User", {"clerk_id": clerk_id}, "name")
-    if not user_id:
-        frappe.throw(_("Friday User not found"))
+    user_id = get_current_user_id()
 
     data = frappe.request.get_json() or {}
     voip_token = data.get("voip_token")
     apns_token = data.get("apns_token")
+    device_id = data.get("device_id")
     device_type = data.get("device_type") or "iOS"
 
     if not voip_token and not apns_token:
         frappe.throw(_("Missing voip_token or apns_token"))
 
-    existing = frappe.db.get_value("Device", {"user": user_id}, "name")
+    tokens = tuple(t for t in (voip_token, apns_token) if t)
+    existing = frappe.db.get_value("Device", {"device_id": device_id}, "name") if device_id else None
+    if not existing:
+        matches = frappe.db.sql_list(
+            """
+            select name from `tabDevice`
+            where voip_token in %(tokens)s or apns_token in %(tokens)s
+            order by modified desc
+            limit 1
+            """,
+            {"tokens": tokens}
+        )
+        existing = matches[0] if matches else None
+
+    # token patrí zariadeniu – ak ho mal iný záznam (iný používateľ, starý záznam), zoberieme mu ho
+    for field in ("voip_token", "apns_token"):
+        frappe.db.sql(
+            f"update `tabDevice` set `{field}` = null where `{field}` in %(tokens)s and name != %(name)s",
+            {"tokens": tokens, "name": existing or ""}
+        )
+
     payload = {
         "user": user_id,
         "voip_token": voip_token,
         "apns_token": apns_token,
-        "device_type": device_type
+        "device_id": device_id,
+        "device_type": device_type,
+        "last_seen_at": now()
     }
 
     if existing:
@@ -113,17 +112,20 @@ def register_device():
         for k, v in payload.items():
             if v:
                 setattr(doc, k, v)
+        # nový token → zariadenie už nie je označené ako mŕtve
+        doc.invalid_reason = None
+        doc.invalidated_at = None
         doc.save(ignore_permissions=True)
         frappe.db.commit()
-        log_info(f"Updated device for {user_id}")
-        return {"success": True, "updated": True}
+        log_info(f"Updated device {doc.name} for {user_id}")
+        return {"success": True, "updated": True, "device": doc.name}
     else:
         payload["doctype"] = "Device"
         doc = frappe.get_doc(payload)
         doc.insert(ignore_permissions=True)
         frappe.db.commit()
-        log_info(f"Registered new device for {user_id}")
-        return {"success": True, "created": True}
+        log_info(f"Registered new device {doc.name} for {user_id}")
+        return {"success": True, "created": True, "device": doc.name}
 
 
 @frappe.whitelist(allow_guest=False)
@@ -131,27 +133,16 @@ def me():
     """
     Vráti info o prihlásenom používateľovi (podľa JWT).
     """
-    auth_header = frappe.get_request_header("Authorization")
-    if not auth_header:
-        frappe.throw(_("Missing Authorization header"))
-
-    jwt_token = (
-        auth_header.replace("Bearer ", "")
-        .replace("Token ", "")
-        .replace("token ", "")
-        .strip()
-    )
-    clerk_user = verify_clerk_token(jwt_token)
-    if not clerk_user:
-        frappe.throw(_("Invalid Clerk token"))
-
-    clerk_id = clerk_user.get("sub") or clerk_user.get("id")
-    user = frappe.db.get_value(
-        "Friday User",
-        {"clerk_id": clerk_id},
-        ["name", "email", "username", "role", "status"],
-        as_dict=True
-    )
+    ctx = get_auth_context()
+    user = None
+    if ctx.user_id:
+        user = {
+            "name": ctx.user_id,
+            "email": ctx.email,
+            "username": ctx.username,
+            "role": ctx.role,
+            "status": ctx.status
+        }
     return {"success": True, "user": user}
 
 @frappe.whitelist(allow_guest=False)
@@ -0,0 +1,159 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import frappe
+from frappe import _
+
+from .utils import verify_clerk_token
+
+# ============= AUTH CONTEXT =============
+# Jedno overenie Clerk tokenu + jedno mapovanie clerk_id → Friday User na request.
+# Výsledok je na frappe.local.friday_auth, medzi requestami v LRU (proces) a v Redise.
+# Záznam platí kým platí JWT (exp) a kým sa nezmení Friday User (generácia v Redise).
+
+DEFAULT_LRU_SIZE = 2048
+ENTRY_KEY = "friday:auth:token:"
+GEN_KEY = "friday:auth:gen:"
+
+_lru = OrderedDict()
+_lru_lock = threading.Lock()
+
+
+def get_bearer_token():
+    auth_header = frappe.get_request_header("Authorization")
+    if not auth_header:
+        return None
+    return (
+        auth_header.replace("Bearer ", "")
+        .replace("Token ", "")
+        .replace("token ", "")
+        .strip()
+    )
+
+
+def _token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _generation(clerk_id: str) -> str:
+    return frappe.cache().get_value(GEN_KEY + clerk_id) or "0"
+
+
+def _lru_get(key):
+    with _lru_lock:
+        entry = _lru.get(key)
+        if entry is not None:
+            _lru.move_to_end(key)
+        return entry
+
+
+def _lru_set(key, entry):
+    size = int(frappe.conf.get("friday_auth_cache_size") or DEFAULT_LRU_SIZE)
+    with _lru_lock:
+        _lru[key] = entry
+        _lru.move_to_end(key)
+        while len(_lru) > size:
+            _lru.popitem(last=False)
+
+
+def _is_fresh(entry) -> bool:
+    return (
+        entry is not None
+        and entry["exp"] > time.time()
+        and entry["gen"] == _generation(entry["clerk_id"])
+    )
+
+
+def _resolve(token: str):
+    token_hash = _token_hash(token)
+    lru_key = (frappe.local.site, token_hash)
+
+    entry = _lru_get(lru_key)
+    if _is_fresh(entry):
+        return entry
+
+    entry = frappe.cache().get_value(ENTRY_KEY + token_hash)
+    if _is_fresh(entry):
+        _lru_set(lru_key, entry)
+        return entry
+
+    claims = verify_clerk_token(token)
+    if not claims:
+        return None
+
+    clerk_id = claims.get("sub") or claims.get("id")
+    if not clerk_id:
+        return None
+
+    # generáciu čítame pred DB lookupom, aby súbežná invalidácia nebola prepísaná
+    gen = _generation(clerk_id)
+    user = frappe.db.get_value(
+        "Friday User",
+        {"clerk_id": clerk_id},
+        ["name", "email", "username", "role", "status"],
+        as_dict=True
+    ) or {}
+
+    # remote overenie nemusí vrátiť exp – vtedy držíme len krátko
+    exp = int(claims.get("exp") or time.time() + 60)
+    entry = {
+        "clerk_id": clerk_id,
+        "user_id": user.get("name"),
+        "email": user.get("email"),
+        "username": user.get("username"),
+        "role": user.get("role"),
+        "status": user.get("status"),
+        "claims": claims,
+        "exp": exp,
+        "gen": gen,
+    }
+    ttl = exp - int(time.time())
+    if ttl > 0:
+        frappe.cache().set_value(ENTRY_KEY + token_hash, entry, expires_in_sec=ttl)
+        _lru_set(lru_key, entry)
+    return entry
+
+
+def get_auth_context(token: str | None = None):
+    """
+    Vráti overený auth kontext aktuálneho requestu:
+    clerk_id, user_id, email, username, role, status, claims.
+    user_id je None ak Friday User ešte neexistuje (pred sync_user).
+    """
+    ctx = getattr(frappe.local, "friday_auth", None)
+    if ctx is not None and token is None:
+        return ctx
+
+    token = token or get_bearer_token()
+    if not token:
+        frappe.throw(_("Missing Authorization header"), frappe.PermissionError)
+
+    entry = _resolve(token)
+    if not entry:
+        frappe.throw(_("Invalid Clerk token"), frappe.PermissionError)
+
+    ctx = frappe._dict(entry)
+    frappe.local.friday_auth = ctx
+    return ctx
+
+
+def get_current_user_id() -> str:
+    """Friday User name prihláseného používateľa, inak PermissionError."""
+    ctx = get_auth_context()
+    if not ctx.user_id:
+        frappe.throw(_("Friday User not found"), frappe.PermissionError)
+    if ctx.status == "banned":
+        frappe.throw(_("Friday User is banned"), frappe.PermissionError)
+    return ctx.user_id
+
+
+def invalidate_auth_cache(clerk_id: str | None):
+    """Zneplatní všetky cache záznamy daného Clerk usera (vo všetkých workeroch)."""
+    if not clerk_id:
+        return
+    frappe.cache().set_value(GEN_KEY + clerk_id, frappe.generate_hash(length=10))
+    ctx = getattr(frappe.local, "friday_auth", None)
+    if ctx is not None and ctx.clerk_id == clerk_id:
+        frappe.local.friday_auth = None
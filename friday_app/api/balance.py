@@ -0,0 +1,141 @@
+import frappe
+from frappe.utils import cint, now_datetime
+
+from .utils import log_info
+
+# ============= BALANCE =============
+# Friday Balance = materializovaný súčet minút aktívnych Friday Tokenov na používateľa.
+# Mení sa v tej istej DB transakcii ako tokeny:
+#  - cez ORM (insert / save / delete) to robí FridayToken controller,
+#  - priame SQL zápisy (odpočet minút, hromadné vydanie, obchod) volajú apply_balance_delta samé.
+# balance() a kontrola "má minúty?" v start_call sú potom jedno čítanie podľa primárneho kľúča.
+
+
+def token_contribution(status, minutes_remaining) -> tuple:
+    """Koľko minút a tokenov prispieva token do zostatku (len aktívne tokeny)."""
+    if status == "active":
+        return cint(minutes_remaining), 1
+    return 0, 0
+
+
+def apply_balance_delta(user: str, minutes_delta: int = 0, tokens_delta: int = 0):
+    """Pripočíta zmenu k zostatku používateľa (upsert, bez commitu)."""
+    apply_balance_deltas({user: (minutes_delta, tokens_delta)})
+
+
+def apply_balance_deltas(deltas: dict):
+    """deltas = {user: (minúty, tokeny)} → jeden viacriadkový upsert (bez commitu)."""
+    deltas = {
+        user: (cint(minutes), cint(tokens)) for user, (minutes, tokens) in deltas.items()
+        if user and (cint(minutes) or cint(tokens))
+    }
+    if not deltas:
+        return
+    now = now_datetime()
+    values, params = [], []
+    # pevné poradie = rovnaké poradie zámkov vo všetkých transakciách
+    for user in sorted(deltas):
+        values.append("(%s, %s, %s, %s, %s, %s, %s, 'Administrator', 'Administrator')")
+        params += [user, user, *deltas[user], now, now, now]
+    frappe.db.sql(
+        f"""
+        insert into `tabFriday Balance`
+            (name, user, total_minutes, active_tokens, updated_at, creation, modified, owner, modified_by)
+        values {", ".join(values)}
+        on duplicate key update
+            total_minutes = total_minutes + values(total_minutes),
+            active_tokens = active_tokens + values(active_tokens),
+            updated_at = values(updated_at),
+            modified = values(modified)
+        """,
+        params,
+    )
+
+
+def get_balance(user: str) -> dict:
+    """
+    Zostatok používateľa jedným čítaním, bez zápisov. Chýbajúci riadok = nič.
+    Zostatky existujúcich používateľov založil patch backfill_friday_balance.
+    """
+    row = frappe.db.get_value("Friday Balance", user, ["total_minutes", "active_tokens"], as_dict=True)
+    return {
+        "total_minutes": cint(row.total_minutes) if row else 0,
+        "active_tokens": cint(row.active_tokens) if row else 0,
+    }
+
+
+def has_minutes(user: str) -> bool:
+    return get_balance(user)["total_minutes"] > 0
+
+
+def _computed_balances(user: str | None = None) -> dict:
+    condition = "and owner_user = %(user)s" if user else ""
+    rows = frappe.db.sql(
+        f"""
+        select owner_user, sum(minutes_remaining) as total_minutes, count(*) as active_tokens
+        from `tabFriday Token`
+        where status = 'active' and ifnull(owner_user, '') != '' {condition}
+        group by owner_user
+        """,
+        {"user": user},
+        as_dict=True,
+    )
+    return {r.owner_user: (cint(r.total_minutes), cint(r.active_tokens)) for r in rows}
+
+
+def _stored_balances(user: str | None = None) -> dict:
+    filters = {"user": user} if user else {}
+    rows = frappe.get_all("Friday Balance", filters=filters, fields=["user", "total_minutes", "active_tokens"])
+    return {r.user: (cint(r.total_minutes), cint(r.active_tokens)) for r in rows}
+
+
+def verify_balances(user: str | None = None) -> list:
+    """Porovná uložené zostatky s prepočtom z tokenov. Vráti zoznam nezhôd."""
+    computed = _computed_balances(user)
+    stored = _stored_balances(user)
+    mismatches = []
+    for u in set(computed) | set(stored):
+        expected = computed.get(u, (0, 0))
+        actual = stored.get(u, (0, 0))
+        if expected != actual:
+            mismatches.append({"user": u, "expected": expected, "stored": actual})
+    return mismatches
+
+
+def rebuild_balances(user: str | None = None) -> int:
+    """
+    Prepočíta zostatky z Friday Token (jeden používateľ alebo všetci).
+    Zamkne tokeny daného rozsahu, aby sa neprekrýval so súbežným odpočtom.
+    """
+    condition = "and owner_user = %(user)s" if user else ""
+    frappe.db.sql(
+        f"select name from `tabFriday Token` where status = 'active' {condition} for update",
+        {"user": user},
+    )
+    computed = _computed_balances(user)
+    stored = _stored_balances(user)
+    if user and user not in computed:
+        computed[user] = (0, 0)
+
+    now = now_datetime()
+    fixed = 0
+    for u in set(computed) | set(stored):
+        minutes, tokens = computed.get(u, (0, 0))
+        if stored.get(u) == (minutes, tokens):
+            continue
+        frappe.db.sql(
+            """
+            insert into `tabFriday Balance`
+                (name, user, total_minutes, active_tokens, updated_at, creation, modified, owner, modified_by)
+            values
+                (%(user)s, %(user)s, %(minutes)s, %(tokens)s, %(now)s, %(now)s, %(now)s, 'Administrator', 'Administrator')
+            on duplicate key update
+                total_minutes = %(minutes)s, active_tokens = %(tokens)s, updated_at = %(now)s, modified = %(now)s
+            """,
+            {"user": u, "minutes": minutes, "tokens": tokens, "now": now},
+        )
+        fixed += 1
+
+    if fixed:
+        log_info(f"Rebuilt {fixed} Friday Balance row(s)")
+    return fixed
@@ -0,0 +1,102 @@
+from datetime import datetime
+
+import frappe
+from frappe.utils import add_to_date, cint, now_datetime
+
+from .presence import release_busy
+from .push_queue import enqueue_cancel_push
+from .rollups import enqueue_rollup
+from .utils import log_info, now_iso
+
+# ============= CALL STATE =============
+# Stavy hovoru:  ringing → accepted → ended
+#                ringing → declined | missed | failed
+# Každý prechod ide cez zamknuté čítanie Call Log a jeden zápis (friday.lock_call_log)
+# a po commite sa zverejní cez frappe.publish_realtime. Klienti sa nepýtajú na stav,
+# ale počúvajú event CALL_STATE_EVENT v miestnosti hovoru.
+# Miestnosť je task_progress room s náhodným kľúčom (signal_room na Call Log) – socket.io
+# ju pripojí bez Frappe session, takže ju pozná len ten, kto kľúč dostal:
+# volajúci v odpovedi start_call, poradca v pushi.
+# site_config.json:
+#   friday_ring_timeout – po koľkých sekundách nezdvihnutý hovor prepadne na missed (default 45)
+
+CALL_STATE_EVENT = "friday_call_state"
+DEFAULT_RING_TIMEOUT = 45
+EXPIRE_CHUNK = 500
+
+TRANSITIONS = {
+    "ringing": ("accepted", "declined", "missed", "failed"),
+    "accepted": ("ended",),
+    # hovory z čias pred stavovým automatom
+    "started": ("ended",),
+}
+FINAL_STATUSES = ("ended", "declined", "missed", "failed")
+
+
+def can_transition(current: str, target: str) -> bool:
+    return target in TRANSITIONS.get(current, ())
+
+
+def new_signal_room() -> str:
+    return frappe.generate_hash(length=32)
+
+
+def ring_timeout() -> int:
+    return cint(frappe.conf.get("friday_ring_timeout")) or DEFAULT_RING_TIMEOUT
+
+
+def publish_call_state(call_id: str, signal_room: str | None, status: str, **extra):
+    """Zverejní prechod po commite – zrušená transakcia nič nepošle."""
+    if not signal_room:
+        return
+    frappe.publish_realtime(
+        CALL_STATE_EVENT,
+        {"call_id": call_id, "status": status, "at": now_iso(), **extra},
+        task_id=signal_room,
+        after_commit=True,
+    )
+
+
+def expire_ringing_calls() -> int:
+    """
+    Scheduler (každú minútu): nezdvihnuté hovory po ring timeoute → missed.
+    """
+    # started_at je UTC (now_iso)
+    cutoff = add_to_date(datetime.utcnow(), seconds=-ring_timeout())
+    rows = frappe.db.sql(
+        """
+        select name, advisor, signal_room
+        from `tabCall Log`
+        where status = 'ringing' and started_at < %(cutoff)s
+        order by started_at
+        limit %(chunk)s
+        for update skip locked
+        """,
+        {"cutoff": cutoff, "chunk": EXPIRE_CHUNK},
+        as_dict=True,
+    )
+    if not rows:
+        return 0
+
+    frappe.db.sql(
+        """
+        update `tabCall Log`
+        set status = 'missed', ended_at = %(ended_at)s, modified = %(now)s
+        where name in %(names)s
+        """,
+        {"names": tuple(r.name for r in rows), "ended_at": now_iso(), "now": now_datetime()},
+    )
+    for row in rows:
+        publish_call_state(row.name, row.signal_room, "missed")
+        enqueue_cancel_push(row.name, row.advisor, reason="missed")
+    enqueue_rollup()
+    frappe.db.commit()
+    # metering importuje call_state – import až tu
+    from .metering import unregister_calls
+
+    unregister_calls([row.name for row in rows])
+    for advisor in {row.advisor for row in rows}:
+        release_busy(advisor)
+
+    log_info(f"{len(rows)} unanswered call(s) marked as missed")
+    return len(rows)
@@ -0,0 +1,160 @@
+import json
+import threading
+import time
+
+import frappe
+import jwt
+
+from .metrics import timed
+from .settings import get_settings
+
+# ============= CLERK JWKS =============
+# Lokálne overenie Clerk session tokenov (RS256) bez volania Clerk API.
+# site_config.json (číta sa cez settings.get_settings):
+#   clerk_issuer               – napr. https://notable-sawfly-17.clerk.accounts.dev
+#   clerk_jwks_url             – default {clerk_issuer}/.well-known/jwks.json (podporuje aj file://)
+#   clerk_authorized_parties   – zoznam povolených "azp" (origin frontendu), voliteľné
+#   clerk_jwks_ttl             – ako dlho držíme JWKS v cache (sekundy)
+
+DEFAULT_JWKS_TTL = 3600
+# najmenší odstup medzi vynútenými refreshmi kvôli neznámemu kid
+JWKS_REFRESH_COOLDOWN = 30
+CLOCK_LEEWAY = 5
+REDIS_KEY = "friday:clerk:jwks"
+
+# site -> {"keys": {kid: key}, "expires_at": ts, "forced_at": ts}
+_jwks_cache = {}
+_jwks_lock = threading.Lock()
+
+
+class JWKSUnavailable(Exception):
+    """JWKS sa nepodarilo načítať a nemáme ani nič v cache."""
+
+
+def get_issuer() -> str:
+    return get_settings().clerk.issuer
+
+
+def get_jwks_url() -> str:
+    return get_settings().clerk.jwks_url or f"{get_issuer()}/.well-known/jwks.json"
+
+
+def _jwks_ttl() -> int:
+    return get_settings().clerk.jwks_ttl or DEFAULT_JWKS_TTL
+
+
+def _fetch_jwks() -> dict:
+    """Stiahne JWKS od Clerka (alebo načíta zo súboru pri file:// URL)."""
+    url = get_jwks_url()
+    if url.startswith("file://"):
+        with open(url[len("file://"):]) as f:
+            return json.load(f)
+
+    import requests
+    with timed("clerk", "jwks"):
+        res = requests.get(url, timeout=get_settings().clerk.timeout)
+        res.raise_for_status()
+    return res.json()
+
+
+def _parse_jwks(jwks: dict) -> dict:
+    keys = {}
+    for jwk in jwks.get("keys") or []:
+        if jwk.get("kty") != "RSA" or not jwk.get("kid"):
+            continue
+        if jwk.get("use") not in (None, "sig"):
+            continue
+        try:
+            keys[jwk["kid"]] = jwt.PyJWK(jwk, algorithm="RS256").key
+        except (jwt.PyJWKError, jwt.InvalidKeyError):
+            continue
+    return keys
+
+
+def _load_keys(force: bool = False) -> dict:
+    """
+    Vráti {kid: public_key}. Poradie: pamäť procesu → Redis → HTTP.
+    force=True preskočí obe cache (neznámy kid = Clerk rotoval kľúče).
+    """
+    site = frappe.local.site
+    now = time.time()
+    entry = _jwks_cache.get(site)
+    if not force and entry and entry["expires_at"] > now:
+        return entry["keys"]
+
+    with _jwks_lock:
+        entry = _jwks_cache.get(site)
+        if not force and entry and entry["expires_at"] > now:
+            return entry["keys"]
+        if force and entry and now - entry["forced_at"] < JWKS_REFRESH_COOLDOWN:
+            return entry["keys"]
+
+        ttl = _jwks_ttl()
+        jwks = None if force else frappe.cache().get_value(REDIS_KEY)
+        if not jwks:
+            try:
+                jwks = _fetch_jwks()
+            except Exception as e:
+                if entry:
+                    # radšej staré kľúče ako žiadne
+                    frappe.logger().warning(f"[FRIDAY] Clerk JWKS refresh failed: {e}")
+                    return entry["keys"]
+                raise JWKSUnavailable(str(e))
+            frappe.cache().set_value(REDIS_KEY, jwks, expires_in_sec=ttl)
+
+        keys = _parse_jwks(jwks)
+        _jwks_cache[site] = {"keys": keys, "expires_at": now + ttl, "forced_at": now if force else 0}
+        return keys
+
+
+def _get_signing_key(kid: str | None):
+    if not kid:
+        return None
+    keys = _load_keys()
+    if kid not in keys:
+        keys = _load_keys(force=True)
+    return keys.get(kid)
+
+
+def clear_jwks_cache():
+    _jwks_cache.pop(frappe.local.site, None)
+    frappe.cache().delete_value(REDIS_KEY)
+
+
+def verify_clerk_jwt(token: str):
+    """
+    Overí podpis (RS256) a claimy exp/nbf/iss/azp lokálne.
+    Vráti claimy ako dict alebo None ak token nie je validný.
+    Vyhodí JWKSUnavailable ak nemáme kľúče – volajúci môže použiť Clerk API.
+    """
+    try:
+        header = jwt.get_unverified_header(token)
+    except jwt.InvalidTokenError:
+        return None
+
+    if header.get("alg") != "RS256":
+        return None
+
+    key = _get_signing_key(header.get("kid"))
+    if key is None:
+        return None
+
+    try:
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=["RS256"],
+            issuer=get_issuer(),
+            leeway=CLOCK_LEEWAY,
+            options={"require": ["exp", "iat", "sub"], "verify_aud": False},
+        )
+    except jwt.InvalidTokenError as e:
+        frappe.logger().info(f"[FRIDAY] Clerk JWT rejected: {e}")
+        return None
+
+    parties = get_settings().clerk.authorized_parties
+    if parties and claims.get("azp") and claims["azp"] not in parties:
+        frappe.logger().info(f"[FRIDAY] Clerk JWT rejected: azp {claims['azp']} not allowed")
+        return None
+
+    return claims
@@ -0,0 +1,114 @@
+import frappe
+from frappe.utils import add_days, cint, now_datetime
+
+from .utils import log_error, log_info
+
+# ============= DEAD DEVICE TOKENS =============
+# APNs odpovie 410 Unregistered / 400 BadDeviceToken na tokeny, ktoré už nikdy nebudú fungovať.
+# Taký token z Device hneď vymažeme (a zapíšeme prečo a kedy), aby ďalšie hovory
+# neplatili zbytočný push a netvorili Error Log. Zariadenia bez tokenov maže denný job.
+# 400 DeviceTokenNotForTopic znamená zlý apns_bundle_id / push type, nie mŕtvy token –
+# token ostáva a hlásime chybu konfigurácie (inak by jedno zlé nastavenie zmazalo všetky tokeny).
+
+DEAD_TOKEN_REASONS = ("BadDeviceToken", "Unregistered")
+CONFIG_ERROR_REASONS = ("DeviceTokenNotForTopic",)
+TOKEN_FIELDS = ("voip_token", "apns_token")
+DEAD_DEVICE_RETENTION_DAYS = 30
+# hovor zvoní na zariadeniach, ktoré sa ozvali (register_device) za posledných N dní
+DEFAULT_LIVE_DAYS = 30
+MAX_RING_DEVICES = 10
+
+
+def live_device_tokens(user: str) -> list:
+    """
+    [(token, druh)] živých zariadení používateľa na zvonenie, najčerstvejšie prvé.
+    Druh "voip" (PushKit, topic <bundle>.voip) má prednosť pred "apns" (topic <bundle>) –
+    podľa neho push_queue volí push type, inak APNs vráti DeviceTokenNotForTopic.
+    Jeden dotaz po indexe (user, last_seen_at).
+    """
+    cutoff = add_days(now_datetime(), -(cint(frappe.conf.get("friday_device_live_days")) or DEFAULT_LIVE_DAYS))
+    rows = frappe.db.sql(
+        """
+        select
+            if(ifnull(voip_token, '') != '', voip_token, apns_token),
+            if(ifnull(voip_token, '') != '', 'voip', 'apns')
+        from `tabDevice`
+        where user = %(user)s
+            and (ifnull(voip_token, '') != '' or ifnull(apns_token, '') != '')
+            and (last_seen_at >= %(cutoff)s or last_seen_at is null)
+        order by last_seen_at desc
+        limit %(limit)s
+        """,
+        {"user": user, "cutoff": cutoff, "limit": MAX_RING_DEVICES},
+    )
+    return [(token, kind) for token, kind in rows]
+
+
+def is_dead_token(result: dict) -> bool:
+    """True ak APNs povedal, že token je mŕtvy natrvalo."""
+    status = result.get("status")
+    return status == 410 or (status == 400 and result.get("reason") in DEAD_TOKEN_REASONS)
+
+
+def is_config_error(result: dict) -> bool:
+    """True ak APNs odmietol push kvôli našej konfigurácii (topic / push type), nie kvôli tokenu."""
+    return result.get("status") == 400 and result.get("reason") in CONFIG_ERROR_REASONS
+
+
+def log_config_errors(results: list, headers: dict) -> int:
+    """Jeden Error Log na dávku pushov odmietnutých kvôli konfigurácii; tokeny nemaže."""
+    rejected = [r for r in results if is_config_error(r)]
+    if rejected:
+        log_error(
+            f"{len(rejected)} APNs push(es) rejected with {rejected[0]['reason']} "
+            f"(apns-topic {headers.get('apns-topic')}, apns-push-type {headers.get('apns-push-type')}) – "
+            "check apns_bundle_id",
+            "APNs Config Error",
+        )
+    return len(rejected)
+
+
+def invalidate_device_tokens(dead_tokens: dict) -> int:
+    """
+    dead_tokens = {device_token: reason}
+    Vymaže tokeny zo všetkých Device záznamov – jeden UPDATE na stĺpec a dôvod.
+    """
+    if not dead_tokens:
+        return 0
+
+    by_reason = {}
+    for token, reason in dead_tokens.items():
+        by_reason.setdefault(reason or "Unregistered", []).append(token)
+
+    now = now_datetime()
+    for field in TOKEN_FIELDS:
+        for reason, tokens in by_reason.items():
+            frappe.db.sql(
+                f"""
+                update `tabDevice`
+                set `{field}` = null, invalid_reason = %(reason)s, invalidated_at = %(now)s, modified = %(now)s
+                where `{field}` in %(tokens)s
+                """,
+                {"reason": reason, "now": now, "tokens": tuple(tokens)},
+            )
+
+    log_info(f"Invalidated {len(dead_tokens)} dead APNs token(s)")
+    return len(dead_tokens)
+
+
+def cleanup_dead_devices():
+    """
+    Denný job: zmaže zariadenia, ktorým po invalidácii neostal žiadny token
+    a používateľ sa odvtedy znovu nezaregistroval.
+    """
+    cutoff = add_days(now_datetime(), -DEAD_DEVICE_RETENTION_DAYS)
+    frappe.db.sql(
+        """
+        delete from `tabDevice`
+        where ifnull(voip_token, '') = ''
+            and ifnull(apns_token, '') = ''
+            and invalidated_at < %s
+        """,
+        cutoff,
+    )
+    frappe.db.commit()
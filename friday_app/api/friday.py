@@ -1,177 +1,381 @@
+import time
+from datetime import datetime
+
 import frappe
 from frappe import _
-from frappe.utils import now
+from frappe.utils import add_to_date, cint, now
 from .utils import (
     log_info,
     log_error,
     now_iso,
-    send_apns_notification,
-    deduct_minutes_from_user,
-    verify_clerk_token,
 )
+from .auth_context import get_auth_context, get_current_user_id
+from .device_tokens import live_device_tokens
+from .push_queue import enqueue_call_push, enqueue_cancel_push
+from .balance import get_balance, has_minutes
+from . import metering, presence, rollups
+from .call_state import FINAL_STATUSES, can_transition, new_signal_room, publish_call_state, ring_timeout
 
 
-# =============== HELPERS ===============
-
-def _get_current_user_id_from_clerk():
-    auth_header = frappe.get_request_header("Authorization")
-    if not auth_header:
-        frappe.throw("Missing Authorization header", frappe.PermissionError)
+# =============== ADMIN ===============
 
-    jwt_token = (
-        auth_header.replace("Bearer ", "")
-        .replace("Token ", "")
-        .replace("token ", "")
-        .strip()
-    )
-    clerk_user = verify_clerk_token(jwt_token)
-    if not clerk_user:
-        frappe.throw("Invalid Clerk token", frappe.PermissionError)
+ADMIN_CLIENTS_DEFAULT_LIMIT = 100
+ADMIN_CLIENTS_MAX_LIMIT = 500
+ADMIN_CLIENT_FIELDS = ("username", "email", "devices", "tokens", "totalActiveMinutes", "deviceCount")
 
-    clerk_id = clerk_user.get("sub") or clerk_user.get("id")
-    user_id = frappe.db.get_value("Friday User", {"clerk_id": clerk_id}, "name")
-    if not user_id:
-        frappe.throw("Friday User not found", frappe.PermissionError)
-    return user_id
 
+def _parse_fields(fields) -> set:
+    if not fields:
+        return set(ADMIN_CLIENT_FIELDS)
+    if isinstance(fields, str):
+        fields = frappe.parse_json(fields) if fields.startswith("[") else fields.split(",")
+    return {f.strip() for f in fields if f.strip() in ADMIN_CLIENT_FIELDS}
 
-# =============== ADMIN ===============
 
 @frappe.whitelist(allow_guest=True)
-def admin_clients():
+def admin_clients(after=None, limit=None, fields=None):
     """
     Admin → potrebuje vidieť klientov + ich zariadenia + minúty.
+    - keyset stránkovanie: after = id posledného klienta z predošlej stránky, limit
+    - fields: ktoré časti vrátiť (username, email, devices, tokens, totalActiveMinutes, deviceCount)
+    Zariadenia a tokeny sa načítajú jedným IN dotazom pre celú stránku, nie pre každého klienta.
     """
     # TEMP: vypneme admin check pre test
-    # user_id = _get_current_user_id_from_clerk()
+    # user_id = get_current_user_id()
     # role = frappe.db.get_value("Friday User", user_id, "role")
     # if role != "admin":
     #     frappe.throw("Access denied: admin only", frappe.PermissionError)
 
+    limit = min(cint(limit) or ADMIN_CLIENTS_DEFAULT_LIMIT, ADMIN_CLIENTS_MAX_LIMIT)
+    fields = _parse_fields(fields)
+
+    filters = {"role": "client", "status": "active"}
+    if after:
+        filters["name"] = [">", after]
+
     users = frappe.get_all(
         "Friday User",
-        filters={"role": "client", "status": "active"},
-        fields=["name as id", "username", "email", "status", "role"]
+        filters=filters,
+        fields=["name as id", "username", "email"],
+        order_by="name asc",
+        limit_page_length=limit + 1
     )
+    has_more = len(users) > limit
+    users = users[:limit]
+    user_ids = [u["id"] for u in users]
 
-    out = []
-    for u in users:
-        devices = frappe.get_all(
+    devices_by_user = {uid: [] for uid in user_ids}
+    if user_ids and fields & {"devices", "deviceCount"}:
+        for d in frappe.get_all(
             "Device",
-            filters={"user": u["id"]},
-            fields=["voip_token as voipToken", "apns_token as apnsToken", "modified as updatedAt"]
-        )
-        tokens = frappe.get_all(
+            filters={"user": ["in", user_ids]},
+            fields=["user", "voip_token as voipToken", "apns_token as apnsToken", "modified as updatedAt"],
+            order_by="modified desc"
+        ):
+            devices_by_user[d.pop("user")].append(d)
+
+    tokens_by_user = {uid: [] for uid in user_ids}
+    if user_ids and fields & {"tokens", "totalActiveMinutes"}:
+        for t in frappe.get_all(
             "Friday Token",
-            filters={"owner_user": u["id"], "status": ["in", ["active", "listed"]]},
-            fields=["minutes_remaining as minutesRemaining", "status"]
-        )
-        out.append({
-            "id": u["id"],
-            "username": u.get("username") or u.get("email"),
-            "devices": devices,
-            "tokens": tokens
-        })
+            filters={"owner_user": ["in", user_ids], "status": ["in", ["active", "listed"]]},
+            fields=["owner_user", "minutes_remaining as minutesRemaining", "status"],
+            order_by="created_at asc"
+        ):
+            tokens_by_user[t.pop("owner_user")].append(t)
+
+    out = []
+    for u in users:
+        uid = u["id"]
+        row = {"id": uid}
+        if "username" in fields:
+            row["username"] = u.get("username") or u.get("email")
+        if "email" in fields:
+            row["email"] = u.get("email")
+        if "devices" in fields:
+            row["devices"] = devices_by_user[uid]
+        if "deviceCount" in fields:
+            row["deviceCount"] = len(devices_by_user[uid])
+        if "tokens" in fields:
+            row["tokens"] = tokens_by_user[uid]
+        if "totalActiveMinutes" in fields:
+            row["totalActiveMinutes"] = sum(
+                cint(t["minutesRemaining"]) for t in tokens_by_user[uid] if t["status"] == "active"
+            )
+        out.append(row)
 
-    return {"success": True, "clients": out}
+    return {
+        "success": True,
+        "clients": out,
+        "next": user_ids[-1] if has_more else None
+    }
 
 # =============== CALLS ===============
 
+def _advisor_in_call(advisor) -> bool:
+    """
+    Zamkne riadok poradcu (súbežné start_call na toho istého poradcu sa zoradia)
+    a zistí, či už nemá zvoniaci alebo prijatý hovor. Presence to nestihne –
+    busy sa zapíše až po commite prvého hovoru.
+    """
+    frappe.db.sql("select name from `tabFriday User` where name = %s for update", advisor)
+    # started_at je UTC (now_iso); zvonenie po ring timeoute už neblokuje
+    cutoff = add_to_date(datetime.utcnow(), seconds=-ring_timeout())
+    return bool(frappe.db.sql(
+        """
+        select name
+        from `tabCall Log`
+        where advisor = %(advisor)s
+            and (status = 'accepted' or (status = 'ringing' and started_at >= %(cutoff)s))
+        limit 1
+        """,
+        {"advisor": advisor, "cutoff": cutoff}
+    ))
+
+
 @frappe.whitelist(allow_guest=False, methods=["POST"])
 def start_call():
     """
     Spustí hovor: caller → callee.
-    - nájde device callee
-    - pošle mu APNs
-    - vytvorí Call Log
+    - poradca offline / obsadený → hneď chyba, bez DB a pushu (presence v Redise)
+    - nájde všetky živé zariadenia callee
+    - vytvorí Call Log v stave ringing
+    - zaradí APNs push na všetky zariadenia naraz do fronty (neposiela ho v requeste)
+    Volajúci dostane signal room – zmeny stavu (accepted/declined/missed/ended) mu prídu cez realtime.
     """
-    caller = _get_current_user_id_from_clerk()
+    caller = get_current_user_id()
     data = frappe.request.get_json() or {}
     callee = data.get("advisorId") or data.get("advisor_id") or data.get("callee_id")
-    caller_name = data.get("caller_name") or frappe.db.get_value("Friday User", caller, "username") or "Volajúci"
+    caller_name = data.get("caller_name") or get_auth_context().username or "Volajúci"
 
     if not callee:
         frappe.throw("Missing callee_id")
 
-    device = frappe.db.get_value(
-        "Device",
-        {"user": callee},
-        ["voip_token", "apns_token"],
-        as_dict=True
-    )
-    if not device or not (device.voip_token or device.apns_token):
+    available, status = presence.is_available(callee)
+    if not available:
+        return {
+            "success": False,
+            "error": "Advisor is busy" if status == "busy" else "Advisor is offline",
+            "presence": status
+        }
+
+    if not has_minutes(caller):
+        return {
+            "success": False,
+            "error": "No minutes left"
+        }
+
+    device_tokens = live_device_tokens(callee)
+    if not device_tokens:
         return {
             "success": False,
             "error": "User has no device token"
         }
 
+    if _advisor_in_call(callee):
+        return {
+            "success": False,
+            "error": "Advisor is busy",
+            "presence": "busy"
+        }
+
     # vytvor call log
     call_id = frappe.generate_hash(length=12)
+    signal_room = new_signal_room()
     doc = frappe.get_doc({
         "doctype": "Call Log",
         "caller": caller,
         "advisor": callee,
         "call_id": call_id,
-        "status": "started",
-        "started_at": now_iso()
+        "status": "ringing",
+        "started_at": now_iso(),
+        "push_status": "queued",
+        "signal_room": signal_room
     })
     doc.insert(ignore_permissions=True)
-    frappe.db.commit()
 
-    # pošli push
-    send_apns_notification(
-        device_token=device.voip_token or device.apns_token,
+    # push ide cez frontu až po commite – odpoveď nečaká na Apple
+    enqueue_call_push(
+        call_log=call_id,
+        device_tokens=device_tokens,
         title="Prichádzajúci hovor",
         body=f"Volá ti {caller_name}",
-        extra={"call_id": call_id, "caller_id": caller}
+        # VoIP push nemá alert – meno volajúceho ide v payloade pre CallKit
+        extra={
+            "call_id": call_id,
+            "caller_id": caller,
+            "caller_name": caller_name,
+            "signal_room": signal_room
+        }
     )
+    frappe.db.commit()
+    # heartbeat počas zvonenia číta stav z Redisu, nie z Call Log
+    metering.register_ringing(call_id, caller, callee)
+    # poradca je obsadený už počas zvonenia – ďalší start_call ho odmietne bez DB
+    presence.set_presence(callee, "busy", call_id)
 
     log_info(f"Call {call_id} from {caller} → {callee}")
-    return {"success": True, "callId": call_id}
+    return {"success": True, "callId": call_id, "signalRoom": signal_room}
+
+
+def lock_call_log(call_id, fields=("name", "caller", "advisor", "status")):
+    """
+    Načíta Call Log podľa call_id (= name) a zamkne riadok do konca transakcie.
+    Každý prechod stavu hovoru ide cez toto čítanie a potom jeden zápis.
+    """
+    rows = frappe.db.sql(
+        f"""
+        select {", ".join(f"`{f}`" for f in fields)}
+        from `tabCall Log`
+        where name = %s
+        for update
+        """,
+        call_id,
+        as_dict=True
+    )
+    return rows[0] if rows else None
+
+
+def _answer_call(call_id, status, device_token=None):
+    """
+    Prechod ringing → accepted / declined. Smie ho urobiť len poradca.
+    Opakované volanie s rovnakým výsledkom je OK (klient mohol request zopakovať).
+    Vyhráva prvé zariadenie – ostatné dostanú cancel push.
+    """
+    user_id = get_current_user_id()
+    if not call_id:
+        frappe.throw("Missing call_id")
+
+    call = lock_call_log(call_id, ("name", "caller", "advisor", "status", "signal_room"))
+    if not call or call.advisor != user_id:
+        return {"success": False, "error": "Call not found"}
+
+    if call.status == status:
+        return {"success": True, "status": status, "already": True}
+    if not can_transition(call.status, status):
+        return {"success": False, "error": f"Call is {call.status}", "status": call.status}
+
+    values = {"name": call.name, "status": status, "at": now_iso(), "now": now()}
+    frappe.db.sql(
+        f"""
+        update `tabCall Log`
+        set status = %(status)s, {"answered_at" if status == "accepted" else "ended_at"} = %(at)s,
+            modified = %(now)s
+        where name = %(name)s
+        """,
+        values
+    )
+    publish_call_state(call.name, call.signal_room, status)
+    enqueue_cancel_push(call.name, call.advisor, except_token=device_token, reason=status)
+    if status == "declined":
+        rollups.enqueue_rollup()
+    frappe.db.commit()
+
+    if status == "accepted":
+        # od zdvihnutia meria dĺžku hovoru server (heartbeaty v Redise, flush_call_meters)
+        metering.register_call(call.name, call.caller, call.advisor)
+        presence.set_presence(call.advisor, "busy", call.name)
+    else:
+        metering.unregister_call(call.name)
+        presence.release_busy(call.advisor)
+
+    log_info(f"Call {call.name} {status}")
+    return {"success": True, "status": status}
+
+
+@frappe.whitelist(allow_guest=False, methods=["POST"])
+def accept_call():
+    """Poradca zdvihol hovor (device_token = zariadenie, ktoré zdvihlo)."""
+    data = frappe.request.get_json() or {}
+    return _answer_call(data.get("call_id"), "accepted", data.get("device_token"))
+
+
+@frappe.whitelist(allow_guest=False, methods=["POST"])
+def decline_call():
+    """Poradca hovor odmietol."""
+    data = frappe.request.get_json() or {}
+    return _answer_call(data.get("call_id"), "declined", data.get("device_token"))
 
 
 @frappe.whitelist(allow_guest=False, methods=["POST"])
 def end_call():
     """
     Klient alebo admin ukončí hovor.
-    - označí Call Log ako ended
-    - odpočíta minúty
+    - zamkne Call Log (podľa call_id)
+    - ešte nezdvihnutý hovor (ringing) → missed, nič sa neúčtuje
+    - inak dofakturuje minúty, ktoré ešte nestihol flush_call_meters (dĺžka podľa servera,
+      nie podľa klienta – "duration" z requestu sa ignoruje)
+    - zapíše koniec hovoru jedným UPDATE a zverejní ho v signal room
+    Opakované ukončenie už neodpočítava.
     """
-    user_id = _get_current_user_id_from_clerk()
+    user_id = get_current_user_id()
+    ctx = get_auth_context()
     data = frappe.request.get_json() or {}
     call_id = data.get("call_id")
-    duration = int(data.get("duration") or 1)
 
     if not call_id:
         frappe.throw("Missing call_id")
 
-    if frappe.db.exists("Call Log", call_id):
-        frappe.db.set_value("Call Log", call_id, {
-            "ended_at": now_iso(),
-            "status": "ended",
-            "duration": duration
-        })
-        # odpočítaj minúty volajúcemu
-        used_token = deduct_minutes_from_user(user_id, minutes=duration)
-        if used_token:
-            frappe.db.set_value("Call Log", call_id, "used_token", used_token)
-        frappe.db.commit()
-        log_info(f"Call {call_id} ended, duration {duration}")
-        return {"success": True, "duration": duration}
-    else:
+    rows = metering.lock_calls([call_id])
+    call = rows[0] if rows else None
+    if not call or (user_id not in (call.caller, call.advisor) and ctx.role != "admin"):
         return {"success": False, "error": "Call not found"}
 
+    if call.status in FINAL_STATUSES:
+        return {"success": True, "duration": cint(call.duration), "already_ended": True, "status": call.status}
+
+    ended = time.time()
+    if call.status == "ringing":
+        metering.write_calls({call.name: {"status": "missed", "ended_at": metering.utc_datetime(ended)}})
+        publish_call_state(call.name, call.signal_room, "missed")
+        enqueue_cancel_push(call.name, call.advisor, reason="missed")
+        rollups.enqueue_rollup()
+        frappe.db.commit()
+        metering.unregister_call(call.name)
+        presence.release_busy(call.advisor)
+        log_info(f"Call {call_id} cancelled while ringing")
+        return {"success": True, "status": "missed", "duration": 0, "billed_minutes": 0, "deducted": 0, "missing": 0}
+
+    billed = metering.bill_call(call, ended)
+    metering.write_calls({
+        call.name: {
+            "status": "ended",
+            "ended_at": metering.utc_datetime(ended),
+            **{k: billed[k] for k in ("duration", "billed_minutes", "used_token", "token_usage")},
+        }
+    })
+    publish_call_state(call.name, call.signal_room, "ended")
+    rollups.enqueue_rollup()
+    frappe.db.commit()
+    metering.unregister_call(call.name)
+    presence.release_busy(call.advisor)
+
+    log_info(f"Call {call_id} ended, duration {billed['duration']}s, billed {billed['billed_minutes']} min")
+    return {
+        "success": True,
+        "status": "ended",
+        "duration": billed["duration"],
+        "billed_minutes": billed["billed_minutes"],
+        "deducted": billed["deducted"],
+        "missing": billed["missing"]
+    }
+
 
 # =============== USER BALANCE ===============
 
 @frappe.whitelist(allow_guest=False)
-def balance(user_id=None):
+def balance(user_id=None, with_tokens=1):
+    """
+    Zostatok z Friday Balance – jedno čítanie podľa primárneho kľúča.
+    Zoznam tokenov ostáva v odpovedi (starší klienti ho čítajú), with_tokens=0 ho vynechá.
+    """
     if not user_id:
-        user_id = _get_current_user_id_from_clerk()
-    tokens = frappe.get_all(
-        "Friday Token",
-        filters={"owner_user": user_id, "status": "active"},
-        fields=["name", "minutes_remaining", "issued_year"]
-    )
-    total = sum([t.minutes_remaining for t in tokens]) if tokens else 0
-    return {"success": True, "total_minutes": total, "tokens": tokens}
+        user_id = get_current_user_id()
+    result = {"success": True, **get_balance(user_id)}
+    if cint(with_tokens):
+        result["tokens"] = frappe.get_all(
+            "Friday Token",
+            filters={"owner_user": user_id, "status": "active"},
+            fields=["name", "minutes_remaining", "issued_year"]
+        )
+    return result
@@ -0,0 +1,45 @@
+import frappe
+
+from .utils import log_info
+
+# ============= INDEXES =============
+# Zložené indexy pre horúce dotazy. Jednoduché indexy sú v doctype JSON (search_index),
+# zložené tam zapísať nejdú, preto ich vytvára after_migrate hook.
+# add_index je idempotentný – existujúci index (podľa mena) preskočí.
+
+COMPOSITE_INDEXES = (
+    # odpočet minút a zostatok: owner_user + status, FIFO podľa created_at
+    ("Friday Token", ("owner_user", "status", "created_at"), "owner_status_created"),
+    # prepočet zostatkov: status + owner_user + minúty bez čítania riadkov (covering)
+    ("Friday Token", ("status", "owner_user", "minutes_remaining"), "status_owner_minutes"),
+    # zvonenie: živé zariadenia používateľa, najčerstvejšie prvé
+    ("Device", ("user", "last_seen_at"), "user_last_seen"),
+    # ledger: riadky používateľa v poradí a chvost po snapshote / k času
+    ("Transaction", ("user", "seq"), "user_seq"),
+    ("Transaction", ("user", "created_at"), "user_created"),
+    ("Transaction Snapshot", ("user", "seq"), "user_seq"),
+    ("Transaction Snapshot", ("user", "as_of"), "user_as_of"),
+    # história hovorov: vetva caller / advisor zoradená podľa začiatku, v horúcej tabuľke aj v archíve
+    ("Call Log", ("caller", "started_at"), "caller_started"),
+    ("Call Log", ("advisor", "started_at"), "advisor_started"),
+    ("Call Log Archive", ("caller", "started_at"), "caller_started"),
+    ("Call Log Archive", ("advisor", "started_at"), "advisor_started"),
+    # súhrny: nové skončené hovory od high-water mark, reporty podľa mesiaca / poradcu
+    ("Call Log", ("rolled_up", "modified"), "rolled_up_modified"),
+    # nezdvihnuté hovory po ring timeoute
+    ("Call Log", ("status", "started_at"), "status_started"),
+    ("Call Monthly Rollup", ("month", "advisor"), "month_advisor"),
+    ("Call Monthly Rollup", ("month", "client"), "month_client"),
+    ("Call Daily Rollup", ("advisor", "day"), "advisor_day"),
+    # marketplace: aktívne ponuky zoradené podľa ceny (prepočet order booku, browse podľa roka)
+    ("Friday Listing", ("status", "price_eur"), "status_price"),
+    ("Friday Listing", ("status", "issued_year", "price_eur"), "status_year_price"),
+)
+
+
+def ensure_indexes():
+    for doctype, fields, index_name in COMPOSITE_INDEXES:
+        if frappe.db.has_index(f"tab{doctype}", index_name):
+            continue
+        frappe.db.add_index(doctype, list(fields), index_name)
+        log_info(f"Created index {index_name} on {doctype}")
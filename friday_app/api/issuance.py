@@ -0,0 +1,81 @@
+import frappe
+from frappe.utils import cint, flt, now_datetime
+
+from .balance import apply_balance_delta
+from .ledger import record_entries
+from .utils import log_info
+
+# ============= TOKEN ISSUANCE =============
+# Nákup N tokenov = N × Friday Token + N × Friday Purchase Item + 1 × Transaction (ledger).
+# Všetko ide viacriadkovými INSERTmi v jednej transakcii, bez ORM insert() na riadok.
+# Mená tokenov a položiek sú odvodené od Payment, takže opakované vydanie pre tú istú platbu
+# narazí na primárny kľúč – a pred tým ho zastaví kontrola pod zámkom Payment
+# (Transaction má meno z ledgera, s platbou ju spája pole payment).
+
+MINUTES_PER_TOKEN = 60
+CHUNK_SIZE = 1000
+STANDARD_FIELDS = ("name", "creation", "modified", "owner", "modified_by")
+
+
+def _token_name(payment: str, idx: int) -> str:
+    return f"{payment}-T{idx:05d}"
+
+
+def _bulk_insert(doctype: str, fields: tuple, rows: list):
+    frappe.db.bulk_insert(doctype, STANDARD_FIELDS + fields, rows, chunk_size=CHUNK_SIZE)
+
+
+def issue_tokens_for_payment(payment: str) -> int:
+    """
+    Vydá tokeny pre zaplatený Payment (friday_purchase). Idempotentné podľa Payment.
+    Necommituje. Vráti počet vydaných tokenov (0 ak už boli vydané).
+    """
+    rows = frappe.db.sql(
+        "select name, buyer, quantity, year, amount_eur from `tabPayment` where name = %s for update",
+        payment,
+        as_dict=True,
+    )
+    if not rows:
+        frappe.throw(f"Payment {payment} not found")
+    payment = rows[0]
+
+    if frappe.db.exists("Transaction", {"payment": payment.name, "type": "friday_purchase"}):
+        return 0
+
+    quantity = cint(payment.quantity) or 1
+    unit_price = flt(payment.amount_eur) / quantity
+    now = now_datetime()
+    standard = (now, now, "Administrator", "Administrator")
+
+    tokens, items = [], []
+    for idx in range(quantity):
+        token = _token_name(payment.name, idx)
+        tokens.append(
+            (token, *standard, payment.buyer, payment.year, MINUTES_PER_TOKEN, "active", unit_price, now, now)
+        )
+        items.append((f"{token}-P", *standard, payment.buyer, token, payment.name, unit_price, now))
+
+    _bulk_insert(
+        "Friday Token",
+        ("owner_user", "issued_year", "minutes_remaining", "status", "original_price_eur", "created_at", "updated_at"),
+        tokens,
+    )
+    _bulk_insert(
+        "Friday Purchase Item",
+        ("user", "token", "payment", "unit_price_eur", "created_at"),
+        items,
+    )
+    record_entries([{
+        "user": payment.buyer,
+        "type": "friday_purchase",
+        "amount_eur": payment.amount_eur,
+        "seconds_delta": quantity * MINUTES_PER_TOKEN * 60,
+        "reference": payment.name,
+        "payment": payment.name,
+    }])
+
+    # bulk_insert obchádza FridayToken controller – zostatok raz za celý nákup
+    apply_balance_delta(payment.buyer, quantity * MINUTES_PER_TOKEN, quantity)
+
+    log_info(f"Issued {quantity} token(s) for payment {payment.name}")
+    return quantity
@@ -0,0 +1,248 @@
+import frappe
+from frappe.utils import cint, flt, get_datetime, now_datetime
+
+from .auth_context import get_current_user_id
+from .utils import log_info
+
+# ============= LEDGER =============
+# Transaction je append-only ledger: každá operácia, ktorá mení minúty (nákup, obchod, hovor),
+# sem zapíše riadok cez record_entries. Riadok nesie poradové číslo používateľa (seq)
+# a zostatok po zápise, hlavička (posledné seq + zostatok) je na Friday Balance.
+# Každých SNAPSHOT_EVERY zápisov (a denne) vznikne Transaction Snapshot s kumulatívnymi
+# súčtami podľa typu. Stav k ľubovoľnému času = najbližší snapshot + krátky chvost riadkov;
+# chvost k minulému času končí na nasledujúcom snapshote, takže nikdy nie je dlhší ako jeden interval.
+
+SNAPSHOT_EVERY = 100
+STANDARD_FIELDS = ("name", "creation", "modified", "owner", "modified_by")
+TX_FIELDS = (
+    "user", "type", "amount_eur", "seconds_delta", "seq", "balance_after_seconds",
+    "reference", "note", "payment", "created_at",
+)
+
+
+def record_entries(entries: list) -> list:
+    """
+    Zapíše riadky do ledgera (bez commitu).
+    entries = [{"user", "type", "seconds_delta", "amount_eur"?, "reference"?, "note"?, "payment"?}]
+    Vráti mená vytvorených Transaction.
+    """
+    if not entries:
+        return []
+    by_user = {}
+    for entry in entries:
+        by_user.setdefault(entry["user"], []).append(entry)
+
+    now = now_datetime()
+    rows, names = [], []
+    heads = _advance_heads({
+        user: (len(user_entries), sum(cint(e["seconds_delta"]) for e in user_entries))
+        for user, user_entries in by_user.items()
+    })
+    for user in sorted(by_user):
+        user_entries = by_user[user]
+        seq, balance = heads[user]
+        for entry in user_entries:
+            seq += 1
+            balance += cint(entry["seconds_delta"])
+            name = frappe.generate_hash(length=12)
+            names.append(name)
+            rows.append((
+                name, now, now, "Administrator", "Administrator",
+                user, entry["type"], flt(entry.get("amount_eur")), cint(entry["seconds_delta"]), seq, balance,
+                entry.get("reference"), entry.get("note"), entry.get("payment"), now,
+            ))
+        if seq // SNAPSHOT_EVERY > (seq - len(user_entries)) // SNAPSHOT_EVERY:
+            frappe.enqueue(
+                "friday_app.api.ledger.snapshot_job",
+                queue="short",
+                enqueue_after_commit=True,
+                job_id=f"ledger_snapshot::{user}",
+                deduplicate=True,
+                user=user,
+            )
+
+    frappe.db.bulk_insert("Transaction", STANDARD_FIELDS + TX_FIELDS, rows)
+    return names
+
+
+def _advance_heads(heads: dict) -> dict:
+    """
+    Posunie hlavičky ledgera (zamkne riadky Friday Balance) jedným upsertom.
+    heads = {user: (počet riadkov, sekundy)}. Vráti {user: (seq, zostatok) pred zápisom}.
+    """
+    now = now_datetime()
+    users = sorted(heads)
+    values, params = [], []
+    # pevné poradie používateľov = rovnaké poradie zámkov vo všetkých transakciách
+    for user in users:
+        values.append("(%s, %s, %s, %s, %s, %s, %s, 'Administrator', 'Administrator')")
+        params += [user, user, *heads[user], now, now, now]
+    frappe.db.sql(
+        f"""
+        insert into `tabFriday Balance`
+            (name, user, ledger_seq, ledger_seconds, updated_at, creation, modified, owner, modified_by)
+        values {", ".join(values)}
+        on duplicate key update
+            ledger_seq = ledger_seq + values(ledger_seq),
+            ledger_seconds = ledger_seconds + values(ledger_seconds),
+            modified = values(modified)
+        """,
+        params,
+    )
+    rows = frappe.db.sql(
+        "select name, ledger_seq, ledger_seconds from `tabFriday Balance` where name in %(users)s",
+        {"users": tuple(users)},
+    )
+    return {
+        user: (cint(seq) - heads[user][0], cint(balance) - heads[user][1]) for user, seq, balance in rows
+    }
+
+
+# ---------- snapshoty ----------
+
+
+def _latest_snapshot(user: str, at=None):
+    conditions, params = ["user = %(user)s"], {"user": user}
+    if at is not None:
+        conditions.append("as_of <= %(at)s")
+        params["at"] = at
+    rows = frappe.db.sql(
+        f"""
+        select seq, as_of, balance_seconds, totals
+        from `tabTransaction Snapshot`
+        where {" and ".join(conditions)}
+        order by seq desc
+        limit 1
+        """,
+        params,
+        as_dict=True,
+    )
+    if not rows:
+        return frappe._dict(seq=0, as_of=None, balance_seconds=0, totals={})
+    snapshot = rows[0]
+    snapshot.totals = frappe.parse_json(snapshot.totals) or {}
+    return snapshot
+
+
+def _next_snapshot_seq(user: str, at) -> int | None:
+    """seq prvého snapshotu po `at` – riadky za ním už k `at` nepatria."""
+    return frappe.db.sql(
+        "select min(seq) from `tabTransaction Snapshot` where user = %(user)s and as_of > %(at)s",
+        {"user": user, "at": at},
+    )[0][0]
+
+
+def _tail_totals(user: str, after_seq: int, at=None, until_seq: int | None = None) -> tuple:
+    """Súčty riadkov po snapshote: (totals podľa typu, posledné seq, čas posledného riadku)."""
+    conditions, params = ["user = %(user)s", "seq > %(after)s"], {"user": user, "after": after_seq}
+    if until_seq is not None:
+        conditions.append("seq <= %(until)s")
+        params["until"] = until_seq
+    if at is not None:
+        conditions.append("created_at <= %(at)s")
+        params["at"] = at
+    rows = frappe.db.sql(
+        f"""
+        select type, sum(seconds_delta) as seconds, sum(amount_eur) as amount,
+            max(seq) as last_seq, max(created_at) as last_at
+        from `tabTransaction`
+        where {" and ".join(conditions)}
+        group by type
+        """,
+        params,
+        as_dict=True,
+    )
+    totals = {r.type: [cint(r.seconds), flt(r.amount)] for r in rows}
+    last_seq = max((cint(r.last_seq) for r in rows), default=None)
+    last_at = max((r.last_at for r in rows), default=None)
+    return totals, last_seq, last_at
+
+
+def _merge(base: dict, tail: dict) -> dict:
+    merged = {k: list(v) for k, v in base.items()}
+    for tx_type, (seconds, amount) in tail.items():
+        current = merged.setdefault(tx_type, [0, 0.0])
+        current[0] += seconds
+        current[1] = flt(current[1] + amount, 2)
+    return merged
+
+
+def write_snapshot(user: str) -> str | None:
+    """Snapshot k poslednému zápisu používateľa (ak od posledného pribudli riadky)."""
+    base = _latest_snapshot(user)
+    tail, last_seq, last_at = _tail_totals(user, base.seq)
+    if last_seq is None:
+        return None
+    totals = _merge(base.totals, tail)
+    return frappe.get_doc({
+        "doctype": "Transaction Snapshot",
+        "user": user,
+        "seq": last_seq,
+        "as_of": last_at,
+        "balance_seconds": sum(seconds for seconds, _ in totals.values()),
+        "totals": frappe.as_json(totals, indent=None),
+    }).insert(ignore_permissions=True).name
+
+
+def snapshot_job(user: str):
+    write_snapshot(user)
+    frappe.db.commit()
+
+
+def daily_snapshots():
+    """Scheduler: snapshot pre každého, kto má od posledného snapshotu nové riadky."""
+    users = frappe.db.sql_list(
+        """
+        select b.user
+        from `tabFriday Balance` b
+        left join (
+            select user, max(seq) as seq from `tabTransaction Snapshot` group by user
+        ) s on s.user = b.user
+        where b.ledger_seq > ifnull(s.seq, 0)
+        """
+    )
+    for user in users:
+        write_snapshot(user)
+        frappe.db.commit()
+    if users:
+        log_info(f"Wrote {len(users)} ledger snapshot(s)")
+
+
+# ---------- čítanie ----------
+
+
+def position_at(user: str, at=None) -> dict:
+    """Kumulatívny stav ledgera k času `at` (default teraz): zostatok + súčty podľa typu."""
+    at = get_datetime(at) if at else None
+    base = _latest_snapshot(user, at=at)
+    until_seq = _next_snapshot_seq(user, at) if at is not None else None
+    tail, last_seq, _ = _tail_totals(user, base.seq, at=at, until_seq=until_seq)
+    totals = _merge(base.totals, tail)
+    return {
+        "seq": last_seq or base.seq,
+        "balance_seconds": sum(seconds for seconds, _ in totals.values()),
+        "totals": totals,
+    }
+
+
+def statement(user: str, from_date=None, to_date=None) -> dict:
+    """Výpis za obdobie = rozdiel dvoch pozícií, každá je snapshot + krátky chvost."""
+    opening = position_at(user, from_date) if from_date else {"seq": 0, "balance_seconds": 0, "totals": {}}
+    closing = position_at(user, to_date)
+    period = {}
+    for tx_type, (seconds, amount) in closing["totals"].items():
+        before = opening["totals"].get(tx_type, [0, 0.0])
+        if seconds - before[0] or amount - before[1]:
+            period[tx_type] = {"seconds": seconds - before[0], "amount_eur": flt(amount - before[1], 2)}
+    return {
+        "opening_seconds": opening["balance_seconds"],
+        "closing_seconds": closing["balance_seconds"],
+        "entries": closing["seq"] - opening["seq"],
+        "by_type": period,
+    }
+
+
+@frappe.whitelist(allow_guest=False)
+def my_statement(from_date=None, to_date=None):
+    user_id = get_current_user_id()
+    return {"success": True, **statement(user_id, from_date, to_date)}
@@ -0,0 +1,511 @@
+import functools
+import hashlib
+import time
+
+import frappe
+from frappe import _
+from frappe.utils import cint, flt, now_datetime
+
+from .auth_context import get_current_user_id
+from .balance import apply_balance_delta
+from .ledger import record_entries
+from .utils import log_info
+
+# ============= ORDER BOOK =============
+# Otvorené Friday Listing ponuky v Redise: jeden sorted set na issued_year.
+#   score  = cena v centoch
+#   member = "<creation µs>:<listing>" – pri rovnakej cene rozhoduje čas (lexikograficky)
+# Best quote aj hĺbka sú ZRANGE – O(log n), bez čítania tabuľky.
+# Zdrojom pravdy ostáva DB: obchod si ponuku "zaberie" podmieneným UPDATE (status = 'open'),
+# takže neaktuálny záznam v knihe nič nepredá dvakrát – len sa z knihy vyhodí.
+# Kniha sa dá kedykoľvek postaviť znova z DB (rebuild_order_book).
+
+BOOK_KEY = "friday:market:book:"
+INDEX_KEY = "friday:market:index"
+YEARS_KEY = "friday:market:years"
+BUILT_KEY = "friday:market:built"
+VERSION_KEY = "friday:market:version"
+LAST_TRADE_KEY = "friday:market:last_trade"
+CLAIM_BATCH = 5
+MAX_DEPTH = 50
+
+
+def _key(name: str) -> str:
+    return frappe.cache().make_key(name)
+
+
+def _raw(command: str, *args):
+    """
+    Jeden príkaz priamo na Redis. RedisWrapper prepisuje hget/hset/smembers/exists
+    (pridá prefix ku kľúču z _key druhýkrát a hodnoty pickluje) – kniha je celá surová.
+    """
+    pipe = frappe.cache().pipeline(transaction=False)
+    getattr(pipe, command)(*args)
+    return pipe.execute()[0]
+
+
+def _book_key(year) -> str:
+    return _key(f"{BOOK_KEY}{cint(year)}")
+
+
+def _score(price_eur) -> int:
+    return int(round(flt(price_eur) * 100))
+
+
+def _member(listing: str, creation) -> str:
+    ts = int(frappe.utils.get_datetime(creation).timestamp() * 1_000_000)
+    return f"{ts:017d}:{listing}"
+
+
+def _listing_of(member) -> str:
+    if isinstance(member, bytes):
+        member = member.decode()
+    return member.split(":", 1)[1]
+
+
+# ---------- udržiavanie knihy ----------
+
+
+def add_to_book(listing: str, year, price_eur, creation):
+    cache = frappe.cache()
+    member = _member(listing, creation)
+    pipe = cache.pipeline()
+    pipe.zadd(_book_key(year), {member: _score(price_eur)})
+    pipe.hset(_key(INDEX_KEY), listing, f"{cint(year)}|{member}")
+    pipe.sadd(_key(YEARS_KEY), cint(year))
+    pipe.incr(_key(VERSION_KEY))
+    pipe.execute()
+
+
+def remove_from_book(listing: str):
+    entry = _raw("hget", _key(INDEX_KEY), listing)
+    if not entry:
+        return
+    year, member = (entry.decode() if isinstance(entry, bytes) else entry).split("|", 1)
+    pipe = frappe.cache().pipeline()
+    pipe.zrem(_book_key(year), member)
+    pipe.hdel(_key(INDEX_KEY), listing)
+    pipe.incr(_key(VERSION_KEY))
+    pipe.execute()
+
+
+def sync_listing(listing: str):
+    """Zosúladí jednu ponuku s DB (volá sa po commite)."""
+    row = frappe.db.get_value(
+        "Friday Listing", listing, ["status", "issued_year", "price_eur", "creation"], as_dict=True
+    )
+    if row and row.status == "open":
+        add_to_book(listing, row.issued_year, row.price_eur, row.creation)
+    else:
+        remove_from_book(listing)
+
+
+def sync_listing_after_commit(listing: str):
+    frappe.db.after_commit.add(functools.partial(sync_listing, listing))
+
+
+def rebuild_order_book() -> int:
+    """Postaví knihu znova z otvorených ponúk v DB."""
+    cache = frappe.cache()
+    years = {y.decode() if isinstance(y, bytes) else y for y in _raw("smembers", _key(YEARS_KEY))}
+    rows = frappe.get_all(
+        "Friday Listing",
+        filters={"status": "open"},
+        fields=["name", "issued_year", "price_eur", "creation"],
+    )
+
+    pipe = cache.pipeline()
+    for year in years | {str(cint(r.issued_year)) for r in rows}:
+        pipe.delete(_book_key(year))
+    pipe.delete(_key(INDEX_KEY), _key(YEARS_KEY))
+    for r in rows:
+        member = _member(r.name, r.creation)
+        pipe.zadd(_book_key(r.issued_year), {member: _score(r.price_eur)})
+        pipe.hset(_key(INDEX_KEY), r.name, f"{cint(r.issued_year)}|{member}")
+        pipe.sadd(_key(YEARS_KEY), cint(r.issued_year))
+    pipe.set(_key(BUILT_KEY), int(time.time()))
+    pipe.incr(_key(VERSION_KEY))
+    pipe.execute()
+
+    log_info(f"Rebuilt order book from {len(rows)} open listing(s)")
+    return len(rows)
+
+
+def _ensure_book():
+    if not _raw("exists", _key(BUILT_KEY)):
+        rebuild_order_book()
+
+
+# ---------- čítanie ----------
+
+
+def best_offer(year):
+    _ensure_book()
+    rows = frappe.cache().zrange(_book_key(year), 0, 0, withscores=True)
+    if not rows:
+        return None
+    member, score = rows[0]
+    return {"listing": _listing_of(member), "price_eur": score / 100}
+
+
+def book_depth(year, levels: int = 10) -> list:
+    """Cenové hladiny: [{"price_eur", "count"}] od najlacnejšej."""
+    _ensure_book()
+    levels = min(max(cint(levels), 1), MAX_DEPTH)
+    depth = []
+    offset = 0
+    # čítame po dávkach, kým nemáme požadovaný počet hladín
+    while len(depth) < levels:
+        rows = frappe.cache().zrange(_book_key(year), offset, offset + levels * 4 - 1, withscores=True)
+        if not rows:
+            break
+        for _member, score in rows:
+            if depth and depth[-1]["score"] == score:
+                depth[-1]["count"] += 1
+            elif len(depth) < levels:
+                depth.append({"score": score, "count": 1})
+            else:
+                break
+        offset += len(rows)
+    return [{"price_eur": d["score"] / 100, "count": d["count"]} for d in depth]
+
+
+@frappe.whitelist(allow_guest=False)
+def quote(year):
+    get_current_user_id()
+    return {"success": True, "year": cint(year), "best": best_offer(year)}
+
+
+@frappe.whitelist(allow_guest=False)
+def depth(year, levels=10):
+    get_current_user_id()
+    return {"success": True, "year": cint(year), "levels": book_depth(year, levels)}
+
+
+# ---------- browse ----------
+
+BROWSE_DEFAULT_LIMIT = 20
+BROWSE_MAX_LIMIT = 100
+
+
+def market_version() -> int:
+    return cint(frappe.cache().get(_key(VERSION_KEY)))
+
+
+def _last_trade_price(year):
+    price = _raw("hget", _key(LAST_TRADE_KEY), cint(year))
+    if price is not None:
+        return flt(price.decode() if isinstance(price, bytes) else price)
+
+    rows = frappe.db.sql(
+        """
+        select t.price_eur
+        from `tabFriday Trade` t
+        join `tabFriday Listing` l on l.name = t.listing
+        where l.issued_year = %s
+        order by t.creation desc
+        limit 1
+        """,
+        cint(year),
+    )
+    price = flt(rows[0][0]) if rows else None
+    if price is not None:
+        _raw("hset", _key(LAST_TRADE_KEY), cint(year), price)
+    return price
+
+
+def market_summary(year=None) -> list:
+    """Štatistiky na rok: floor, počet ponúk, posledná obchodná cena – z knihy, nie z tabuľky."""
+    _ensure_book()
+    cache = frappe.cache()
+    if year:
+        years = [cint(year)]
+    else:
+        years = sorted(cint(y) for y in _raw("smembers", _key(YEARS_KEY)))
+
+    pipe = cache.pipeline()
+    for y in years:
+        pipe.zcard(_book_key(y))
+        pipe.zrange(_book_key(y), 0, 0, withscores=True)
+    raw = pipe.execute()
+
+    summary = []
+    for i, y in enumerate(years):
+        count, best = raw[2 * i], raw[2 * i + 1]
+        summary.append({
+            "year": y,
+            "listings": count,
+            "floor_price_eur": best[0][1] / 100 if best else None,
+            "last_trade_price_eur": _last_trade_price(y),
+        })
+    return summary
+
+
+def _encode_cursor(row) -> str:
+    return frappe.safe_encode(frappe.as_json([flt(row.price_eur), str(row.creation), row.name], indent=None)).hex()
+
+
+def _decode_cursor(cursor: str):
+    try:
+        price, creation, name = frappe.parse_json(bytes.fromhex(cursor).decode())
+    except Exception:
+        frappe.throw(_("Invalid cursor"))
+    return flt(price), creation, name
+
+
+def browse_listings(year=None, min_price=None, max_price=None, after=None, limit=None) -> dict:
+    """Otvorené ponuky podľa (price_eur, creation, name) – keyset, žiadny OFFSET."""
+    limit = min(max(cint(limit) or BROWSE_DEFAULT_LIMIT, 1), BROWSE_MAX_LIMIT)
+    conditions = ["status = 'open'"]
+    params = {"limit": limit + 1}
+    if year:
+        conditions.append("issued_year = %(year)s")
+        params["year"] = cint(year)
+    if min_price not in (None, ""):
+        conditions.append("price_eur >= %(min_price)s")
+        params["min_price"] = flt(min_price)
+    if max_price not in (None, ""):
+        conditions.append("price_eur <= %(max_price)s")
+        params["max_price"] = flt(max_price)
+    if after:
+        params["a_price"], params["a_creation"], params["a_name"] = _decode_cursor(after)
+        conditions.append(
+            "(price_eur, creation, name) > (%(a_price)s, %(a_creation)s, %(a_name)s)"
+        )
+
+    rows = frappe.db.sql(
+        f"""
+        select name, token, seller, issued_year, price_eur, creation
+        from `tabFriday Listing`
+        where {" and ".join(conditions)}
+        order by price_eur asc, creation asc, name asc
+        limit %(limit)s
+        """,
+        params,
+        as_dict=True,
+    )
+    next_cursor = _encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return {
+        "listings": [
+            {
+                "id": r.name,
+                "token": r.token,
+                "seller": r.seller,
+                "year": r.issued_year,
+                "price_eur": flt(r.price_eur),
+                "listed_at": str(r.creation),
+            }
+            for r in rows[:limit]
+        ],
+        "next": next_cursor,
+    }
+
+
+def _etag(*parts) -> str:
+    return '"' + hashlib.sha1(frappe.as_json(parts, indent=None).encode()).hexdigest() + '"'
+
+
+def _not_modified(etag: str) -> bool:
+    return etag in (frappe.get_request_header("If-None-Match") or "")
+
+
+def _response(data: dict | None, etag: str):
+    from werkzeug.wrappers import Response
+
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if data is None:
+        return Response(status=304, headers=headers)
+    return Response(
+        frappe.as_json({"message": data}, indent=None),
+        status=200,
+        content_type="application/json",
+        headers=headers,
+    )
+
+
+@frappe.whitelist(allow_guest=False)
+def browse(year=None, min_price=None, max_price=None, after=None, limit=None):
+    """
+    Marketplace pre mobil: stránka ponúk + súhrn na rok.
+    ETag = verzia trhu (mení sa pri každej zmene knihy / obchode) + parametre,
+    takže nezmenená stránka je 304 bez jediného DB dotazu.
+    """
+    get_current_user_id()
+    etag = _etag(market_version(), year, min_price, max_price, after, limit)
+    if _not_modified(etag):
+        return _response(None, etag)
+
+    data = {
+        "success": True,
+        **browse_listings(year, min_price, max_price, after, limit),
+        "summary": market_summary(year),
+    }
+    return _response(data, etag)
+
+
+# ---------- obchod ----------
+
+
+def _claim(listing: str, buyer: str):
+    """Podmienený UPDATE – ponuku dostane práve jeden kupujúci."""
+    frappe.db.sql(
+        """
+        update `tabFriday Listing`
+        set status = 'sold', closed_at = %(now)s, modified = %(now)s
+        where name = %(name)s and status = 'open' and seller != %(buyer)s
+        """,
+        {"name": listing, "buyer": buyer, "now": now_datetime()},
+    )
+    if not frappe.db.sql("select row_count()")[0][0]:
+        return None
+    return frappe.db.get_value(
+        "Friday Listing", listing, ["name", "token", "seller", "price_eur", "issued_year"], as_dict=True
+    )
+
+
+def execute_buy(buyer: str, year=None, max_price=None, listing: str | None = None,
+                payment: str | None = None, platform_fee_eur=0):
+    """
+    Kúpa z knihy (market: bez max_price, limit: s max_price) alebo konkrétnej ponuky.
+    Zaberie ponuku, prevedie token, zapíše Friday Trade + Transaction kupujúceho aj predávajúceho.
+    Necommituje. Vráti obchod alebo None, ak nič vyhovujúce nie je.
+    """
+    if listing:
+        claimed = _claim(listing, buyer)
+    else:
+        claimed = _claim_from_book(buyer, year, max_price)
+    if not claimed:
+        return None
+
+    token = frappe.db.get_value("Friday Token", claimed.token, ["minutes_remaining", "status"], as_dict=True)
+    minutes = cint(token.minutes_remaining)
+    now = now_datetime()
+    frappe.db.sql(
+        """
+        update `tabFriday Token`
+        set owner_user = %(buyer)s, status = 'active', updated_at = %(now)s, modified = %(now)s
+        where name = %(name)s
+        """,
+        {"buyer": buyer, "name": claimed.token, "now": now},
+    )
+    # ponúknutý token (status listed) sa do zostatku predávajúceho už nepočíta
+    if token.status == "active":
+        apply_balance_delta(claimed.seller, -minutes, -1)
+    apply_balance_delta(buyer, minutes, 1)
+
+    trade = frappe.get_doc({
+        "doctype": "Friday Trade",
+        "listing": claimed.name,
+        "token": claimed.token,
+        "seller": claimed.seller,
+        "buyer": buyer,
+        "price_eur": claimed.price_eur,
+        "platform_fee_eur": platform_fee_eur,
+        "created_at": now,
+    }).insert(ignore_permissions=True)
+
+    record_entries([
+        {
+            "user": user,
+            "type": tx_type,
+            "amount_eur": claimed.price_eur,
+            "seconds_delta": seconds_delta,
+            "reference": trade.name,
+            "payment": payment,
+        }
+        for user, tx_type, seconds_delta in (
+            (buyer, "friday_trade_buy", minutes * 60),
+            (claimed.seller, "friday_trade_sell", -minutes * 60),
+        )
+    ])
+
+    frappe.db.after_commit.add(functools.partial(remove_from_book, claimed.name))
+    frappe.db.after_commit.add(functools.partial(_record_trade, claimed.issued_year, claimed.price_eur))
+    log_info(f"Trade {trade.name}: {claimed.name} {claimed.seller} → {buyer} for {claimed.price_eur}")
+    return {
+        "trade": trade.name,
+        "listing": claimed.name,
+        "token": claimed.token,
+        "price_eur": flt(claimed.price_eur),
+        "minutes": minutes,
+    }
+
+
+def _record_trade(year, price_eur):
+    pipe = frappe.cache().pipeline()
+    pipe.hset(_key(LAST_TRADE_KEY), cint(year), flt(price_eur))
+    pipe.incr(_key(VERSION_KEY))
+    pipe.execute()
+
+
+def _claim_from_book(buyer: str, year, max_price=None):
+    _ensure_book()
+    cache = frappe.cache()
+    key = _book_key(year)
+    max_score = _score(max_price) if max_price not in (None, "") else "+inf"
+    offset = 0
+    while True:
+        candidates = cache.zrangebyscore(key, "-inf", max_score, start=offset, num=CLAIM_BATCH)
+        if not candidates:
+            return None
+        for member in candidates:
+            claimed = _claim(_listing_of(member), buyer)
+            if claimed:
+                return claimed
+            # predaná / zrušená ponuka (alebo vlastná) – neaktuálne záznamy z knihy vyhodíme
+            if frappe.db.get_value("Friday Listing", _listing_of(member), "status") != "open":
+                cache.zrem(key, member)
+            else:
+                offset += 1
+
+
+# ---------- ponuky ----------
+
+
+@frappe.whitelist(allow_guest=False, methods=["POST"])
+def create_listing(token, price_eur):
+    """Predávajúci ponúkne svoj aktívny token."""
+    user_id = get_current_user_id()
+    price_eur = flt(price_eur)
+    if price_eur <= 0:
+        frappe.throw(_("Price must be positive"))
+
+    doc = frappe.get_doc("Friday Token", token, for_update=True)
+    if doc.owner_user != user_id or doc.status != "active":
+        frappe.throw(_("Token is not available for listing"), frappe.PermissionError)
+
+    doc.status = "listed"
+    doc.save(ignore_permissions=True)
+    listing = frappe.get_doc({
+        "doctype": "Friday Listing",
+        "token": token,
+        "seller": user_id,
+        "issued_year": doc.issued_year,
+        "price_eur": price_eur,
+        "status": "open",
+        "created_at": now_datetime(),
+    }).insert(ignore_permissions=True)
+    frappe.db.commit()
+    return {"success": True, "listing": listing.name}
+
+
+@frappe.whitelist(allow_guest=False, methods=["POST"])
+def cancel_listing(listing):
+    user_id = get_current_user_id()
+    frappe.db.sql(
+        """
+        update `tabFriday Listing`
+        set status = 'cancelled', closed_at = %(now)s, modified = %(now)s
+        where name = %(name)s and seller = %(seller)s and status = 'open'
+        """,
+        {"name": listing, "seller": user_id, "now": now_datetime()},
+    )
+    if not frappe.db.sql("select row_count()")[0][0]:
+        return {"success": False, "error": "Listing not open"}
+
+    token = frappe.get_doc("Friday Token", frappe.db.get_value("Friday Listing", listing, "token"))
+    token.status = "active"
+    token.save(ignore_permissions=True)
+    frappe.db.after_commit.add(functools.partial(remove_from_book, listing))
+    frappe.db.commit()
+    return {"success": True}
@@ -0,0 +1,271 @@
+import math
+import time
+from datetime import datetime, timezone
+
+import frappe
+from frappe.utils import cint, get_datetime, now_datetime
+
+from .auth_context import get_current_user_id
+from .call_state import FINAL_STATUSES, publish_call_state, ring_timeout
+from .presence import release_busy
+from .rollups import enqueue_rollup
+from .utils import deduct_minutes_batch, log_info
+
+# ============= CALL METERING =============
+# Dĺžku hovoru meria server, nie klient. Účastníci posielajú heartbeat každých pár sekúnd –
+# ten ide len do Redisu (sorted set aktívnych hovorov, score = čas posledného heartbeatu).
+# Flusher raz za minútu zoberie všetky aktívne hovory, zamkne ich Call Log riadky jedným
+# SELECT ... FOR UPDATE, dofakturuje minúty, ktoré pribudli, a zapíše ich jedným UPDATE.
+# Hovor bez heartbeatu dlhšie ako timeout sa ukončí k času posledného heartbeatu.
+# Zvoniaci hovor má len meta hash so state "ringing" (s TTL), aby heartbeat ani vtedy nešiel do DB.
+# site_config.json:
+#   friday_heartbeat_timeout – po koľkých sekundách bez heartbeatu je hovor mŕtvy (default 30)
+
+ACTIVE_KEY = "friday:calls:active"
+CALL_KEY = "friday:calls:meta:"
+DEFAULT_HEARTBEAT_TIMEOUT = 30
+HEARTBEAT_INTERVAL = 5
+FLUSH_CHUNK = 200
+# ringing hash prežije ring timeout o rezervu pre expire_ringing_calls (beží raz za minútu)
+RINGING_GRACE = 120
+
+
+def _key(name: str) -> str:
+    return frappe.cache().make_key(name)
+
+
+def heartbeat_timeout() -> int:
+    return cint(frappe.conf.get("friday_heartbeat_timeout")) or DEFAULT_HEARTBEAT_TIMEOUT
+
+
+def register_ringing(call_id: str, caller: str, advisor: str):
+    """Hovor zvoní (volať po commite start_call) – heartbeat účastníkov vráti "ringing" bez DB."""
+    key = _key(CALL_KEY + call_id)
+    pipe = frappe.cache().pipeline()
+    pipe.hset(key, mapping={"caller": caller, "advisor": advisor, "state": "ringing"})
+    pipe.expire(key, ring_timeout() + RINGING_GRACE)
+    pipe.execute()
+
+
+def register_call(call_id: str, caller: str, advisor: str):
+    """Začne merať hovor (volať po commite prijatia hovoru)."""
+    now = time.time()
+    key = _key(CALL_KEY + call_id)
+    pipe = frappe.cache().pipeline()
+    pipe.hset(key, mapping={"caller": caller, "advisor": advisor, "state": "active"})
+    pipe.persist(key)
+    pipe.zadd(_key(ACTIVE_KEY), {call_id: now})
+    pipe.execute()
+
+
+def unregister_calls(call_ids: list):
+    """Koniec merania aj zvonenia (ended / declined / missed) – jeden pipeline."""
+    if not call_ids:
+        return
+    pipe = frappe.cache().pipeline()
+    pipe.zrem(_key(ACTIVE_KEY), *call_ids)
+    pipe.delete(*(_key(CALL_KEY + call_id) for call_id in call_ids))
+    pipe.execute()
+
+
+def unregister_call(call_id: str):
+    unregister_calls([call_id])
+
+
+def last_heartbeat(call_id: str) -> float | None:
+    return frappe.cache().zscore(_key(ACTIVE_KEY), call_id)
+
+
+@frappe.whitelist(allow_guest=False, methods=["POST"])
+def heartbeat(call_id):
+    """
+    Účastník hovoru hlási, že hovor beží. Zvoniaci aj bežiaci hovor = len Redis, žiadna DB.
+    state: "active" (meria sa), "ringing" (ešte nezdvihnutý – meranie začne po accept)
+    alebo "ended". active=False (state "ended") → klient má zavesiť.
+    """
+    user_id = get_current_user_id()
+    cache = frappe.cache()
+    pipe = cache.pipeline()
+    pipe.hmget(_key(CALL_KEY + call_id), ["caller", "advisor", "stop", "state"])
+    pipe.zscore(_key(ACTIVE_KEY), call_id)
+    (caller, advisor, stop, state), score = pipe.execute()
+
+    participants = {p.decode() if isinstance(p, bytes) else p for p in (caller, advisor) if p}
+    if user_id not in participants:
+        return {"success": True, "active": False, "state": "ended"}
+    if score is None:
+        # do active setu ide hovor až pri prijatí – dovtedy len meta hash z register_ringing
+        if (state.decode() if isinstance(state, bytes) else state) == "ringing":
+            return {"success": True, "active": True, "state": "ringing", "interval": HEARTBEAT_INTERVAL}
+        return {"success": True, "active": False, "state": "ended"}
+    if stop:
+        return {
+            "success": True, "active": False, "state": "ended",
+            "reason": (stop.decode() if isinstance(stop, bytes) else stop),
+        }
+
+    cache.zadd(_key(ACTIVE_KEY), {call_id: time.time()}, xx=True)
+    return {"success": True, "active": True, "state": "active", "interval": HEARTBEAT_INTERVAL}
+
+
+# ---------- fakturácia ----------
+
+
+# started_at sa zapisuje cez now_iso() – naivný UTC čas, preto prevody cez UTC
+def _timestamp(value) -> float:
+    return get_datetime(value).replace(tzinfo=timezone.utc).timestamp()
+
+
+def utc_datetime(ts: float) -> datetime:
+    return datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None)
+
+
+def billable_minutes(started_at, until_ts: float) -> int:
+    seconds = max(until_ts - _timestamp(started_at), 0)
+    return math.ceil(seconds / 60)
+
+
+def billing_start(call):
+    """Fakturuje sa od zdvihnutia (answered_at), staré hovory bez neho od začiatku."""
+    return call.answered_at or call.started_at
+
+
+def bill_call(call, until_ts: float) -> dict:
+    """
+    Dofakturuje minúty hovoru do času until_ts. `call` je zamknutý Call Log riadok
+    (name, caller, started_at, answered_at, billed_minutes, used_token, token_usage).
+    Vráti nové hodnoty pre Call Log.
+    """
+    return bill_calls([(call, until_ts)])[0]
+
+
+def bill_calls(calls: list) -> list:
+    """calls = [(call, until_ts)] → nové hodnoty pre každý hovor, odpočet minút pre všetky naraz."""
+    pending = []
+    for call, until_ts in calls:
+        delta = billable_minutes(billing_start(call), until_ts) - cint(call.billed_minutes)
+        if delta > 0:
+            pending.append((call.caller, delta, call.name))
+    usages = dict(zip((name for _, _, name in pending), deduct_minutes_batch(pending), strict=True))
+
+    results = []
+    for call, until_ts in calls:
+        usage = usages.get(call.name) or {"deducted": 0, "missing": 0, "tokens": []}
+        token_usage = (frappe.parse_json(call.token_usage) or []) + usage["tokens"]
+        results.append({
+            "duration": max(int(until_ts - _timestamp(billing_start(call))), 0),
+            "billed_minutes": cint(call.billed_minutes) + usage["deducted"],
+            "deducted": usage["deducted"],
+            "used_token": call.used_token or (token_usage[0]["token"] if token_usage else None),
+            "token_usage": frappe.as_json(token_usage, indent=None) if token_usage else None,
+            "missing": usage["missing"],
+        })
+    return results
+
+
+def lock_calls(call_ids: list) -> list:
+    if not call_ids:
+        return []
+    return frappe.db.sql(
+        """
+        select name, caller, advisor, status, started_at, answered_at, duration, billed_minutes,
+            used_token, token_usage, signal_room
+        from `tabCall Log`
+        where name in %(names)s
+        order by name
+        for update
+        """,
+        {"names": tuple(call_ids)},
+        as_dict=True,
+    )
+
+
+UPDATE_COLUMNS = ("status", "ended_at", "duration", "billed_minutes", "used_token", "token_usage", "last_heartbeat_at")
+
+
+def write_calls(updates: dict):
+    """updates = {call: {column: value}} → jeden UPDATE s CASE pre každý stĺpec."""
+    if not updates:
+        return
+    sets, params = [], []
+    for column in UPDATE_COLUMNS:
+        names = [name for name, values in updates.items() if column in values]
+        if not names:
+            continue
+        sets.append(f"`{column}` = case name {' '.join('when %s then %s' for _ in names)} else `{column}` end")
+        for name in names:
+            params += [name, updates[name][column]]
+    now = now_datetime()
+    frappe.db.sql(
+        f"""
+        update `tabCall Log`
+        set {", ".join(sets)}, modified = %s
+        where name in %s
+        """,
+        (*params, now, tuple(updates)),
+    )
+
+
+def flush_call_meters():
+    """
+    Scheduler (každú minútu): dofakturuje bežiace hovory a ukončí tie bez heartbeatu.
+    Na dávku hovorov: zámok Call Log, jeden odpočet minút pre všetkých volajúcich
+    (deduct_minutes_batch) a jeden UPDATE Call Log.
+    """
+    cache = frappe.cache()
+    active = cache.zrange(_key(ACTIVE_KEY), 0, -1, withscores=True)
+    if not active:
+        return
+
+    now = time.time()
+    timeout = heartbeat_timeout()
+    heartbeats = {(m.decode() if isinstance(m, bytes) else m): score for m, score in active}
+    call_ids = sorted(heartbeats)
+
+    ended = 0
+    for i in range(0, len(call_ids), FLUSH_CHUNK):
+        chunk = call_ids[i:i + FLUSH_CHUNK]
+        rows = {r.name: r for r in lock_calls(chunk)}
+        updates, finished, out_of_minutes, released = {}, [], [], []
+
+        running = []
+        for call_id in chunk:
+            call = rows.get(call_id)
+            if not call or call.status in FINAL_STATUSES:
+                finished.append(call_id)
+                continue
+            last = heartbeats[call_id]
+            running.append((call, last, now - last > timeout))
+        billing = bill_calls([(call, last if dead else now) for call, last, dead in running])
+
+        for (call, last, dead), billed in zip(running, billing, strict=True):
+            call_id = call.name
+            values = {k: billed[k] for k in ("duration", "billed_minutes", "used_token", "token_usage")}
+            values["last_heartbeat_at"] = utc_datetime(last)
+            if dead:
+                values.update(status="ended", ended_at=utc_datetime(last))
+                publish_call_state(call_id, call.signal_room, "ended", reason="timeout")
+                finished.append(call_id)
+                released.append(call.advisor)
+            elif billed["missing"]:
+                out_of_minutes.append(call_id)
+            updates[call_id] = values
+
+        write_calls(updates)
+        if finished:
+            enqueue_rollup()
+        frappe.db.commit()
+
+        pipe = cache.pipeline()
+        for call_id in finished:
+            pipe.zrem(_key(ACTIVE_KEY), call_id)
+            pipe.delete(_key(CALL_KEY + call_id))
+        for call_id in out_of_minutes:
+            pipe.hset(_key(CALL_KEY + call_id), "stop", "no_minutes")
+        pipe.execute()
+        for advisor in released:
+            release_busy(advisor)
+        ended += len(finished)
+
+    log_info(f"Flushed {len(call_ids)} active call(s), {ended} ended")
+
@@ -0,0 +1,262 @@
+import hmac
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+import frappe
+
+# ============= METRICS =============
+# Latencie endpointov a odchodzích volaní (Clerk, APNs, Stripe) vo formáte Prometheus.
+# Request hooky (before_request / after_request) merajú každý friday_app.api.* endpoint:
+# histogram trvania podľa (endpoint, outcome = trieda HTTP statusu) a počet DB dotazov.
+# Label endpoint je len existujúca whitelistovaná funkcia, ostatné cesty idú pod "other"
+# (inak by klient ľubovoľnými URL nafukoval počet sérií v Redise).
+# Záznam ide len do slovníka v pamäti procesu (pár µs pod zámkom), worker ho najviac raz
+# za FLUSH_INTERVAL pripočíta jedným pipeline HINCRBY/HINCRBYFLOAT do Redis hashu –
+# súčet cez všetky workery a joby číta endpoint metrics().
+# site_config.json:
+#   friday_metrics_token – Bearer token pre scraper (bez neho endpoint pustí len System Managera)
+
+METRICS_KEY = "friday:metrics"
+FLUSH_INTERVAL = 5
+API_PREFIX = "/api/method/friday_app.api."
+OTHER_ENDPOINT = "other"
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+FAMILIES = {
+    "friday_request_duration_seconds": ("histogram", "Trvanie requestu na friday_app.api endpoint"),
+    "friday_request_db_queries": ("histogram", "Počet DB dotazov na request"),
+    "friday_outbound_duration_seconds": ("histogram", "Trvanie odchodzieho volania (Clerk, APNs, Stripe)"),
+    "friday_outbound_total": ("counter", "Odchodzie volania podľa výsledku"),
+}
+
+# site → {séria: hodnota}, čaká na flush
+_pending = {}
+_last_flush = {}
+_lock = threading.Lock()
+_query_counter_installed = False
+
+
+def _label_value(value) -> str:
+    # escapovanie podľa textového formátu Prometheus
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _series(name: str, labels: dict) -> str:
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{k}="{_label_value(v)}"' for k, v in labels.items()) + "}"
+
+
+def _add(values: list):
+    """values = [(séria, prírastok)] – jedno prevzatie zámku na celé pozorovanie."""
+    site = getattr(frappe.local, "site", None)
+    if not site:
+        return
+    with _lock:
+        pending = _pending.setdefault(site, {})
+        for series, value in values:
+            pending[series] = pending.get(series, 0) + value
+
+
+def inc(name: str, value=1, **labels):
+    _add([(_series(name, labels), value)])
+
+
+def observe(name: str, value: float, buckets: tuple, **labels):
+    """Histogram – kumulatívne buckety ako v Prometheuse (le="+Inf" = count)."""
+    values = [(_series(f"{name}_sum", labels), value), (_series(f"{name}_count", labels), 1)]
+    # aj nulové buckety – každá séria histogramu musí v exporte existovať
+    values += [(_series(f"{name}_bucket", {**labels, "le": str(le)}), int(value <= le)) for le in buckets]
+    values.append((_series(f"{name}_bucket", {**labels, "le": "+Inf"}), 1))
+    _add(values)
+
+
+def flush(force: bool = False):
+    """Pripočíta čakajúce hodnoty do Redisu (najviac raz za FLUSH_INTERVAL, force hneď)."""
+    site = getattr(frappe.local, "site", None)
+    now = time.monotonic()
+    if not site or (not force and now - _last_flush.get(site, 0) < FLUSH_INTERVAL):
+        return
+    with _lock:
+        pending = _pending.pop(site, None)
+        _last_flush[site] = now
+    if not pending:
+        return
+
+    key = frappe.cache().make_key(METRICS_KEY)
+    pipe = frappe.cache().pipeline(transaction=False)
+    for series, value in pending.items():
+        if isinstance(value, int):
+            pipe.hincrby(key, series, value)
+        else:
+            pipe.hincrbyfloat(key, series, value)
+    try:
+        pipe.execute()
+    except Exception:
+        # metriky nesmú zhodiť request – stratená dávka je prijateľná
+        frappe.logger("friday_app").warning("Metrics flush failed", exc_info=True)
+
+
+# ---------- odchodzie volania ----------
+
+
+def observe_outbound(service: str, operation: str, seconds: float, outcome: str = "ok"):
+    observe("friday_outbound_duration_seconds", seconds, DURATION_BUCKETS, service=service, operation=operation)
+    inc("friday_outbound_total", service=service, operation=operation, outcome=outcome)
+
+
+@contextmanager
+def timed(service: str, operation: str):
+    """
+    Zmeria odchodzie volanie. Výnimka = outcome "error", volajúci môže outcome
+    prepísať cez vrátený dict (napr. podľa HTTP statusu).
+    """
+    result = {"outcome": "ok"}
+    start = time.perf_counter()
+    try:
+        yield result
+    except Exception:
+        result["outcome"] = "error"
+        raise
+    finally:
+        observe_outbound(service, operation, time.perf_counter() - start, result["outcome"])
+
+
+# ---------- request hooky ----------
+
+
+def _count_queries(sql):
+    def wrapper(self, *args, **kwargs):
+        local = frappe.local
+        if getattr(local, "friday_db_queries", None) is not None:
+            local.friday_db_queries += 1
+        return sql(self, *args, **kwargs)
+
+    wrapper.__wrapped__ = sql
+    return wrapper
+
+
+def _install_query_counter():
+    """Každý dotaz (aj get_value, qb, get_doc) prechádza cez Database.sql – obalíme ho raz na proces."""
+    global _query_counter_installed
+    if _query_counter_installed or not getattr(frappe.local, "db", None):
+        return
+    db_class = type(frappe.local.db)
+    db_class.sql = _count_queries(db_class.sql)
+    _query_counter_installed = True
+
+
+@lru_cache(maxsize=256)
+def _endpoint_label(method: str) -> str:
+    """Cesta za API_PREFIX → label; neexistujúca alebo newhitelistovaná funkcia = OTHER_ENDPOINT."""
+    try:
+        fn = frappe.get_attr("friday_app.api." + method)
+    except Exception:
+        return OTHER_ENDPOINT
+    if fn not in frappe.whitelisted and fn not in frappe.guest_methods:
+        return OTHER_ENDPOINT
+    return method
+
+
+def _endpoint() -> str | None:
+    request = getattr(frappe.local, "request", None)
+    path = getattr(request, "path", "") or ""
+    return _endpoint_label(path[len(API_PREFIX):]) if path.startswith(API_PREFIX) else None
+
+
+def before_request():
+    endpoint = _endpoint()
+    if not endpoint:
+        return
+    _install_query_counter()
+    frappe.local.friday_db_queries = 0
+    frappe.local.friday_request = (endpoint, time.perf_counter())
+
+
+def after_request(response=None, request=None):
+    started = getattr(frappe.local, "friday_request", None)
+    if not started:
+        return
+    endpoint, start = started
+    queries = frappe.local.friday_db_queries or 0
+    frappe.local.friday_request = frappe.local.friday_db_queries = None
+
+    outcome = f"{getattr(response, 'status_code', 500) // 100}xx"
+    observe("friday_request_duration_seconds", time.perf_counter() - start, DURATION_BUCKETS,
+            endpoint=endpoint, outcome=outcome)
+    observe("friday_request_db_queries", queries, QUERY_BUCKETS, endpoint=endpoint)
+    flush()
+
+
+def after_job(method=None, kwargs=None, result=None):
+    # odchodzie volania z jobov (push fronta) – flush aj mimo requestov
+    flush()
+
+
+# ---------- export ----------
+
+
+def _family(series: str) -> str:
+    name = series.partition("{")[0]
+    for suffix in ("_bucket", "_sum", "_count"):
+        if name.endswith(suffix) and name[:-len(suffix)] in FAMILIES:
+            return name[:-len(suffix)]
+    return name
+
+
+def _sort_key(item) -> tuple:
+    # buckety číselne podľa le, nie abecedne ("10" < "2.5")
+    name, _sep, labels = item[0].partition("{")
+    le = None
+    if 'le="' in labels:
+        labels, _sep, le = labels.rpartition('le="')
+        le = float(le.partition('"')[0])
+    return (labels, name, le if le is not None else 0.0)
+
+
+def _number(value) -> str:
+    value = float(value.decode() if isinstance(value, bytes) else value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def render() -> str:
+    """Obsah Redis hashu → textový formát Prometheus (0.0.4)."""
+    pipe = frappe.cache().pipeline(transaction=False)
+    pipe.hgetall(frappe.cache().make_key(METRICS_KEY))
+    stored = pipe.execute()[0]
+
+    families = {}
+    for series, value in stored.items():
+        series = series.decode() if isinstance(series, bytes) else series
+        families.setdefault(_family(series), []).append((series, _number(value)))
+
+    lines = []
+    for family in sorted(families):
+        kind, help_text = FAMILIES.get(family, ("untyped", ""))
+        if help_text:
+            lines.append(f"# HELP {family} {help_text}")
+        lines.append(f"# TYPE {family} {kind}")
+        lines += [f"{series} {value}" for series, value in sorted(families[family], key=_sort_key)]
+    return "\n".join(lines) + "\n"
+
+
+def _authorized() -> bool:
+    token = frappe.conf.get("friday_metrics_token")
+    header = frappe.get_request_header("Authorization") or ""
+    if token and header.startswith("Bearer "):
+        return hmac.compare_digest(header[len("Bearer "):].strip(), token)
+    return frappe.session.user != "Guest" and "System Manager" in frappe.get_roles()
+
+
+@frappe.whitelist(allow_guest=True, methods=["GET"])
+def metrics():
+    """Prometheus scrape endpoint: GET /api/method/friday_app.api.metrics.metrics"""
+    if not _authorized():
+        frappe.throw("Forbidden", frappe.PermissionError)
+
+    from werkzeug.wrappers import Response
+
+    flush(force=True)
+    return Response(render(), status=200, content_type="text/plain; version=0.0.4; charset=utf-8")
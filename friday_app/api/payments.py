@@ -0,0 +1,254 @@
+import json
+
+import frappe
+from frappe.utils import cint, flt, now_datetime
+
+from .issuance import issue_tokens_for_payment
+from .market import execute_buy
+from .metrics import timed
+from .settings import get_settings
+from .utils import log_error, log_info
+
+# ============= STRIPE PAYMENTS =============
+# Webhook len overí podpis, uloží surový event (Stripe Event, name = event id) a vráti 200.
+# Opakované doručenie toho istého eventu skončí na INSERT IGNORE – do fronty ide len raz.
+# Job process_stripe_event potom event aplikuje na Payment / Friday Token / Friday Purchase Item /
+# Transaction. Zámok na riadku eventu + stav Payment zaručia, že sa to stane práve raz.
+# Checkout session metadata:
+#   type      – "friday_purchase" (nové tokeny) alebo "listing" (kúpa ponuky z marketplace)
+#   user_id   – Friday User kupujúceho (alebo client_reference_id)
+#   quantity  – počet tokenov (friday_purchase)
+#   year      – rok vydania tokenov (friday_purchase)
+#   listing   – Friday Listing (listing)
+
+DEFAULT_QUEUE = "default"
+MAX_ATTEMPTS = 5
+RETRY_AFTER_MINUTES = 5
+SESSION_LOCK_KEY = "friday:stripe:session:"
+
+
+@frappe.whitelist(allow_guest=True, methods=["POST"])
+def stripe_webhook():
+    """
+    Endpoint pre Stripe. Nič nespracúva – len overí, uloží a zaradí do fronty.
+    """
+    payload = frappe.request.data
+    event = _construct_event(payload, frappe.get_request_header("Stripe-Signature"))
+    ingest_stripe_event(event["id"], event["type"], payload)
+    return "ok"
+
+
+def _construct_event(payload: bytes, signature: str | None):
+    import stripe
+
+    stripe_settings = get_settings().stripe
+    if not stripe_settings.webhook_secret:
+        frappe.throw("Missing STRIPE_WEBHOOK_SECRET")
+    try:
+        with timed("stripe", "construct_event"):
+            return stripe.Webhook.construct_event(
+                payload=payload, sig_header=signature, secret=stripe_settings.webhook_secret
+            )
+    except Exception as e:
+        frappe.throw(f"Webhook error: {e}")
+
+
+def ingest_stripe_event(event_id: str, event_type: str, payload) -> bool:
+    """
+    Uloží event (ak ešte nie je) a zaradí ho na spracovanie.
+    Vráti False pre duplicitné doručenie.
+    """
+    if isinstance(payload, bytes):
+        payload = payload.decode()
+    now = now_datetime()
+    frappe.db.sql(
+        """
+        insert ignore into `tabStripe Event`
+            (name, event_id, event_type, status, attempts, received_at, payload,
+             creation, modified, owner, modified_by)
+        values
+            (%(id)s, %(id)s, %(type)s, 'queued', 0, %(now)s, %(payload)s,
+             %(now)s, %(now)s, 'Administrator', 'Administrator')
+        """,
+        {"id": event_id, "type": event_type, "payload": payload, "now": now},
+    )
+    created = bool(frappe.db.sql("select row_count()")[0][0])
+    if created:
+        _enqueue(event_id)
+    frappe.db.commit()
+    return created
+
+
+def _enqueue(event_id: str):
+    frappe.enqueue(
+        "friday_app.api.payments.process_stripe_event",
+        queue=frappe.conf.get("friday_stripe_queue") or DEFAULT_QUEUE,
+        enqueue_after_commit=True,
+        job_id=f"stripe_event::{event_id}",
+        deduplicate=True,
+        event_id=event_id,
+    )
+
+
+def process_stripe_event(event_id: str):
+    """
+    RQ job: aplikuje jeden Stripe event. Spracovaný event sa už nikdy nezopakuje.
+    """
+    rows = frappe.db.sql(
+        "select event_type, status, attempts, payload from `tabStripe Event` where name = %s for update",
+        event_id,
+        as_dict=True,
+    )
+    if not rows or rows[0].status in ("processed", "ignored"):
+        frappe.db.rollback()
+        return
+
+    row = rows[0]
+    handler = EVENT_HANDLERS.get(row.event_type)
+    try:
+        obj = json.loads(row.payload)["data"]["object"]
+        applied = handler(obj) if handler else False
+    except Exception:
+        frappe.db.rollback()
+        _mark_event(event_id, "failed", attempts=cint(row.attempts) + 1, error=frappe.get_traceback())
+        log_error(f"Stripe event {event_id} ({row.event_type}) failed", "Stripe Event Error")
+        return
+
+    _mark_event(
+        event_id, "processed" if applied else "ignored", attempts=cint(row.attempts) + 1, processed=True
+    )
+    log_info(f"Stripe event {event_id} ({row.event_type}) {'applied' if applied else 'ignored'}")
+
+
+def _mark_event(event_id: str, status: str, attempts: int, error: str | None = None, processed=False):
+    now = now_datetime()
+    frappe.db.sql(
+        """
+        update `tabStripe Event`
+        set status = %(status)s, attempts = %(attempts)s, error = %(error)s,
+            processed_at = %(processed_at)s, modified = %(now)s
+        where name = %(name)s
+        """,
+        {
+            "name": event_id,
+            "status": status,
+            "attempts": attempts,
+            "error": error,
+            "processed_at": now if processed else None,
+            "now": now,
+        },
+    )
+    frappe.db.commit()
+
+
+def retry_stripe_events():
+    """
+    Scheduler: znova zaradí eventy, ktoré zlyhali alebo ostali vo fronte (napr. pád workera).
+    """
+    cutoff = frappe.utils.add_to_date(now_datetime(), minutes=-RETRY_AFTER_MINUTES)
+    events = frappe.get_all(
+        "Stripe Event",
+        filters={"status": ("in", ("queued", "failed")), "attempts": ("<", MAX_ATTEMPTS), "modified": ("<", cutoff)},
+        pluck="name",
+        limit=500,
+    )
+    for event_id in events:
+        _enqueue(event_id)
+    frappe.db.commit()
+
+
+# ============= EVENT HANDLERS =============
+
+
+def _checkout_completed(session: dict) -> bool:
+    # pri oneskorených platbách (SEPA, ...) príde peňažne až async_payment_succeeded
+    if session.get("payment_status") not in ("paid", "no_payment_required"):
+        return False
+    return _settle_session(session)
+
+
+def _checkout_async_succeeded(session: dict) -> bool:
+    return _settle_session(session)
+
+
+def _checkout_failed(session: dict) -> bool:
+    payment = _payment_for_session(session, create=False)
+    if not payment or payment.status == "paid":
+        return False
+    frappe.db.set_value("Payment", payment.name, "status", "failed")
+    return True
+
+
+def _settle_session(session: dict) -> bool:
+    with frappe.cache().lock(frappe.cache().make_key(SESSION_LOCK_KEY + session["id"]), timeout=60):
+        payment = _payment_for_session(session)
+        if payment.status == "paid":
+            return False
+
+        if payment.type == "listing":
+            settled = _settle_listing(payment)
+        else:
+            issue_tokens_for_payment(payment.name)
+            settled = True
+
+        frappe.db.set_value("Payment", payment.name, {
+            "status": "paid" if settled else "conflict",
+            "stripe_payment_intent": session.get("payment_intent") or payment.stripe_payment_intent,
+        })
+        frappe.db.commit()
+    return True
+
+
+def _payment_for_session(session: dict, create=True):
+    rows = frappe.db.sql(
+        """
+        select name, buyer, listing, type, quantity, year, amount_eur, application_fee_eur,
+            stripe_payment_intent, status
+        from `tabPayment`
+        where stripe_session_id = %s
+        for update
+        """,
+        session["id"],
+        as_dict=True,
+    )
+    if rows or not create:
+        return rows[0] if rows else None
+
+    meta = session.get("metadata") or {}
+    payment = frappe.get_doc({
+        "doctype": "Payment",
+        "buyer": meta.get("user_id") or session.get("client_reference_id"),
+        "listing": meta.get("listing"),
+        "type": meta.get("type") or "friday_purchase",
+        "quantity": cint(meta.get("quantity")) or 1,
+        "year": cint(meta.get("year")) or now_datetime().year,
+        "amount_eur": flt(session.get("amount_total")) / 100,
+        "application_fee_eur": flt(meta.get("application_fee_eur")),
+        "stripe_session_id": session["id"],
+        "stripe_payment_intent": session.get("payment_intent"),
+        "status": "pending",
+        "created_at": now_datetime(),
+    }).insert(ignore_permissions=True)
+    return frappe._dict(payment.as_dict())
+
+
+def _settle_listing(payment) -> bool:
+    """Kúpa ponuky cez order book. False ak ponuka medzitým nie je k dispozícii."""
+    trade = execute_buy(
+        payment.buyer,
+        listing=payment.listing,
+        payment=payment.name,
+        platform_fee_eur=payment.application_fee_eur,
+    )
+    if not trade:
+        log_error(f"Payment {payment.name}: listing {payment.listing} is no longer open", "Stripe Listing Conflict")
+        return False
+    return True
+
+
+EVENT_HANDLERS = {
+    "checkout.session.completed": _checkout_completed,
+    "checkout.session.async_payment_succeeded": _checkout_async_succeeded,
+    "checkout.session.async_payment_failed": _checkout_failed,
+    "checkout.session.expired": _checkout_failed,
+}
@@ -0,0 +1,144 @@
+import time
+
+import frappe
+from frappe.utils import cint
+
+from .auth_context import get_auth_context, get_current_user_id
+
+# ============= PRESENCE =============
+# Kto je dostupný na hovor. Aplikácia poradcu (rola admin) posiela heartbeat (online / busy)
+# každých pár sekúnd, server drží stav v jednom Redis hashi: user → "status:timestamp[:call_id]".
+# Záznam starší ako TTL sa berie ako offline (a prune_presence ho zmaže), takže spadnutá
+# aplikácia nezostane "online". Celý zoznam je jedno HGETALL, dávka používateľov jedno HMGET.
+# Hovor nastaví poradcu na busy (s call_id) už pri zvonení, ukončený / odmietnutý / zmeškaný
+# späť na online (bez čakania na heartbeat). Heartbeat "online" počas hovoru busy len obnoví.
+# site_config.json:
+#   friday_presence_ttl – po koľkých sekundách bez heartbeatu je používateľ offline (default 60)
+
+PRESENCE_KEY = "friday:presence"
+DEFAULT_TTL = 60
+STATUSES = ("online", "busy", "offline")
+
+
+def _key() -> str:
+    return frappe.cache().make_key(PRESENCE_KEY)
+
+
+def _raw(command: str, *args):
+    # RedisWrapper prepisuje hget/hset/hgetall/hdel (pickle + druhý prefix) – hash je surový
+    pipe = frappe.cache().pipeline(transaction=False)
+    getattr(pipe, command)(*args)
+    return pipe.execute()[0]
+
+
+def presence_ttl() -> int:
+    return cint(frappe.conf.get("friday_presence_ttl")) or DEFAULT_TTL
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _parse(value) -> tuple:
+    """Hodnota z hashu → (status, timestamp, call_id | None)."""
+    status, ts, call_id = [*_decode(value).split(":", 2), None, None][:3]
+    return status, float(ts or 0), call_id
+
+
+def _status(value, now: float, ttl: int) -> str:
+    """Hodnota z hashu → status, prepadnutý záznam je offline."""
+    if not value:
+        return "offline"
+    status, ts, _call_id = _parse(value)
+    return status if now - ts <= ttl else "offline"
+
+
+def set_presence(user: str, status: str, call_id: str | None = None):
+    if status == "offline":
+        _raw("hdel", _key(), user)
+    else:
+        _raw("hset", _key(), user, f"{status}:{time.time()}" + (f":{call_id}" if call_id else ""))
+
+
+def _busy_call(user: str) -> str | None:
+    """Hovor, kvôli ktorému je poradca busy – ak ešte zvoní alebo beží (má metering meta hash)."""
+    from .metering import CALL_KEY
+
+    value = _raw("hget", _key(), user)
+    if not value:
+        return None
+    status, ts, call_id = _parse(value)
+    if status != "busy" or not call_id or time.time() - ts > presence_ttl():
+        return None
+    return call_id if _raw("exists", frappe.cache().make_key(CALL_KEY + call_id)) else None
+
+
+def release_busy(user: str):
+    """Po konci hovoru späť na online – len ak je poradca stále prihlásený (busy, nie prepadnutý)."""
+    if get_presence([user])[user] == "busy":
+        set_presence(user, "online")
+
+
+def get_presence(users: list) -> dict:
+    """Stav pre dávku používateľov – jedno HMGET."""
+    if not users:
+        return {}
+    now, ttl = time.time(), presence_ttl()
+    values = _raw("hmget", _key(), users)
+    return {user: _status(value, now, ttl) for user, value in zip(users, values, strict=True)}
+
+
+def is_available(user: str) -> tuple:
+    """(dostupný?, status) – pre start_call pred akoukoľvek prácou."""
+    status = get_presence([user])[user]
+    return status == "online", status
+
+
+def all_presence() -> dict:
+    """Všetci s čerstvým heartbeatom – jedno HGETALL."""
+    now, ttl = time.time(), presence_ttl()
+    result = {}
+    for user, value in _raw("hgetall", _key()).items():
+        status = _status(value, now, ttl)
+        if status != "offline":
+            result[_decode(user)] = status
+    return result
+
+
+@frappe.whitelist(allow_guest=False, methods=["POST"])
+def heartbeat(status="online"):
+    """Aplikácia poradcu hlási dostupnosť (online / busy / offline pri odhlásení)."""
+    user_id = get_current_user_id()
+    if get_auth_context().role != "admin":
+        # klient nie je poradca – inak by sa objavil v available_advisors
+        frappe.throw("Forbidden", frappe.PermissionError)
+    if status not in STATUSES:
+        frappe.throw(f"Invalid status {status}")
+
+    call_id = _busy_call(user_id) if status == "online" else None
+    if call_id:
+        # bežný heartbeat počas hovoru neprepíše busy z prijatia hovoru
+        status = "busy"
+    set_presence(user_id, status, call_id)
+    return {"success": True, "status": status, "ttl": presence_ttl()}
+
+
+@frappe.whitelist(allow_guest=False)
+def available_advisors():
+    """Poradcovia, ktorým sa dá teraz volať (a koľko je obsadených) – bez DB."""
+    presence = all_presence()
+    return {
+        "success": True,
+        "available": sorted(user for user, status in presence.items() if status == "online"),
+        "busy": sorted(user for user, status in presence.items() if status == "busy"),
+    }
+
+
+def prune_presence():
+    """Scheduler: zmaže prepadnuté záznamy, aby hash nerástol."""
+    now, ttl = time.time(), presence_ttl()
+    stale = [
+        user for user, value in _raw("hgetall", _key()).items() if _status(value, now, ttl) == "offline"
+    ]
+    if stale:
+        _raw("hdel", _key(), *stale)
@@ -0,0 +1,242 @@
+import json
+import time
+
+import frappe
+from frappe.utils import now_datetime
+
+from .apns_bulk import send_bulk_notifications
+from .device_tokens import live_device_tokens
+from .utils import log_error, send_apns_notification
+
+# ============= PUSH QUEUE =============
+# Push pre prichádzajúci hovor sa neposiela v requeste start_call, ale v jobe na krátkej fronte.
+# Zvoní naraz na všetkých živých zariadeniach volaného (paralelné HTTP/2 streamy, jeden round trip).
+# Job skúša s exponenciálnym backoffom až do deadlinu – neskorý VoIP ring je k ničomu.
+# Keď hovor prestane zvoniť (prijatý, odmietnutý, zmeškaný), ostatné zariadenia dostanú cancel push.
+# Čo sa nepodarí doručiť, skončí v dead-letter zozname v Redise.
+# Push type (a s ním apns-topic) sa volí podľa druhu tokenu: VoIP token dostane "voip",
+# bežný APNs token "alert" (zvonenie) alebo tichý "background" (cancel).
+# site_config.json:
+#   friday_push_queue     – RQ fronta (default "short")
+#   friday_push_deadline  – koľko sekúnd od start_call má zmysel ešte zvoniť
+
+DEFAULT_QUEUE = "short"
+DEFAULT_DEADLINE = 30
+MAX_ATTEMPTS = 6
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8
+DEAD_LETTER_KEY = "friday:push:dead_letter"
+DEAD_LETTER_LIMIT = 1000
+RINGING_STATUSES = ("ringing", "started")
+# druh tokenu (live_device_tokens) → push type
+RING_PUSH_TYPES = {"voip": "voip", "apns": "alert"}
+CANCEL_PUSH_TYPES = {"voip": "voip", "apns": "background"}
+
+
+def enqueue_call_push(call_log: str, device_tokens: list, title: str, body: str, extra: dict | None = None):
+    """
+    Zaradí push na všetky zariadenia volaného. Job sa spustí až po commite, takže Call Log už existuje.
+    device_tokens = [(token, druh)] z live_device_tokens.
+    """
+    deadline = time.time() + int(frappe.conf.get("friday_push_deadline") or DEFAULT_DEADLINE)
+    frappe.enqueue(
+        "friday_app.api.push_queue.deliver_call_push",
+        queue=frappe.conf.get("friday_push_queue") or DEFAULT_QUEUE,
+        timeout=int(deadline - time.time()) + 30,
+        enqueue_after_commit=True,
+        call_log=call_log,
+        device_tokens=device_tokens,
+        title=title,
+        body=body,
+        extra=extra,
+        deadline=deadline,
+    )
+
+
+def enqueue_cancel_push(call_log: str, user: str, except_token: str | None = None, reason: str = "ended"):
+    """
+    Hovor už nezvoní (prijatý na inom zariadení, odmietnutý, zmeškaný) – ostatné zariadenia
+    volaného dostanú cancel push. Po commite prechodu.
+    """
+    device_tokens = [(token, kind) for token, kind in live_device_tokens(user) if token != except_token]
+    if not device_tokens:
+        return
+    frappe.enqueue(
+        "friday_app.api.push_queue.deliver_cancel_push",
+        queue=frappe.conf.get("friday_push_queue") or DEFAULT_QUEUE,
+        enqueue_after_commit=True,
+        call_log=call_log,
+        device_tokens=device_tokens,
+        reason=reason,
+    )
+
+
+def _backoff(attempt: int) -> float:
+    return min(BACKOFF_BASE * 2 ** (attempt - 1), BACKOFF_MAX)
+
+
+def _update_call_log(call_log: str, values: dict):
+    frappe.db.set_value("Call Log", call_log, values, update_modified=False)
+    frappe.db.commit()
+
+
+def _still_ringing(call_log: str) -> bool:
+    return frappe.db.get_value("Call Log", call_log, "status") in RINGING_STATUSES
+
+
+def _token_kinds(device_tokens) -> dict:
+    """
+    token → druh. Job dostane [(token, druh)]; holý token (joby zaradené pred rozlíšením
+    druhov) sa berie ako bežný APNs token.
+    """
+    if isinstance(device_tokens, str):
+        device_tokens = [device_tokens]
+    kinds = {}
+    for item in device_tokens or []:
+        token, kind = (item, "apns") if isinstance(item, str) else item
+        if token:
+            kinds.setdefault(token, kind)
+    return kinds
+
+
+def _send(device_tokens: dict, title: str, body: str, extra: dict | None, expiration: int,
+          push_types: dict) -> dict:
+    """
+    token → výsledok. device_tokens = {token: druh}, push_types = {druh: push type}.
+    Zariadenia s rovnakým push type idú paralelne (HTTP/2 streamy) – jeden round trip na push type.
+    """
+    groups = {}
+    for token, kind in device_tokens.items():
+        groups.setdefault(push_types.get(kind, push_types["apns"]), []).append(token)
+
+    results = {}
+    for push_type, tokens in groups.items():
+        if len(tokens) == 1:
+            results[tokens[0]] = send_apns_notification(
+                device_token=tokens[0],
+                title=title,
+                body=body,
+                extra=extra,
+                expiration=expiration,
+                push_type=push_type,
+            )
+            continue
+        bulk = send_bulk_notifications(
+            tokens, title, body, extra=extra, expiration=expiration, push_type=push_type
+        )
+        results.update({r["device_token"]: r for r in bulk})
+    return results
+
+
+def deliver_call_push(call_log: str, device_tokens: list, title: str, body: str,
+                      extra: dict | None = None, deadline: float | None = None):
+    """
+    RQ job: doručí push na všetky zariadenia naraz. Tokeny s dočasnou chybou opakuje
+    s backoffom, kým neuplynie deadline alebo kým hovor ešte zvoní.
+    Call Log je "sent" hneď, ako zazvoní prvé zariadenie.
+    """
+    kinds = _token_kinds(device_tokens)
+    pending = list(kinds)
+    deadline = deadline or time.time() + DEFAULT_DEADLINE
+    attempt = 0
+    delivered = False
+    results = {}
+
+    while pending and time.time() < deadline:
+        if attempt and not _still_ringing(call_log):
+            return
+
+        attempt += 1
+        results.update(_send(
+            {t: kinds[t] for t in pending}, title, body, extra, int(deadline), RING_PUSH_TYPES
+        ))
+        ok = [t for t in pending if results[t].get("success")]
+        if ok and not delivered:
+            delivered = True
+            _update_call_log(call_log, {
+                "push_status": "sent",
+                "push_attempts": attempt,
+                "push_sent_at": now_datetime(),
+                "push_error": None,
+            })
+
+        # mŕtve tokeny už sú vymazané z Device, trvalé chyby opakovať nemá zmysel
+        pending = [t for t in pending if not results[t].get("success") and results[t].get("retryable")]
+        if not pending or attempt >= MAX_ATTEMPTS:
+            break
+
+        if not delivered:
+            _update_call_log(call_log, {
+                "push_status": "retrying",
+                "push_attempts": attempt,
+                "push_error": results[pending[0]].get("reason"),
+            })
+        time.sleep(max(min(_backoff(attempt), deadline - time.time()), 0))
+
+    if delivered:
+        return
+
+    failed = [r for r in results.values() if not r.get("success")]
+    if not failed or (pending and time.time() >= deadline):
+        # nestihli sme ani jeden pokus, alebo dočasné chyby až do deadlinu
+        _dead_letter(call_log, device_tokens, "expired", attempt, failed[-1] if failed else None, title, body, extra)
+    elif all(r.get("dead") for r in failed):
+        _update_call_log(call_log, {
+            "push_status": "failed",
+            "push_attempts": attempt,
+            "push_error": failed[-1].get("reason"),
+        })
+    else:
+        result = next(r for r in failed if not r.get("dead"))
+        _dead_letter(call_log, device_tokens, "failed", attempt, result, title, body, extra)
+
+
+def deliver_cancel_push(call_log: str, device_tokens: list, reason: str = "ended"):
+    """
+    RQ job: jeden paralelný pokus, bez retry – zvonenie aj tak skončí s deadlinom pushu.
+    Bez alertu a zvuku (VoIP token → voip, bežný token → background) – aplikácia len
+    ukončí zvonenie, žiadny banner.
+    """
+    _send(
+        _token_kinds(device_tokens),
+        title="",
+        body="",
+        extra={"type": "call_cancelled", "call_id": call_log, "reason": reason},
+        expiration=int(time.time()) + DEFAULT_DEADLINE,
+        push_types=CANCEL_PUSH_TYPES,
+    )
+
+
+def _dead_letter(call_log, device_tokens, status, attempts, result, title, body, extra):
+    reason = (result or {}).get("reason") or "deadline exceeded"
+    _update_call_log(call_log, {
+        "push_status": status,
+        "push_attempts": attempts,
+        "push_error": reason,
+    })
+
+    entry = json.dumps({
+        "call_log": call_log,
+        "device_tokens": device_tokens,
+        "status": status,
+        "reason": reason,
+        "attempts": attempts,
+        "title": title,
+        "body": body,
+        "extra": extra,
+        "at": time.time(),
+    })
+    # lpush/ltrim/lrange z RedisWrapper pridajú prefix sami
+    cache = frappe.cache()
+    cache.lpush(DEAD_LETTER_KEY, entry)
+    cache.ltrim(DEAD_LETTER_KEY, 0, DEAD_LETTER_LIMIT - 1)
+
+    log_error(f"Push for {call_log} {status} after {attempts} attempt(s): {reason}", "APNs Dead Letter")
+
+
+@frappe.whitelist()
+def dead_letters(limit: int = 100):
+    """Posledné nedoručené pushe (najnovšie prvé)."""
+    frappe.only_for("System Manager")
+    items = frappe.cache().lrange(DEAD_LETTER_KEY, 0, int(limit) - 1)
+    return {"success": True, "dead_letters": [json.loads(i) for i in items]}
@@ -0,0 +1,293 @@
+import frappe
+from frappe.utils import add_to_date, cint, get_datetime, get_first_day, getdate, now_datetime
+
+from .auth_context import get_auth_context
+from .utils import log_info
+
+# ============= CALL ROLLUPS =============
+# Reporty nečítajú Call Log, ale denné a mesačné súhrny (Call Daily Rollup / Call Monthly Rollup)
+# podľa (advisor, client, deň/mesiac). Skončený hovor sa do súhrnov pripočíta práve raz:
+# roll_up_calls zoberie dávku skončených hovorov s rolled_up = 0, pripočíta ich jedným
+# INSERT ... ON DUPLICATE KEY UPDATE do oboch tabuliek a označí ich rolled_up = 1.
+# High-water mark (frappe global) obmedzuje hľadanie na hovory zmenené od posledného behu,
+# takže job číta len nové riadky bez ohľadu na veľkosť histórie.
+# Job beží po každom ukončení hovoru (deduplikovaný) a pre istotu aj cez cron.
+
+FINAL_STATUSES = ("ended", "declined", "missed", "failed")
+HWM_KEY = "friday_call_rollup_hwm"
+LOCK_KEY = "friday:rollups:lock"
+CHUNK = 1000
+# transakcia, ktorá hovor ukončila, mohla commitnúť až po behu s novším HWM
+LATE_COMMIT_GRACE_MINUTES = 10
+COUNTERS = ("calls", "completed", "declined", "missed", "failed", "total_seconds", "billed_minutes")
+REPORT_MAX_LIMIT = 100
+
+
+def enqueue_rollup():
+    """Po commite ukončenia hovoru – nárazy ukončení sa zlejú do jedného jobu."""
+    frappe.enqueue(
+        "friday_app.api.rollups.roll_up_calls",
+        queue="short",
+        enqueue_after_commit=True,
+        job_id="call_rollups",
+        deduplicate=True,
+    )
+
+
+def _lock():
+    return frappe.cache().lock(frappe.cache().make_key(LOCK_KEY), timeout=600)
+
+
+def _rollup_name(period, advisor: str, client: str) -> str:
+    return f"{period}:{advisor}:{client}"
+
+
+def _upsert(doctype: str, period_field: str, groups: dict):
+    """groups = {(period, advisor, client): {counter: value}} → jeden INSERT ... ON DUPLICATE KEY UPDATE."""
+    if not groups:
+        return
+    now = now_datetime()
+    values, params = [], []
+    for (period, advisor, client), counts in groups.items():
+        values.append(f"({', '.join(['%s'] * (len(COUNTERS) + 8))})")
+        params += [
+            _rollup_name(period, advisor, client), period, advisor, client,
+            *(cint(counts[c]) for c in COUNTERS),
+            now, now, now, "Administrator", "Administrator",
+        ]
+    frappe.db.sql(
+        f"""
+        insert into `tab{doctype}`
+            (name, `{period_field}`, advisor, client, {", ".join(COUNTERS)},
+             updated_at, creation, modified, owner, modified_by)
+        values {", ".join(values)}
+        on duplicate key update
+            {", ".join(f"{c} = {c} + values({c})" for c in COUNTERS)},
+            updated_at = values(updated_at), modified = values(modified)
+        """,
+        params,
+    )
+
+
+def _aggregate(names: list) -> dict:
+    rows = frappe.db.sql(
+        """
+        select date(coalesce(started_at, creation)) as day, advisor, caller as client,
+            count(*) as calls,
+            sum(status = 'ended') as completed,
+            sum(status = 'declined') as declined,
+            sum(status = 'missed') as missed,
+            sum(status = 'failed') as failed,
+            sum(ifnull(duration, 0)) as total_seconds,
+            sum(ifnull(billed_minutes, 0)) as billed_minutes
+        from `tabCall Log`
+        where name in %(names)s and advisor is not null and caller is not null
+        group by 1, 2, 3
+        """,
+        {"names": tuple(names)},
+        as_dict=True,
+    )
+    return {(r.day, r.advisor, r.client): r for r in rows}
+
+
+def _by_month(daily: dict) -> dict:
+    monthly = {}
+    for (day, advisor, client), counts in daily.items():
+        total = monthly.setdefault((get_first_day(day), advisor, client), dict.fromkeys(COUNTERS, 0))
+        for c in COUNTERS:
+            total[c] += cint(counts[c])
+    return monthly
+
+
+def roll_up_calls() -> int:
+    """
+    Pripočíta nové skončené hovory do súhrnov. Dávka = zamknúť, agregovať, dva upserty,
+    označiť rolled_up, commit. Vráti počet spracovaných hovorov.
+    """
+    lock = _lock()
+    if not lock.acquire(blocking=False):
+        # beží iný roll-up alebo backfill – ten nové hovory zoberie
+        return 0
+
+    processed = 0
+    try:
+        hwm = frappe.db.get_global(HWM_KEY)
+        since = add_to_date(get_datetime(hwm), minutes=-LATE_COMMIT_GRACE_MINUTES) if hwm else None
+        while True:
+            rows = frappe.db.sql(
+                f"""
+                select name, modified
+                from `tabCall Log`
+                where rolled_up = 0 and status in %(statuses)s
+                    {"and modified >= %(since)s" if since else ""}
+                order by modified asc
+                limit %(chunk)s
+                for update skip locked
+                """,
+                {"statuses": FINAL_STATUSES, "since": since, "chunk": CHUNK},
+                as_dict=True,
+            )
+            if not rows:
+                break
+
+            names = [r.name for r in rows]
+            daily = _aggregate(names)
+            _upsert("Call Daily Rollup", "day", daily)
+            _upsert("Call Monthly Rollup", "month", _by_month(daily))
+            frappe.db.sql("update `tabCall Log` set rolled_up = 1 where name in %(names)s", {"names": tuple(names)})
+            frappe.db.set_global(HWM_KEY, str(rows[-1].modified))
+            frappe.db.commit()
+
+            processed += len(rows)
+            if len(rows) < CHUNK:
+                break
+    finally:
+        lock.release()
+
+    if processed:
+        log_info(f"Rolled up {processed} call(s)")
+    return processed
+
+
+def backfill_rollups(from_date=None) -> int:
+    """
+    Prepočíta súhrny od from_date (zaokrúhlené na začiatok mesiaca, default celá história)
+    z horúcej tabuľky aj archívu. Nové hovory po backfille dopočíta roll_up_calls.
+    Necommituje. Vráti počet denných riadkov.
+    """
+    start = get_first_day(from_date) if from_date else None
+    since = "and date(coalesce(started_at, creation)) >= %(start)s" if start else ""
+    params = {"statuses": FINAL_STATUSES, "start": start}
+
+    with _lock():
+        frappe.db.sql(f"delete from `tabCall Daily Rollup` {'where day >= %(start)s' if start else ''}", params)
+        frappe.db.sql(f"delete from `tabCall Monthly Rollup` {'where month >= %(start)s' if start else ''}", params)
+
+        # najprv označiť – hovory skončené počas backfillu ostanú na roll_up_calls
+        frappe.db.sql(
+            f"update `tabCall Log` set rolled_up = 1 where status in %(statuses)s and rolled_up = 0 {since}",
+            params,
+        )
+
+        counters = """
+            count(*), sum(status = 'ended'), sum(status = 'declined'), sum(status = 'missed'),
+            sum(status = 'failed'),
+            sum(ifnull(duration, 0)), sum(ifnull(billed_minutes, 0))
+        """
+        frappe.db.sql(
+            f"""
+            insert into `tabCall Daily Rollup`
+                (name, day, advisor, client, {", ".join(COUNTERS)},
+                 updated_at, creation, modified, owner, modified_by)
+            select concat(day, ':', advisor, ':', caller), day, advisor, caller, {counters},
+                now(), now(), now(), 'Administrator', 'Administrator'
+            from (
+                select date(coalesce(started_at, creation)) as day, advisor, caller, status, duration, billed_minutes
+                from `tabCall Log`
+                where rolled_up = 1 and status in %(statuses)s {since}
+                union all
+                select date(coalesce(started_at, creation)), advisor, caller, status, duration, billed_minutes
+                from `tabCall Log Archive`
+                where status in %(statuses)s {since}
+            ) calls
+            where advisor is not null and caller is not null
+            group by day, advisor, caller
+            """,
+            params,
+        )
+        days = frappe.db.sql("select row_count()")[0][0]
+
+        frappe.db.sql(
+            f"""
+            insert into `tabCall Monthly Rollup`
+                (name, month, advisor, client, {", ".join(COUNTERS)},
+                 updated_at, creation, modified, owner, modified_by)
+            select concat(date_format(day, '%%Y-%%m-01'), ':', advisor, ':', client),
+                date_format(day, '%%Y-%%m-01'), advisor, client,
+                {", ".join(f"sum({c})" for c in COUNTERS)},
+                now(), now(), now(), 'Administrator', 'Administrator'
+            from `tabCall Daily Rollup`
+            {"where day >= %(start)s" if start else ""}
+            group by date_format(day, '%%Y-%%m-01'), advisor, client
+            """,
+            params,
+        )
+        frappe.db.set_global(HWM_KEY, str(now_datetime()))
+
+    log_info(f"Backfilled {days} daily rollup row(s) from {start or 'the beginning'}")
+    return days
+
+
+# ---------- reporty ----------
+
+
+def _require_admin():
+    if get_auth_context().role != "admin":
+        frappe.throw("Forbidden", frappe.PermissionError)
+
+
+def _month_param(month) -> str:
+    return str(get_first_day(getdate(month) if month else now_datetime()))
+
+
+@frappe.whitelist(allow_guest=False)
+def advisor_minutes(month=None):
+    """Minúty a hovory podľa poradcu za mesiac (default aktuálny) – len z mesačných súhrnov."""
+    _require_admin()
+    rows = frappe.db.sql(
+        """
+        select advisor, sum(calls) as calls, sum(completed) as completed, sum(declined) as declined,
+            sum(missed) as missed,
+            sum(failed) as failed, sum(total_seconds) as total_seconds, sum(billed_minutes) as billed_minutes
+        from `tabCall Monthly Rollup`
+        where month = %(month)s
+        group by advisor
+        order by billed_minutes desc
+        """,
+        {"month": _month_param(month)},
+        as_dict=True,
+    )
+    return {"success": True, "month": _month_param(month), "advisors": rows}
+
+
+@frappe.whitelist(allow_guest=False)
+def top_clients(month=None, limit=10):
+    """Klienti s najväčšou spotrebou za mesiac."""
+    _require_admin()
+    limit = min(max(cint(limit), 1), REPORT_MAX_LIMIT)
+    rows = frappe.db.sql(
+        """
+        select client, sum(calls) as calls, sum(total_seconds) as total_seconds,
+            sum(billed_minutes) as billed_minutes
+        from `tabCall Monthly Rollup`
+        where month = %(month)s
+        group by client
+        order by billed_minutes desc
+        limit %(limit)s
+        """,
+        {"month": _month_param(month), "limit": limit},
+        as_dict=True,
+    )
+    return {"success": True, "month": _month_param(month), "clients": rows}
+
+
+@frappe.whitelist(allow_guest=False)
+def advisor_daily(advisor, from_date=None, to_date=None):
+    """Denný priebeh poradcu (default aktuálny mesiac)."""
+    _require_admin()
+    start = getdate(from_date) if from_date else get_first_day(now_datetime())
+    end = getdate(to_date) if to_date else getdate(now_datetime())
+    rows = frappe.db.sql(
+        """
+        select day, sum(calls) as calls, sum(completed) as completed, sum(declined) as declined,
+            sum(missed) as missed,
+            sum(failed) as failed, sum(total_seconds) as total_seconds, sum(billed_minutes) as billed_minutes
+        from `tabCall Daily Rollup`
+        where advisor = %(advisor)s and day between %(start)s and %(end)s
+        group by day
+        order by day
+        """,
+        {"advisor": advisor, "start": start, "end": end},
+        as_dict=True,
+    )
+    return {"success": True, "days": rows}
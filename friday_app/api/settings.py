@@ -0,0 +1,177 @@
+import threading
+import time
+from dataclasses import dataclass
+
+import frappe
+from frappe.utils import cint, flt
+
+# ============= SETTINGS =============
+# Jeden typovaný pohľad na konfiguráciu: APNs, Clerk, Stripe (site_config.json)
+# a cena minúty (Friday Settings). Drží sa v pamäti workera:
+#  - site_config sa porovná pri každom volaní (len čítanie dictu),
+#  - DB časť sa obnoví, keď sa zmení verzia v Redise – tú zvyšuje on_update Friday Settings.
+#    Redis sa pýtame najviac raz za VERSION_CHECK_INTERVAL sekúnd.
+
+VERSION_KEY = "friday:settings:version"
+VERSION_CHECK_INTERVAL = 5
+DEFAULT_CLERK_ISSUER = "https://notable-sawfly-17.clerk.accounts.dev"
+
+CONF_KEYS = (
+    "apns_key_id",
+    "apns_team_id",
+    "apns_auth_key",
+    "apns_bundle_id",
+    "apns_use_sandbox",
+    "clerk_api_key",
+    "clerk_verify_mode",
+    "clerk_issuer",
+    "clerk_jwks_url",
+    "clerk_jwks_ttl",
+    "clerk_timeout",
+    "clerk_authorized_parties",
+    "STRIPE_SECRET_KEY",
+    "STRIPE_WEBHOOK_SECRET",
+)
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class APNsSettings:
+    key_id: str | None
+    team_id: str | None
+    auth_key: str | None
+    bundle_id: str | None
+    is_sandbox: bool
+
+    @property
+    def complete(self) -> bool:
+        return bool(self.key_id and self.team_id and self.auth_key and self.bundle_id)
+
+
+@dataclass(frozen=True)
+class ClerkSettings:
+    api_key: str | None
+    verify_mode: str
+    issuer: str
+    jwks_url: str | None
+    jwks_ttl: int | None
+    timeout: float
+    authorized_parties: tuple
+
+
+@dataclass(frozen=True)
+class StripeSettings:
+    secret_key: str | None
+    webhook_secret: str | None
+
+
+@dataclass(frozen=True)
+class PricingSettings:
+    current_price_eur: float
+
+
+@dataclass(frozen=True)
+class FridayConfig:
+    apns: APNsSettings
+    clerk: ClerkSettings
+    stripe: StripeSettings
+    pricing: PricingSettings
+
+
+def _conf_fingerprint(conf) -> tuple:
+    return tuple(str(conf.get(key)) for key in CONF_KEYS)
+
+
+def _current_price() -> float:
+    rows = frappe.get_all("Friday Settings", fields=["current_price_eur"], order_by="creation desc", limit=1)
+    return flt(rows[0].current_price_eur) if rows else 0.0
+
+
+def _build(conf, pricing: PricingSettings | None = None) -> FridayConfig:
+    parties = conf.get("clerk_authorized_parties") or ()
+    if isinstance(parties, str):
+        parties = (parties,)
+    return FridayConfig(
+        apns=APNsSettings(
+            key_id=conf.get("apns_key_id"),
+            team_id=conf.get("apns_team_id"),
+            auth_key=conf.get("apns_auth_key"),
+            bundle_id=conf.get("apns_bundle_id"),
+            is_sandbox=bool(cint(conf.get("apns_use_sandbox"))),
+        ),
+        clerk=ClerkSettings(
+            api_key=conf.get("clerk_api_key"),
+            verify_mode=conf.get("clerk_verify_mode") or "local",
+            issuer=(conf.get("clerk_issuer") or DEFAULT_CLERK_ISSUER).rstrip("/"),
+            jwks_url=conf.get("clerk_jwks_url"),
+            jwks_ttl=cint(conf.get("clerk_jwks_ttl")) or None,
+            timeout=flt(conf.get("clerk_timeout")) or 5.0,
+            authorized_parties=tuple(parties),
+        ),
+        stripe=StripeSettings(
+            secret_key=conf.get("STRIPE_SECRET_KEY"),
+            webhook_secret=conf.get("STRIPE_WEBHOOK_SECRET"),
+        ),
+        pricing=pricing or PricingSettings(current_price_eur=_current_price()),
+    )
+
+
+def _version() -> str:
+    return frappe.cache().get_value(VERSION_KEY) or "0"
+
+
+def get_settings() -> FridayConfig:
+    """Aktuálne nastavenia situ – väčšinou bez DB aj bez Redisu."""
+    site = frappe.local.site
+    conf = frappe.local.conf
+    fingerprint = _conf_fingerprint(conf)
+    now = time.monotonic()
+
+    entry = _cache.get(site)
+    if entry and now - entry["checked_at"] >= VERSION_CHECK_INTERVAL:
+        if entry["version"] == _version():
+            entry["checked_at"] = now
+        else:
+            entry = None
+
+    if entry and entry["fingerprint"] == fingerprint:
+        return entry["settings"]
+
+    with _cache_lock:
+        if entry:
+            # zmenil sa len site_config – cenu netreba čítať znova
+            settings = _build(conf, entry["settings"].pricing)
+            version = entry["version"]
+        else:
+            version = _version()
+            settings = _build(conf)
+
+        previous = _cache.get(site)
+        _cache[site] = {"settings": settings, "version": version, "fingerprint": fingerprint, "checked_at": now}
+
+    if previous:
+        _on_change(previous["settings"], settings)
+    return settings
+
+
+def _on_change(old: FridayConfig, new: FridayConfig):
+    old_key = (old.apns.team_id, old.apns.key_id, old.apns.auth_key)
+    if all(old_key) and old_key != (new.apns.team_id, new.apns.key_id, new.apns.auth_key):
+        from .apns_client import invalidate_provider_token
+
+        invalidate_provider_token(*old_key)
+
+
+def bump_settings_version():
+    """Zneplatní nastavenia vo všetkých workeroch (volá sa z on_update)."""
+    frappe.cache().set_value(VERSION_KEY, frappe.generate_hash(length=10))
+    clear_settings_cache(frappe.local.site)
+
+
+def clear_settings_cache(site: str | None = None):
+    if site:
+        _cache.pop(site, None)
+    else:
+        _cache.clear()
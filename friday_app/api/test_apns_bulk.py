@@ -0,0 +1,99 @@
+# Copyright (c) 2025, andrej and Contributors
+# See license.txt
+
+import time
+from unittest.mock import patch
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from friday_app.api import apns_bulk, apns_client
+from friday_app.api.test_apns_client import APNsStub, make_auth_key
+
+
+class IntegrationTestAPNsBulk(IntegrationTestCase):
+	"""
+	Hromadné pushe cez multiplexované HTTP/2 streamy voči lokálnemu APNs stubu.
+	"""
+
+	def _use_stub(self, stub):
+		stub.start()
+		self.addCleanup(stub.stop)
+		conf = patch.dict(frappe.local.conf, {"apns_base_url": stub.base_url})
+		conf.start()
+		self.addCleanup(conf.stop)
+		apns_client.close_transports()
+		self.addCleanup(apns_client.close_transports)
+
+		settings = frappe._dict(
+			key_id="KEY123", team_id="TEAM123", auth_key=make_auth_key(), bundle_id="com.friday.app", is_sandbox=0
+		)
+		settings_patch = patch.object(apns_bulk, "get_apns_settings", return_value=settings)
+		settings_patch.start()
+		self.addCleanup(settings_patch.stop)
+
+	def test_per_token_results(self):
+		stub = APNsStub(respond=lambda token, headers, body: (410, "Unregistered") if token.startswith("dead") else (200, None))
+		self._use_stub(stub)
+
+		results = apns_bulk.send_bulk_notifications(["ok1", "dead1", "ok2", "ok1"], "title", "body")
+
+		self.assertEqual([r["device_token"] for r in results], ["ok1", "dead1", "ok2"])
+		self.assertEqual([r["success"] for r in results], [True, False, True])
+		self.assertEqual(results[1]["reason"], "Unregistered")
+
+	def test_wrong_topic_keeps_tokens(self):
+		# DeviceTokenNotForTopic = zlý apns_bundle_id, nie mŕtvy token
+		stub = APNsStub(respond=lambda token, headers, body: (400, "DeviceTokenNotForTopic"))
+		self._use_stub(stub)
+		device = frappe.get_doc(
+			{"doctype": "Device", "apns_token": "apns-wrong-topic", "device_type": "iOS"}
+		).insert(ignore_permissions=True)
+		logged = frappe.db.count("Error Log", {"method": "APNs Config Error"})
+
+		results = apns_bulk.send_bulk_notifications(["apns-wrong-topic"], "title", "body")
+
+		self.assertFalse(results[0]["dead"])
+		device.reload()
+		self.assertEqual(device.apns_token, "apns-wrong-topic")
+		self.assertFalse(device.invalid_reason)
+		self.assertEqual(frappe.db.count("Error Log", {"method": "APNs Config Error"}), logged + 1)
+
+	def test_fan_out_is_concurrent(self):
+		# 10k tokenov po 20 ms: sekvenčne 200 s, pri 100 streamoch ideálne 2 s
+		delay = 0.02
+		stub = APNsStub(delay=delay)
+		self._use_stub(stub)
+		tokens = [f"token{i:05d}" for i in range(10000)]
+
+		start = time.perf_counter()
+		results = apns_bulk.send_bulk_notifications(tokens, "title", "body", concurrency=100)
+		elapsed = time.perf_counter() - start
+
+		self.assertEqual(len(results), len(tokens))
+		self.assertTrue(all(r["success"] for r in results))
+		self.assertLessEqual(stub.connections, apns_client.MAX_CONNECTIONS)
+		# aspoň 20× rýchlejšie ako sekvenčne
+		self.assertLess(elapsed, len(tokens) * delay / 20)
+
+	def test_broadcast_caps_client_tokens(self):
+		stub = APNsStub()
+		self._use_stub(stub)
+		admin = frappe._dict(role="admin")
+
+		def broadcast(tokens):
+			request = frappe._dict(get_json=lambda: {"title": "t", "body": "b", "device_tokens": tokens})
+			with (
+				patch.object(apns_bulk, "get_current_user_id", return_value="admin"),
+				patch.object(apns_bulk, "get_auth_context", return_value=admin),
+				patch.object(frappe, "request", request, create=True),
+			):
+				return apns_bulk.broadcast_push()
+
+		result = broadcast(["a", "b", "a", "", "b"])
+		self.assertEqual(result["sent"], 2)
+		self.assertEqual(len(stub.requests), 2)
+
+		with patch.object(apns_bulk, "MAX_BROADCAST_TOKENS", 3):
+			self.assertRaises(frappe.ValidationError, broadcast, ["a", "b", "c", "d"])
+		self.assertEqual(len(stub.requests), 2)
@@ -0,0 +1,264 @@
+# Copyright (c) 2025, andrej and Contributors
+# See license.txt
+
+import json
+import socket
+import threading
+import time
+import uuid
+from unittest.mock import patch
+
+import frappe
+import h2.config
+import h2.connection
+import h2.events
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from frappe.tests import IntegrationTestCase
+
+from friday_app.api import apns_client
+from friday_app.api.utils import apns_result
+
+
+class APNsStub:
+	"""
+	Lokálny HTTP/2 (h2c) server, ktorý sa tvári ako APNs.
+
+	respond(device_token, headers, body) -> (status, reason | None)
+	goaway_after – po koľkých requestoch na spojení pošle GOAWAY a zavrie ho
+	delay        – oneskorenie odpovede (sekundy), odpovede idú paralelne
+	hangup       – request prijme a zavrie spojenie bez odpovede
+	"""
+
+	def __init__(self, respond=None, goaway_after=None, delay=0, hangup=False):
+		self.respond = respond or (lambda token, headers, body: (200, None))
+		self.goaway_after = goaway_after
+		self.delay = delay
+		self.hangup = hangup
+		self.connections = 0
+		self.requests = []
+		self._lock = threading.Lock()
+		self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self._sock.bind(("127.0.0.1", 0))
+		self._sock.listen(128)
+		self._stopped = False
+
+	@property
+	def base_url(self):
+		return f"http://127.0.0.1:{self._sock.getsockname()[1]}"
+
+	def start(self):
+		threading.Thread(target=self._serve, daemon=True).start()
+		return self
+
+	def stop(self):
+		self._stopped = True
+		self._sock.close()
+
+	def _serve(self):
+		while not self._stopped:
+			try:
+				conn, _ = self._sock.accept()
+			except OSError:
+				return
+			with self._lock:
+				self.connections += 1
+			threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+	def _handle(self, conn):
+		h2_conn = h2.connection.H2Connection(
+			h2.config.H2Configuration(client_side=False, header_encoding="utf-8")
+		)
+		h2_conn.local_settings.max_concurrent_streams = 1000
+		h2_conn.initiate_connection()
+		send_lock = threading.Lock()
+		conn.sendall(h2_conn.data_to_send())
+		streams = {}
+		handled = 0
+
+		def flush():
+			data = h2_conn.data_to_send()
+			if data:
+				conn.sendall(data)
+
+		def answer(stream_id, request):
+			if self.delay:
+				time.sleep(self.delay)
+			token = request["headers"].get(":path", "").rsplit("/", 1)[-1]
+			status, reason = self.respond(token, request["headers"], request["body"])
+			with self._lock:
+				self.requests.append((token, request["headers"], request["body"]))
+			body = json.dumps({"reason": reason, "timestamp": int(time.time() * 1000)}).encode() if reason else b""
+			headers = [(":status", str(status)), ("apns-id", str(uuid.uuid4()))]
+			with send_lock:
+				try:
+					h2_conn.send_headers(stream_id, headers, end_stream=not body)
+					if body:
+						h2_conn.send_data(stream_id, body, end_stream=True)
+					flush()
+				except Exception:
+					pass
+
+		try:
+			while True:
+				data = conn.recv(65535)
+				if not data:
+					break
+				with send_lock:
+					events = h2_conn.receive_data(data)
+				for event in events:
+					if isinstance(event, h2.events.RequestReceived):
+						streams[event.stream_id] = {"headers": dict(event.headers), "body": b""}
+					elif isinstance(event, h2.events.DataReceived):
+						streams[event.stream_id]["body"] += event.data
+						with send_lock:
+							h2_conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+					elif isinstance(event, h2.events.StreamEnded):
+						request = streams.pop(event.stream_id)
+						handled += 1
+						if self.hangup:
+							with self._lock:
+								self.requests.append((None, request["headers"], request["body"]))
+							return
+						if self.delay:
+							threading.Thread(target=answer, args=(event.stream_id, request), daemon=True).start()
+						else:
+							answer(event.stream_id, request)
+					elif isinstance(event, h2.events.ConnectionTerminated):
+						return
+				with send_lock:
+					if self.goaway_after and handled >= self.goaway_after:
+						h2_conn.close_connection(last_stream_id=h2_conn.highest_inbound_stream_id)
+						flush()
+						return
+					flush()
+		except OSError:
+			pass
+		finally:
+			conn.close()
+
+
+class IntegrationTestAPNsClient(IntegrationTestCase):
+	"""
+	Zdieľaný HTTP/2 transport voči lokálnemu APNs stubu.
+	"""
+
+	def _use_stub(self, stub):
+		stub.start()
+		self.addCleanup(stub.stop)
+		conf = patch.dict(frappe.local.conf, {"apns_base_url": stub.base_url})
+		conf.start()
+		self.addCleanup(conf.stop)
+		apns_client.close_transports()
+		self.addCleanup(apns_client.close_transports)
+		return apns_client.get_transport()
+
+	def test_connection_is_reused(self):
+		stub = APNsStub()
+		transport = self._use_stub(stub)
+		for i in range(20):
+			res = transport.post(f"token{i}", {"apns-push-type": "voip"}, b"{}")
+			self.assertEqual(res.status_code, 200)
+
+		self.assertIs(apns_client.get_transport(), transport)
+		self.assertEqual(stub.connections, 1)
+		stats = transport.get_stats()
+		self.assertEqual(stats["requests"], 20)
+		self.assertEqual(stats["connections"], 1)
+		self.assertEqual(stats["reused"], 19)
+
+	def test_reconnects_after_goaway(self):
+		stub = APNsStub(goaway_after=5)
+		transport = self._use_stub(stub)
+		for i in range(12):
+			res = transport.post(f"token{i}", {}, b"{}")
+			self.assertEqual(res.status_code, 200)
+
+		self.assertEqual(len(stub.requests), 12)
+		self.assertGreaterEqual(stub.connections, 3)
+		self.assertGreaterEqual(transport.get_stats()["connections"], 3)
+
+	def test_reconnects_after_idle_timeout(self):
+		stub = APNsStub()
+		transport = self._use_stub(stub)
+		transport.post("token", {}, b"{}")
+		transport._last_used -= transport.idle_timeout + 1
+		transport.post("token", {}, b"{}")
+		self.assertEqual(stub.connections, 2)
+
+	def test_no_retry_after_request_was_sent(self):
+		# Apple mohol push prijať – opakovanie by VoIP hovor zazvonilo dvakrát
+		stub = APNsStub(hangup=True)
+		transport = self._use_stub(stub)
+		with self.assertRaises(Exception) as raised:
+			transport.post("token", {}, b"{}")
+
+		self.assertEqual(len(stub.requests), 1)
+		self.assertEqual(stub.connections, 1)
+		result = apns_result(frappe._dict(), error=raised.exception)
+		self.assertFalse(result["success"])
+		self.assertFalse(result["retryable"])
+
+	def test_retries_when_connection_fails(self):
+		transport = apns_client.APNsTransport("http://127.0.0.1:9")
+		with self.assertRaises(apns_client.httpx.ConnectError) as raised:
+			transport.post("token", {}, b"{}")
+		self.assertEqual(transport.get_stats()["reconnects"], 1)
+		self.assertTrue(apns_result(frappe._dict(), error=raised.exception)["retryable"])
+
+
+def make_auth_key():
+	"""Nový ES256 (P-256) kľúč v PEM, ako .p8 súbor od Apple."""
+	return (
+		ec.generate_private_key(ec.SECP256R1())
+		.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+		.decode()
+	)
+
+
+class IntegrationTestAPNsProviderToken(IntegrationTestCase):
+	"""
+	Provider JWT sa podpisuje raz a ďalšie pushe ho len znovu použijú.
+	"""
+
+	def setUp(self):
+		self.auth_key = make_auth_key()
+		apns_client.invalidate_provider_token()
+
+	def tearDown(self):
+		apns_client.invalidate_provider_token()
+
+	def test_sign_operations_per_1000_pushes(self):
+		stub = APNsStub()
+		stub.start()
+		self.addCleanup(stub.stop)
+		conf = patch.dict(frappe.local.conf, {"apns_base_url": stub.base_url})
+		conf.start()
+		self.addCleanup(conf.stop)
+		self.addCleanup(apns_client.close_transports)
+
+		signed_before = apns_client.provider_token_stats["signed"]
+		transport = apns_client.get_transport()
+		for i in range(1000):
+			token = apns_client.get_provider_token("TEAM123", "KEY123", self.auth_key)
+			transport.post(f"token{i}", {"authorization": f"bearer {token}"}, b"{}")
+
+		signed = apns_client.provider_token_stats["signed"] - signed_before
+		self.assertEqual(signed, 1)
+		self.assertEqual(len({headers["authorization"] for _, headers, _ in stub.requests}), 1)
+
+	def test_shared_through_redis_and_refreshed(self):
+		token = apns_client.get_provider_token("TEAM123", "KEY123", self.auth_key)
+
+		# iný worker: prázdna pamäť procesu, token príde z Redisu
+		apns_client._provider_tokens.clear()
+		self.assertEqual(apns_client.get_provider_token("TEAM123", "KEY123", self.auth_key), token)
+
+		# po ~50 minútach podpíšeme nový
+		with patch.object(apns_client.time, "time", return_value=time.time() + apns_client.PROVIDER_TOKEN_TTL + 1):
+			self.assertNotEqual(apns_client.get_provider_token("TEAM123", "KEY123", self.auth_key), token)
+
+	def test_new_key_gets_new_token(self):
+		token = apns_client.get_provider_token("TEAM123", "KEY123", self.auth_key)
+		self.assertNotEqual(apns_client.get_provider_token("TEAM123", "KEY123", make_auth_key()), token)
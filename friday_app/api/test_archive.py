@@ -0,0 +1,76 @@
+# Copyright (c) 2025, andrej and Contributors
+# See license.txt
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests import IntegrationTestCase
+from frappe.utils import add_days, now_datetime
+
+from friday_app.api import archive
+from friday_app.api.test_friday import make_client
+
+
+class IntegrationTestCallArchive(IntegrationTestCase):
+	"""
+	Staré skončené hovory idú po dávkach do archívu, história číta oboje.
+	"""
+
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()
+		archive.ensure_archive_partitions()
+
+	def setUp(self):
+		commit = patch.object(frappe.db, "commit")
+		commit.start()
+		self.addCleanup(commit.stop)
+		self.caller, self.advisor = make_client(400), make_client(401)
+
+	def _call(self, days_ago, status="ended"):
+		at = add_days(now_datetime(), -days_ago)
+		call = frappe.get_doc(
+			{
+				"doctype": "Call Log",
+				"caller": self.caller.name,
+				"advisor": self.advisor.name,
+				"call_id": frappe.generate_hash(length=12),
+				"status": status,
+				"started_at": at,
+				"ended_at": at,
+			}
+		).insert(ignore_permissions=True)
+		# archivujú sa len hovory už započítané do súhrnov
+		frappe.db.sql("update `tabCall Log` set modified = %s, rolled_up = 1 where name = %s", (at, call.name))
+		return call.name
+
+	def test_archive_is_partitioned_by_month(self):
+		if frappe.db.db_type != "mariadb":
+			self.skipTest("partitioning is MariaDB only")
+		partitions = archive._partitions()
+		self.assertIn(f"p{archive._month(now_datetime())}", partitions)
+		self.assertEqual(partitions[-1], "pmax")
+
+	def test_moves_old_ended_calls_in_chunks(self):
+		old = [self._call(200 + i) for i in range(5)]
+		running = self._call(200, status="started")
+		recent = self._call(1)
+
+		self.assertEqual(archive.archive_calls(horizon=90, chunk=2), 5)
+
+		self.assertFalse(frappe.db.exists("Call Log", {"name": ("in", old)}))
+		self.assertEqual(frappe.db.count("Call Log Archive", {"name": ("in", old)}), 5)
+		self.assertTrue(frappe.db.exists("Call Log", running))
+		self.assertTrue(frappe.db.exists("Call Log", recent))
+		self.assertEqual(archive.archive_calls(horizon=90), 0)
+
+	def test_history_spans_hot_and_archive(self):
+		names = [self._call(days) for days in (1, 2, 150, 160)]
+		archive.archive_calls(horizon=90)
+
+		page = archive.call_history(self.advisor.name, limit=3)
+		self.assertEqual([c.name for c in page], names[:3])
+
+		last = page[-1]
+		rest = archive.call_history(self.advisor.name, before={"at": last.started_at, "name": last.name}, limit=3)
+		self.assertEqual([c.name for c in rest], names[3:])
@@ -0,0 +1,59 @@
+# Copyright (c) 2025, andrej and Contributors
+# See license.txt
+
+import time
+from unittest.mock import patch
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from friday_app.api import auth_context
+
+
+class IntegrationTestAuthContext(IntegrationTestCase):
+	"""
+	Opakované requesty s rovnakým tokenom nevolajú Clerk ani DB.
+	"""
+
+	def setUp(self):
+		self.user = frappe.get_doc(
+			{
+				"doctype": "Friday User",
+				"clerk_id": "user_ctx_test",
+				"email": "ctx_test@friday.test",
+				"username": "ctx_test",
+				"role": "client",
+				"status": "active",
+			}
+		).insert(ignore_permissions=True)
+		self.claims = {"sub": "user_ctx_test", "exp": int(time.time()) + 120}
+		self.verify = patch.object(auth_context, "verify_clerk_token", return_value=self.claims)
+		self.verify_mock = self.verify.start()
+
+	def tearDown(self):
+		self.verify.stop()
+		frappe.local.friday_auth = None
+
+	def _new_request(self):
+		frappe.local.friday_auth = None
+		return auth_context.get_auth_context(token="token-ctx-test")
+
+	def test_hot_path_is_cached(self):
+		self.assertEqual(self._new_request().user_id, self.user.name)
+
+		with patch.object(frappe.db, "get_value", wraps=frappe.db.get_value) as get_value:
+			for _ in range(10):
+				ctx = self._new_request()
+				self.assertEqual(ctx.user_id, self.user.name)
+				self.assertEqual(ctx.role, "client")
+			get_value.assert_not_called()
+
+		self.assertEqual(self.verify_mock.call_count, 1)
+
+	def test_ban_invalidates_cache(self):
+		self._new_request()
+		self.user.status = "banned"
+		self.user.save(ignore_permissions=True)
+
+		self.assertEqual(self._new_request().status, "banned")
+		self.assertRaises(frappe.PermissionError, auth_context.get_current_user_id)
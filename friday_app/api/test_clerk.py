@@ -0,0 +1,98 @@
+# Copyright (c) 2025, andrej and Contributors
+# See license.txt
+
+import json
+import os
+import tempfile
+import time
+from unittest.mock import patch
+
+import frappe
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from frappe.tests import IntegrationTestCase
+
+from friday_app.api import clerk
+from friday_app.api.utils import verify_clerk_token
+
+ISSUER = "https://clerk.friday.test"
+
+
+def _make_key(kid):
+	private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+	jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+	jwk.update({"kid": kid, "alg": "RS256", "use": "sig"})
+	return private_key, jwk
+
+
+def _sign(private_key, kid, **claims):
+	now = int(time.time())
+	payload = {"sub": "user_test", "iss": ISSUER, "iat": now, "nbf": now, "exp": now + 60}
+	payload.update(claims)
+	return jwt.encode(payload, private_key, algorithm="RS256", headers={"kid": kid})
+
+
+class IntegrationTestClerk(IntegrationTestCase):
+	"""
+	Lokálne overenie Clerk JWT voči stub JWKS súboru.
+	"""
+
+	def setUp(self):
+		self.private_key, jwk = _make_key("kid-1")
+		fd, self.jwks_path = tempfile.mkstemp(suffix=".json")
+		os.close(fd)
+		self._write_jwks([jwk])
+		self.conf = patch.dict(
+			frappe.local.conf,
+			{
+				"clerk_issuer": ISSUER,
+				"clerk_jwks_url": f"file://{self.jwks_path}",
+				"clerk_authorized_parties": ["https://app.friday.test"],
+				"clerk_verify_mode": None,
+			},
+		)
+		self.conf.start()
+		clerk.clear_jwks_cache()
+
+	def tearDown(self):
+		self.conf.stop()
+		clerk.clear_jwks_cache()
+		if os.path.exists(self.jwks_path):
+			os.unlink(self.jwks_path)
+
+	def _write_jwks(self, keys):
+		with open(self.jwks_path, "w") as f:
+			json.dump({"keys": keys}, f)
+
+	def test_valid_token(self):
+		token = _sign(self.private_key, "kid-1", azp="https://app.friday.test")
+		claims = verify_clerk_token(token)
+		self.assertEqual(claims["sub"], "user_test")
+
+	def test_rejected_claims(self):
+		now = int(time.time())
+		self.assertIsNone(verify_clerk_token(_sign(self.private_key, "kid-1", exp=now - 60)))
+		self.assertIsNone(verify_clerk_token(_sign(self.private_key, "kid-1", nbf=now + 600)))
+		self.assertIsNone(verify_clerk_token(_sign(self.private_key, "kid-1", iss="https://evil.test")))
+		self.assertIsNone(verify_clerk_token(_sign(self.private_key, "kid-1", azp="https://evil.test")))
+
+		other_key, _ = _make_key("kid-1")
+		self.assertIsNone(verify_clerk_token(_sign(other_key, "kid-1")))
+
+	def test_jwks_cached_and_refreshed_on_unknown_kid(self):
+		with patch.object(clerk, "_fetch_jwks", wraps=clerk._fetch_jwks) as fetch:
+			for _ in range(5):
+				self.assertTrue(verify_clerk_token(_sign(self.private_key, "kid-1")))
+			self.assertEqual(fetch.call_count, 1)
+
+			# Clerk rotoval kľúč
+			rotated_key, rotated_jwk = _make_key("kid-2")
+			self._write_jwks([rotated_jwk])
+			self.assertTrue(verify_clerk_token(_sign(rotated_key, "kid-2")))
+			self.assertEqual(fetch.call_count, 2)
+
+	def test_fallback_to_remote_when_jwks_unavailable(self):
+		os.unlink(self.jwks_path)
+		with patch("friday_app.api.utils.verify_clerk_token_remote", return_value={"sub": "remote"}) as remote:
+			self.assertEqual(verify_clerk_token(_sign(self.private_key, "kid-1")), {"sub": "remote"})
+			remote.assert_called_once()
@@ -0,0 +1,230 @@
+# Copyright (c) 2025, andrej and Contributors
+# See license.txt
+
+import time
+from datetime import datetime
+from unittest.mock import patch
+
+import frappe
+from frappe.tests import IntegrationTestCase
+from frappe.utils import add_to_date
+
+from friday_app.api import call_state, friday, metering
+from friday_app.api.friday import admin_clients
+
+
+def make_client(idx, minutes=(60,), devices=1):
+	user = frappe.get_doc(
+		{
+			"doctype": "Friday User",
+			"clerk_id": f"user_admin_clients_{idx}",
+			"email": f"admin_clients_{idx}@friday.test",
+			"username": f"admin_clients_{idx}",
+			"role": "client",
+			"status": "active",
+		}
+	).insert(ignore_permissions=True)
+	for d in range(devices):
+		frappe.get_doc(
+			{"doctype": "Device", "user": user.name, "voip_token": f"voip-{idx}-{d}", "apns_token": f"apns-{idx}-{d}"}
+		).insert(ignore_permissions=True)
+	for m in minutes:
+		frappe.get_doc(
+			{"doctype": "Friday Token", "owner_user": user.name, "minutes_remaining": m, "status": "active"}
+		).insert(ignore_permissions=True)
+	return user
+
+
+class IntegrationTestAdminClients(IntegrationTestCase):
+	"""
+	admin_clients robí konštantný počet dotazov bez ohľadu na počet klientov.
+	"""
+
+	def _query_count(self, **kwargs):
+		admin_clients(**kwargs)  # zahreje meta cache
+		queries = []
+		original_sql = frappe.db.sql
+
+		def counting_sql(*args, **kw):
+			queries.append(args[0])
+			return original_sql(*args, **kw)
+
+		frappe.db.sql = counting_sql
+		try:
+			admin_clients(**kwargs)
+		finally:
+			frappe.db.sql = original_sql
+		return len(queries)
+
+	def test_constant_query_count(self):
+		for i in range(3):
+			make_client(i)
+		few = self._query_count(limit=500)
+
+		for i in range(3, 30):
+			make_client(i, minutes=(30, 15), devices=2)
+		many = self._query_count(limit=500)
+
+		self.assertEqual(few, many)
+		self.assertLessEqual(many, 3)
+
+	def test_keyset_pagination_and_aggregates(self):
+		created = {make_client(i, minutes=(30, 15), devices=2).name for i in range(5)}
+
+		seen, after = [], None
+		while True:
+			page = admin_clients(after=after, limit=2)
+			seen.extend(c for c in page["clients"] if c["id"] in created)
+			after = page["next"]
+			if not after:
+				break
+
+		self.assertEqual({c["id"] for c in seen}, created)
+		self.assertEqual(len(seen), len(created))
+		self.assertTrue(all(c["totalActiveMinutes"] == 45 and c["deviceCount"] == 2 for c in seen))
+
+	def test_field_projection(self):
+		make_client(99)
+		client = admin_clients(fields="deviceCount")["clients"][0]
+		self.assertEqual(set(client), {"id", "deviceCount"})
+
+
+class IntegrationTestEndCall(IntegrationTestCase):
+	"""
+	end_call nájde hovor podľa call_id pod zámkom a ukončí ho jedným zápisom.
+	"""
+
+	def _end_call(self, user, call_id, duration):
+		frappe.local.request = frappe._dict(get_json=lambda: {"call_id": call_id, "duration": duration})
+		self.addCleanup(setattr, frappe.local, "request", None)
+		ctx = frappe._dict(user_id=user.name, role=user.role)
+		with (
+			patch.object(friday, "get_current_user_id", return_value=user.name),
+			patch.object(friday, "get_auth_context", return_value=ctx),
+		):
+			return friday.end_call()
+
+	def _call(self, caller, advisor, seconds_ago=0):
+		return frappe.get_doc(
+			{
+				"doctype": "Call Log",
+				"caller": caller.name,
+				"advisor": advisor.name,
+				"call_id": frappe.generate_hash(length=12),
+				"status": "started",
+				"started_at": add_to_date(datetime.utcnow(), seconds=-seconds_ago),
+			}
+		).insert(ignore_permissions=True)
+
+	def test_call_id_is_the_name(self):
+		caller, advisor = make_client(200), make_client(201)
+		call = self._call(caller, advisor)
+		self.assertEqual(call.name, call.call_id)
+
+	def test_end_call_deducts_once(self):
+		caller, advisor = make_client(202, minutes=(5, 10)), make_client(203)
+		call = self._call(caller, advisor, seconds_ago=390)
+
+		# dĺžku určuje server (6,5 min → 7 minút), nie "duration" od klienta
+		result = self._end_call(advisor, call.call_id, 1)
+		self.assertEqual((result["deducted"], result["missing"]), (7, 0))
+
+		call.reload()
+		self.assertEqual(call.status, "ended")
+		self.assertEqual(call.billed_minutes, 7)
+		self.assertAlmostEqual(call.duration, 390, delta=5)
+		self.assertEqual([t["minutes"] for t in frappe.parse_json(call.token_usage)], [5, 2])
+
+		again = self._end_call(caller, call.call_id, 7)
+		self.assertTrue(again["already_ended"])
+		self.assertEqual(friday.get_balance(caller.name)["total_minutes"], 8)
+
+	def test_stranger_cannot_end_call(self):
+		caller, advisor, stranger = make_client(204), make_client(205), make_client(206)
+		call = self._call(caller, advisor)
+		self.assertFalse(self._end_call(stranger, call.call_id, 3)["success"])
+		self.assertFalse(self._end_call(caller, "missing-call", 3)["success"])
+
+
+class IntegrationTestCallState(IntegrationTestCase):
+	"""
+	ringing → accepted/declined/missed → ended, každý prechod ide do signal room.
+	"""
+
+	def setUp(self):
+		self.caller, self.advisor = make_client(210, minutes=(30,)), make_client(211)
+		self.published = []
+		publish = patch.object(
+			frappe,
+			"publish_realtime",
+			side_effect=lambda event, message, task_id=None, after_commit=False: self.published.append(
+				(task_id, message["status"], time.perf_counter())
+			),
+		)
+		publish.start()
+		self.addCleanup(publish.stop)
+		self.addCleanup(setattr, frappe.local, "request", None)
+
+	def _post(self, user, fn, **data):
+		frappe.local.request = frappe._dict(get_json=lambda: data)
+		ctx = frappe._dict(user_id=user.name, role=user.role)
+		with (
+			patch.object(friday, "get_current_user_id", return_value=user.name),
+			patch.object(friday, "get_auth_context", return_value=ctx),
+		):
+			return fn()
+
+	def _ringing(self):
+		return frappe.get_doc(
+			{
+				"doctype": "Call Log",
+				"caller": self.caller.name,
+				"advisor": self.advisor.name,
+				"call_id": frappe.generate_hash(length=12),
+				"status": "ringing",
+				"started_at": datetime.utcnow(),
+				"signal_room": call_state.new_signal_room(),
+			}
+		).insert(ignore_permissions=True)
+
+	def test_accept_is_idempotent_and_published(self):
+		call = self._ringing()
+		self.addCleanup(metering.unregister_call, call.name)
+
+		start = time.perf_counter()
+		self.assertEqual(self._post(self.advisor, friday.accept_call, call_id=call.name)["status"], "accepted")
+		room, status, published_at = self.published[-1]
+		self.assertEqual((room, status), (call.signal_room, "accepted"))
+		# prechod je jeden zamknutý SELECT + jeden UPDATE
+		self.assertLess(published_at - start, 0.5)
+
+		again = self._post(self.advisor, friday.accept_call, call_id=call.name)
+		self.assertTrue(again["already"])
+		self.assertEqual(len(self.published), 1)
+		self.assertIsNotNone(metering.last_heartbeat(call.name))
+
+		declined = self._post(self.advisor, friday.decline_call, call_id=call.name)
+		self.assertFalse(declined["success"])
+
+	def test_only_advisor_answers(self):
+		call = self._ringing()
+		self.assertFalse(self._post(self.caller, friday.accept_call, call_id=call.name)["success"])
+		self.assertEqual(self._post(self.advisor, friday.decline_call, call_id=call.name)["status"], "declined")
+		self.assertEqual(frappe.db.get_value("Call Log", call.name, "status"), "declined")
+
+	def test_caller_hangs_up_while_ringing(self):
+		call = self._ringing()
+		result = self._post(self.caller, friday.end_call, call_id=call.name)
+		self.assertEqual((result["status"], result["deducted"]), ("missed", 0))
+		self.assertEqual(self.published[-1][1], "missed")
+		self.assertEqual(friday.get_balance(self.caller.name)["total_minutes"], 30)
+
+	def test_unanswered_calls_expire(self):
+		call = self._ringing()
+		frappe.db.set_value(
+			"Call Log", call.name, "started_at", add_to_date(datetime.utcnow(), seconds=-call_state.ring_timeout() - 5)
+		)
+		with patch.object(frappe.db, "commit"):
+			self.assertGreaterEqual(call_state.expire_ringing_calls(), 1)
+		self.assertEqual(frappe.db.get_value("Call Log", call.name, "status"), "missed")
+		self.assertIn((call.signal_room, "missed"), [(room, status) for room, status, _ in self.published])
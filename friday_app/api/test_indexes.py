@@ -0,0 +1,129 @@
+# Copyright (c) 2025, andrej and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from friday_app.api.indexes import COMPOSITE_INDEXES, ensure_indexes
+
+# horúce dotazy z API – žiadny nesmie skončiť na full table scan
+HOT_QUERIES = {
+	"deduct_minutes": (
+		"""select name, minutes_remaining from `tabFriday Token`
+		where owner_user = %(user)s and status = 'active' and minutes_remaining > 0
+		order by created_at asc, creation asc, name asc""",
+		"tabFriday Token",
+	),
+	"balance_rebuild_user": (
+		"""select owner_user, sum(minutes_remaining), count(*) from `tabFriday Token`
+		where status = 'active' and owner_user = %(user)s group by owner_user""",
+		"tabFriday Token",
+	),
+	"device_by_user": (
+		"""select voip_token, apns_token from `tabDevice`
+		where user = %(user)s order by last_seen_at desc limit 10""",
+		"tabDevice",
+	),
+	"call_log_by_call_id": (
+		"select name, status from `tabCall Log` where name = %(call_id)s",
+		"tabCall Log",
+	),
+	"marketplace_listings": (
+		"select name, price_eur from `tabFriday Listing` where status = 'open' order by price_eur asc limit 50",
+		"tabFriday Listing",
+	),
+	"payment_by_session": (
+		"select name from `tabPayment` where stripe_session_id = %(session)s",
+		"tabPayment",
+	),
+	"payment_by_intent": (
+		"select name from `tabPayment` where stripe_payment_intent = %(intent)s",
+		"tabPayment",
+	),
+}
+
+
+class IntegrationTestHotQueryPlans(IntegrationTestCase):
+	"""
+	EXPLAIN nad naseedovanými dátami: horúce dotazy idú cez index.
+	"""
+
+	SEED = 400
+
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()
+		ensure_indexes()
+		cls.user = cls._seed()
+		for table in {table for _, table in HOT_QUERIES.values()}:
+			frappe.db.sql(f"analyze table `{table}`")
+
+	@classmethod
+	def _seed(cls):
+		users = []
+		for i in range(20):
+			users.append(
+				frappe.get_doc(
+					{
+						"doctype": "Friday User",
+						"clerk_id": f"user_plan_{i}",
+						"email": f"plan_{i}@friday.test",
+						"username": f"plan_{i}",
+						"role": "client",
+						"status": "active",
+					}
+				).insert(ignore_permissions=True).name
+			)
+
+		for i in range(cls.SEED):
+			user = users[i % len(users)]
+			frappe.get_doc(
+				{
+					"doctype": "Friday Token",
+					"owner_user": user,
+					"minutes_remaining": 60,
+					"status": ("active", "listed", "spent")[i % 3],
+				}
+			).insert(ignore_permissions=True)
+			frappe.get_doc(
+				{
+					"doctype": "Friday Listing",
+					"seller": user,
+					"price_eur": 10 + i % 50,
+					"status": ("open", "sold", "cancelled")[i % 3],
+				}
+			).insert(ignore_permissions=True)
+			frappe.get_doc(
+				{"doctype": "Device", "user": user, "voip_token": f"plan-voip-{i}", "apns_token": f"plan-apns-{i}"}
+			).insert(ignore_permissions=True)
+			frappe.get_doc(
+				{"doctype": "Call Log", "caller": user, "call_id": f"plan-call-{i}", "status": "ended"}
+			).insert(ignore_permissions=True)
+			frappe.get_doc(
+				{
+					"doctype": "Payment",
+					"buyer": user,
+					"stripe_session_id": f"cs_plan_{i}",
+					"stripe_payment_intent": f"pi_plan_{i}",
+					"status": "paid",
+				}
+			).insert(ignore_permissions=True)
+		return users[0]
+
+	def _plan(self, name):
+		query, table = HOT_QUERIES[name]
+		params = {"user": self.user, "call_id": "plan-call-7", "session": "cs_plan_7", "intent": "pi_plan_7"}
+		return [r for r in frappe.db.sql(f"explain {query}", params, as_dict=True) if r.table == table]
+
+	def test_composite_indexes_exist(self):
+		for doctype, _, index_name in COMPOSITE_INDEXES:
+			self.assertTrue(frappe.db.has_index(f"tab{doctype}", index_name), index_name)
+
+	def test_no_full_table_scans(self):
+		for name in HOT_QUERIES:
+			with self.subTest(query=name):
+				plan = self._plan(name)
+				self.assertTrue(plan, name)
+				for row in plan:
+					self.assertNotEqual(row.type, "ALL", f"{name}: {row}")
+					self.assertTrue(row.key, f"{name}: {row}")
@@ -0,0 +1,65 @@
+# Copyright (c) 2025, andrej and Contributors
+# See license.txt
+
+import time
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from friday_app.api.balance import get_balance, verify_balances
+from friday_app.api.issuance import MINUTES_PER_TOKEN, issue_tokens_for_payment
+
+
+class IntegrationTestTokenIssuance(IntegrationTestCase):
+	"""
+	Hromadné vydanie tokenov pre jednu platbu: viacriadkové INSERTy, idempotentné podľa Payment.
+	"""
+
+	def setUp(self):
+		self.user = frappe.get_doc(
+			{
+				"doctype": "Friday User",
+				"clerk_id": "user_issuance",
+				"email": "issuance@friday.test",
+				"username": "issuance",
+				"role": "client",
+				"status": "active",
+			}
+		).insert(ignore_permissions=True).name
+
+	def _payment(self, quantity, amount):
+		return frappe.get_doc(
+			{
+				"doctype": "Payment",
+				"buyer": self.user,
+				"type": "friday_purchase",
+				"quantity": quantity,
+				"year": 2025,
+				"amount_eur": amount,
+				"status": "pending",
+			}
+		).insert(ignore_permissions=True).name
+
+	def test_issues_tokens_items_and_ledger_once(self):
+		payment = self._payment(3, 30)
+		self.assertEqual(issue_tokens_for_payment(payment), 3)
+		self.assertEqual(issue_tokens_for_payment(payment), 0)
+
+		tokens = frappe.get_all("Friday Token", filters={"owner_user": self.user}, fields=["name", "original_price_eur"])
+		self.assertEqual(len(tokens), 3)
+		self.assertTrue(all(t.original_price_eur == 10 for t in tokens))
+		self.assertEqual(frappe.db.count("Friday Purchase Item", {"payment": payment}), 3)
+		self.assertEqual(
+			frappe.db.get_value("Transaction", {"payment": payment}, "seconds_delta"), 3 * MINUTES_PER_TOKEN * 60
+		)
+		self.assertEqual(get_balance(self.user), {"total_minutes": 3 * MINUTES_PER_TOKEN, "active_tokens": 3})
+		self.assertEqual(verify_balances(self.user), [])
+
+	def test_large_purchase_is_fast(self):
+		payment = self._payment(500, 5000)
+		start = time.perf_counter()
+		issue_tokens_for_payment(payment)
+		elapsed = time.perf_counter() - start
+
+		self.assertEqual(frappe.db.count("Friday Token", {"owner_user": self.user}), 500)
+		self.assertLess(elapsed, 0.5)
@@ -0,0 +1,133 @@
+# Copyright (c) 2025, andrej and Contributors
+# See license.txt
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests import IntegrationTestCase
+from frappe.utils import add_to_date, now_datetime
+
+from friday_app.api import ledger
+from friday_app.api.balance import get_balance
+from friday_app.api.utils import deduct_minutes_from_user
+from friday_app.patches import ledger_opening_balances
+
+
+class IntegrationTestLedger(IntegrationTestCase):
+	"""
+	Append-only ledger: poradie, zostatok po zápise, snapshoty a výpis = snapshot + chvost.
+	"""
+
+	def setUp(self):
+		self.user = frappe.get_doc(
+			{
+				"doctype": "Friday User",
+				"clerk_id": "user_ledger",
+				"email": "ledger@friday.test",
+				"username": "ledger",
+				"role": "client",
+				"status": "active",
+			}
+		).insert(ignore_permissions=True).name
+		enqueue = patch.object(frappe, "enqueue")
+		self.enqueue = enqueue.start()
+		self.addCleanup(enqueue.stop)
+
+	def _record(self, count, seconds=60, tx_type="friday_purchase"):
+		return ledger.record_entries(
+			[{"user": self.user, "type": tx_type, "seconds_delta": seconds, "amount_eur": 1} for _ in range(count)]
+		)
+
+	def _naive(self, at=None):
+		filters = {"user": self.user}
+		if at:
+			filters["created_at"] = ("<=", at)
+		return sum(frappe.get_all("Transaction", filters=filters, pluck="seconds_delta"))
+
+	def test_sequence_and_running_balance(self):
+		self._record(3)
+		self._record(2, seconds=-30, tx_type="call_usage")
+		rows = frappe.get_all(
+			"Transaction", filters={"user": self.user}, fields=["seq", "balance_after_seconds"], order_by="seq asc"
+		)
+		self.assertEqual([r.seq for r in rows], [1, 2, 3, 4, 5])
+		self.assertEqual([r.balance_after_seconds for r in rows], [60, 120, 180, 150, 120])
+
+	def test_snapshot_every_n_entries(self):
+		self._record(ledger.SNAPSHOT_EVERY - 1)
+		self.enqueue.assert_not_called()
+		self._record(2)
+		self.assertEqual(self.enqueue.call_args.kwargs["user"], self.user)
+
+		ledger.write_snapshot(self.user)
+		self._record(5, seconds=-60, tx_type="call_usage")
+
+		position = ledger.position_at(self.user)
+		self.assertEqual(position["seq"], ledger.SNAPSHOT_EVERY + 6)
+		self.assertEqual(position["balance_seconds"], self._naive())
+		self.assertEqual(position["totals"]["call_usage"][0], -300)
+
+	def test_statement_matches_full_scan(self):
+		self._record(50)
+		ledger.write_snapshot(self.user)
+		middle = now_datetime()
+		earlier = add_to_date(middle, seconds=-1)
+		frappe.db.sql("update `tabTransaction` set created_at = %s where user = %s", (earlier, self.user))
+		frappe.db.sql("update `tabTransaction Snapshot` set as_of = %s where user = %s", (earlier, self.user))
+		self._record(10, seconds=-60, tx_type="call_usage")
+
+		result = ledger.statement(self.user, from_date=middle)
+		self.assertEqual(result["opening_seconds"], self._naive(middle))
+		self.assertEqual(result["closing_seconds"], self._naive())
+		self.assertEqual(result["entries"], 10)
+		self.assertEqual(result["by_type"], {"call_usage": {"seconds": -600, "amount_eur": 10}})
+
+	def _rows_read(self):
+		status = dict(frappe.db.sql("show session status like 'Handler_read%'"))
+		return sum(int(status.get(k, 0)) for k in ("Handler_read_next", "Handler_read_prev", "Handler_read_rnd_next"))
+
+	def test_old_position_reads_one_snapshot_interval(self):
+		# 8 dní histórie, snapshot po každom dni
+		block, days = 50, 8
+		start = add_to_date(now_datetime(), days=-days)
+		for day in range(days):
+			self._record(block)
+			frappe.db.sql(
+				"update `tabTransaction` set created_at = %s where user = %s and seq > %s",
+				(add_to_date(start, days=day), self.user, day * block),
+			)
+			ledger.write_snapshot(self.user)
+		at = add_to_date(start, days=1, hours=1)
+
+		before = self._rows_read()
+		position = ledger.position_at(self.user, at)
+		scanned = self._rows_read() - before
+
+		self.assertEqual(position["balance_seconds"], self._naive(at))
+		# chvost končí na nasledujúcom snapshote – nie na všetkých neskorších dňoch
+		self.assertLess(scanned, 2 * block)
+
+	def test_entries_are_append_only(self):
+		name = self._record(1)[0]
+		doc = frappe.get_doc("Transaction", name)
+		doc.note = "changed"
+		self.assertRaises(frappe.ValidationError, doc.save, ignore_permissions=True)
+		self.assertRaises(frappe.ValidationError, doc.delete, ignore_permissions=True)
+
+	def test_opening_balance_patch(self):
+		# minúty spred zavedenia ledgera – hlavička je na nule
+		frappe.get_doc(
+			{"doctype": "Friday Token", "owner_user": self.user, "minutes_remaining": 45, "status": "active"}
+		).insert(ignore_permissions=True)
+		with patch.object(frappe.db, "commit"):
+			ledger_opening_balances.execute()
+			ledger_opening_balances.execute()
+
+		rows = frappe.get_all(
+			"Transaction", filters={"user": self.user}, fields=["type", "seq", "balance_after_seconds"]
+		)
+		self.assertEqual(rows, [{"type": "opening_balance", "seq": 1, "balance_after_seconds": 45 * 60}])
+
+		deduct_minutes_from_user(self.user, 5)
+		self.assertEqual(ledger.position_at(self.user)["balance_seconds"], get_balance(self.user)["total_minutes"] * 60)
+		self.assertEqual(frappe.db.get_value("Friday Balance", self.user, "ledger_seconds"), 40 * 60)
@@ -0,0 +1,194 @@
+# Copyright (c) 2025, andrej and Contributors
+# See license.txt
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from friday_app.api import market
+from friday_app.patches import backfill_listing_issued_year
+
+YEAR = 2031
+
+
+class IntegrationTestOrderBook(IntegrationTestCase):
+	"""
+	Order book v Redise: price-time poradie, hĺbka, obchod bez dvojitého predaja pri súbehu.
+	"""
+
+	def setUp(self):
+		self.users = []
+		self.seller = self._user("seller")
+		frappe.db.commit()
+		self.addCleanup(self._cleanup)
+		market.rebuild_order_book()
+
+	def _user(self, suffix):
+		name = frappe.get_doc(
+			{
+				"doctype": "Friday User",
+				"clerk_id": f"user_market_{suffix}",
+				"email": f"market_{suffix}@friday.test",
+				"username": f"market_{suffix}",
+				"role": "client",
+				"status": "active",
+			}
+		).insert(ignore_permissions=True).name
+		self.users.append(name)
+		return name
+
+	def _list(self, price, year=YEAR):
+		token = frappe.get_doc(
+			{
+				"doctype": "Friday Token",
+				"owner_user": self.seller,
+				"issued_year": year,
+				"minutes_remaining": 60,
+				"status": "listed",
+			}
+		).insert(ignore_permissions=True)
+		return frappe.get_doc(
+			{"doctype": "Friday Listing", "token": token.name, "seller": self.seller, "price_eur": price, "status": "open"}
+		).insert(ignore_permissions=True).name
+
+	def _cleanup(self):
+		frappe.db.rollback()
+		listings = frappe.get_all("Friday Listing", filters={"seller": self.seller}, pluck="name")
+		for listing in listings:
+			market.remove_from_book(listing)
+		frappe.db.delete("Transaction", {"user": ("in", self.users)})
+		frappe.db.delete("Friday Trade", {"seller": self.seller})
+		frappe.db.delete("Friday Listing", {"seller": self.seller})
+		frappe.db.delete("Friday Token", {"owner_user": ("in", self.users)})
+		frappe.db.delete("Friday Balance", {"user": ("in", self.users)})
+		frappe.db.delete("Friday User", {"name": ("in", self.users)})
+		frappe.db.commit()
+
+	def test_price_time_priority_and_depth(self):
+		first_ten = self._list(10)
+		self._list(12)
+		self._list(10)
+		cheapest = self._list(9)
+		frappe.db.commit()
+
+		self.assertEqual(market.best_offer(YEAR), {"listing": cheapest, "price_eur": 9.0})
+		self.assertEqual(
+			market.book_depth(YEAR, 5),
+			[{"price_eur": 9.0, "count": 1}, {"price_eur": 10.0, "count": 2}, {"price_eur": 12.0, "count": 1}],
+		)
+
+		buyer = self._user("buyer")
+		market.execute_buy(buyer, YEAR)
+		frappe.db.commit()
+		trade = market.execute_buy(buyer, YEAR, max_price=11)
+		frappe.db.commit()
+		self.assertEqual(trade["listing"], first_ten)
+		self.assertEqual(frappe.db.get_value("Friday Token", trade["token"], "owner_user"), buyer)
+		self.assertEqual(market.best_offer(YEAR)["price_eur"], 10.0)
+
+		self.assertIsNone(market.execute_buy(buyer, YEAR, max_price=5))
+
+	def test_issued_year_backfill_patch(self):
+		# ponuka spred zavedenia issued_year
+		listing = self._list(14)
+		frappe.db.set_value("Friday Listing", listing, "issued_year", 0)
+		frappe.db.commit()
+		market.rebuild_order_book()
+		self.assertIsNone(market.best_offer(YEAR))
+
+		backfill_listing_issued_year.execute()
+		frappe.db.commit()
+		self.assertEqual(frappe.db.get_value("Friday Listing", listing, "issued_year"), YEAR)
+		self.assertEqual(market.best_offer(YEAR), {"listing": listing, "price_eur": 14.0})
+
+	def test_rebuild_matches_db(self):
+		listing = self._list(15)
+		frappe.db.commit()
+		frappe.db.set_value("Friday Listing", listing, "status", "cancelled")
+		frappe.db.commit()
+
+		# set_value obchádza controller – kniha je neaktuálna, rebuild ju opraví
+		market.rebuild_order_book()
+		self.assertIsNone(market.best_offer(YEAR))
+
+	def test_concurrent_buyers_never_double_sell(self):
+		listings = {self._list(10 + i % 5) for i in range(30)}
+		buyers = [self._user(f"buyer_{i}") for i in range(60)]
+		frappe.db.commit()
+		site = frappe.local.site
+
+		def buy(buyer):
+			frappe.init(site=site)
+			frappe.connect()
+			try:
+				start = time.perf_counter()
+				trade = market.execute_buy(buyer, YEAR)
+				frappe.db.commit()
+				return trade, time.perf_counter() - start
+			finally:
+				frappe.destroy()
+
+		with ThreadPoolExecutor(max_workers=16) as pool:
+			results = list(pool.map(buy, buyers))
+
+		trades = [t for t, _ in results if t]
+		# podmienený claim – kupujúci nečakajú na zámok celej knihy
+		self.assertLess(max(w for _, w in results), 5)
+
+		self.assertEqual(len(trades), len(listings))
+		self.assertEqual({t["listing"] for t in trades}, listings)
+		self.assertEqual(frappe.db.count("Friday Trade", {"listing": ("in", list(listings))}), len(listings))
+		self.assertIsNone(market.best_offer(YEAR))
+
+	def _browse(self, etag=None, **kwargs):
+		frappe.local.request = frappe._dict(headers={"If-None-Match": etag} if etag else {})
+		self.addCleanup(setattr, frappe.local, "request", None)
+		with patch.object(market, "get_current_user_id", return_value=self.seller):
+			return market.browse(**kwargs)
+
+	def test_browse_keyset_pages_and_summary(self):
+		created = [self._list(price) for price in (14, 11, 11, 13, 12)]
+		frappe.db.commit()
+
+		seen, after = [], None
+		while True:
+			page = market.browse_listings(year=YEAR, after=after, limit=2)
+			seen.extend(page["listings"])
+			after = page["next"]
+			if not after:
+				break
+
+		self.assertEqual(sorted(l["id"] for l in seen), sorted(created))
+		self.assertEqual([l["price_eur"] for l in seen], [11, 11, 12, 13, 14])
+		self.assertEqual(
+			[l["price_eur"] for l in market.browse_listings(year=YEAR, min_price=12, max_price=13)["listings"]],
+			[12, 13],
+		)
+
+		market.execute_buy(self._user("summary_buyer"), YEAR)
+		frappe.db.commit()
+		summary = market.market_summary(YEAR)[0]
+		self.assertEqual(
+			(summary["listings"], summary["floor_price_eur"], summary["last_trade_price_eur"]), (4, 11.0, 11.0)
+		)
+
+	def test_browse_etag_returns_304_until_market_changes(self):
+		self._list(20)
+		frappe.db.commit()
+
+		first = self._browse(year=YEAR)
+		self.assertEqual(first.status_code, 200)
+		etag = first.headers["ETag"]
+		self.assertEqual(len(json.loads(first.get_data())["message"]["listings"]), 1)
+
+		self.assertEqual(self._browse(etag=etag, year=YEAR).status_code, 304)
+
+		self._list(21)
+		frappe.db.commit()
+		changed = self._browse(etag=etag, year=YEAR)
+		self.assertEqual(changed.status_code, 200)
+		self.assertNotEqual(changed.headers["ETag"], etag)
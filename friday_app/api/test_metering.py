@@ -0,0 +1,140 @@
+# Copyright (c) 2025, andrej and Contributors
+# See license.txt
+
+import time
+from datetime import datetime
+from unittest.mock import patch
+
+import frappe
+from frappe.tests import IntegrationTestCase
+from frappe.utils import add_to_date
+
+from friday_app.api import ledger, metering
+from friday_app.api.balance import get_balance, verify_balances
+from friday_app.api.test_friday import make_client
+
+
+class IntegrationTestMetering(IntegrationTestCase):
+	"""
+	Heartbeaty idú len do Redisu, flush_call_meters dofakturuje a ukončí mŕtve hovory.
+	"""
+
+	def _call(self, caller, advisor, seconds_ago):
+		call = frappe.get_doc(
+			{
+				"doctype": "Call Log",
+				"caller": caller.name,
+				"advisor": advisor.name,
+				"call_id": frappe.generate_hash(length=12),
+				"status": "started",
+				"started_at": add_to_date(datetime.utcnow(), seconds=-seconds_ago),
+			}
+		).insert(ignore_permissions=True)
+		metering.register_call(call.name, caller.name, advisor.name)
+		self.addCleanup(metering.unregister_call, call.name)
+		return call
+
+	def _heartbeat(self, user, call_id):
+		with patch.object(metering, "get_current_user_id", return_value=user.name):
+			return metering.heartbeat(call_id)
+
+	def _flush(self):
+		# flusher commituje po dávkach – v teste ostávame v jednej transakcii
+		with patch.object(frappe.db, "commit"):
+			metering.flush_call_meters()
+
+	def test_heartbeat_is_participant_only(self):
+		caller, advisor, stranger = make_client(300), make_client(301), make_client(302)
+		call = self._call(caller, advisor, seconds_ago=10)
+		self.assertTrue(self._heartbeat(advisor, call.name)["active"])
+		self.assertFalse(self._heartbeat(stranger, call.name)["active"])
+		self.assertFalse(self._heartbeat(caller, "missing-call")["active"])
+
+	def test_heartbeat_while_ringing(self):
+		caller, advisor, stranger = make_client(312), make_client(313), make_client(314)
+		call = frappe.get_doc(
+			{
+				"doctype": "Call Log",
+				"caller": caller.name,
+				"advisor": advisor.name,
+				"call_id": frappe.generate_hash(length=12),
+				"status": "ringing",
+				"started_at": datetime.utcnow(),
+			}
+		).insert(ignore_permissions=True)
+		metering.register_ringing(call.name, caller.name, advisor.name)
+		self.addCleanup(metering.unregister_call, call.name)
+
+		# stav zvonenia je v Redise – heartbeat nesmie ísť do DB
+		with patch.object(frappe.db, "sql", side_effect=AssertionError("heartbeat hit the DB")):
+			result = self._heartbeat(caller, call.name)
+			self.assertEqual((result["active"], result["state"]), (True, "ringing"))
+			self.assertEqual(self._heartbeat(stranger, call.name)["state"], "ended")
+
+		metering.register_call(call.name, caller.name, advisor.name)
+		self.assertEqual(self._heartbeat(advisor, call.name)["state"], "active")
+		self.assertEqual(frappe.cache().ttl(metering._key(metering.CALL_KEY + call.name)), -1)
+
+		# odmietnutie / missed zmaže meta hash
+		metering.unregister_call(call.name)
+		self.assertEqual(self._heartbeat(caller, call.name), {"success": True, "active": False, "state": "ended"})
+
+	def test_flush_bills_incrementally(self):
+		caller, advisor = make_client(303, minutes=(60,)), make_client(304)
+		call = self._call(caller, advisor, seconds_ago=150)
+
+		self._flush()
+		call.reload()
+		self.assertEqual((call.status, call.billed_minutes), ("started", 3))
+
+		# ďalší flush v tej istej minúte nič neodpočíta
+		self._flush()
+		call.reload()
+		self.assertEqual(call.billed_minutes, 3)
+		self.assertEqual(get_balance(caller.name)["total_minutes"], 57)
+
+	def test_silent_call_is_auto_ended(self):
+		caller, advisor = make_client(305, minutes=(60,)), make_client(306)
+		call = self._call(caller, advisor, seconds_ago=200)
+		# posledný heartbeat 20 s po začiatku, odvtedy ticho dlhšie ako timeout
+		last = time.time() - 180
+		frappe.cache().zadd(metering._key(metering.ACTIVE_KEY), {call.name: last})
+
+		self._flush()
+		call.reload()
+		self.assertEqual(call.status, "ended")
+		# fakturuje sa len do posledného heartbeatu
+		self.assertEqual(call.billed_minutes, 1)
+		self.assertIsNone(metering.last_heartbeat(call.name))
+		self.assertFalse(self._heartbeat(caller, call.name)["active"])
+
+	def test_out_of_minutes_stops_call(self):
+		caller, advisor = make_client(307, minutes=(2,)), make_client(308)
+		call = self._call(caller, advisor, seconds_ago=300)
+
+		self._flush()
+		call.reload()
+		self.assertEqual(call.billed_minutes, 2)
+		result = self._heartbeat(caller, call.name)
+		self.assertEqual((result["active"], result["reason"]), (False, "no_minutes"))
+
+	def test_flush_deducts_for_all_calls_at_once(self):
+		caller, other, advisor = make_client(309, minutes=(60,)), make_client(310, minutes=(60,)), make_client(311)
+		calls = [
+			self._call(caller, advisor, seconds_ago=150),
+			self._call(caller, advisor, seconds_ago=150),
+			self._call(other, advisor, seconds_ago=90),
+		]
+
+		with patch.object(frappe.db, "sql", wraps=frappe.db.sql) as sql:
+			self._flush()
+		token_locks = [
+			c for c in sql.call_args_list if "`tabFriday Token`" in str(c.args[0]) and "for update" in str(c.args[0])
+		]
+		self.assertEqual(len(token_locks), 1)
+
+		self.assertEqual([frappe.db.get_value("Call Log", c.name, "billed_minutes") for c in calls], [3, 3, 2])
+		self.assertEqual(get_balance(caller.name)["total_minutes"], 54)
+		self.assertEqual(get_balance(other.name)["total_minutes"], 58)
+		self.assertEqual(verify_balances(caller.name) + verify_balances(other.name), [])
+		self.assertEqual(ledger.position_at(caller.name)["totals"]["call_usage"][0], -6 * 60)
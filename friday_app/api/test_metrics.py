@@ -0,0 +1,108 @@
+# Copyright (c) 2025, andrej and Contributors
+# See license.txt
+
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from friday_app.api import metrics
+
+
+class IntegrationTestMetrics(IntegrationTestCase):
+	"""
+	Histogramy endpointov a odchodzích volaní: buffer v procese → Redis hash → text pre Prometheus.
+	"""
+
+	def setUp(self):
+		frappe.cache().delete_value(metrics.METRICS_KEY)
+		metrics._pending.pop(frappe.local.site, None)
+		self.addCleanup(frappe.cache().delete_value, metrics.METRICS_KEY)
+
+	def _request(self, path, status=200, queries=0):
+		frappe.local.request = SimpleNamespace(path=path)
+		self.addCleanup(setattr, frappe.local, "request", None)
+		metrics.before_request()
+		for _query in range(queries):
+			frappe.db.sql("select 1")
+		metrics.after_request(response=SimpleNamespace(status_code=status))
+
+	def test_request_histogram_and_query_count(self):
+		self._request("/api/method/friday_app.api.friday.start_call", queries=3)
+		self._request("/api/method/friday_app.api.friday.start_call", status=417)
+		self._request("/api/method/frappe.auth.get_logged_user")
+		metrics.flush(force=True)
+
+		text = metrics.render()
+		self.assertIn("# TYPE friday_request_duration_seconds histogram", text)
+		self.assertIn(
+			'friday_request_duration_seconds_count{endpoint="friday.start_call",outcome="2xx"} 1', text
+		)
+		self.assertIn(
+			'friday_request_duration_seconds_count{endpoint="friday.start_call",outcome="4xx"} 1', text
+		)
+		self.assertIn('friday_request_db_queries_bucket{endpoint="friday.start_call",le="2"} 1', text)
+		self.assertIn('friday_request_db_queries_bucket{endpoint="friday.start_call",le="5"} 2', text)
+		self.assertIn('friday_request_db_queries_sum{endpoint="friday.start_call"} 3', text)
+		self.assertNotIn("get_logged_user", text)
+
+		# buckety číselne, +Inf posledný
+		lines = [l for l in text.splitlines() if l.startswith('friday_request_db_queries_bucket{endpoint="friday.start_call"')]
+		self.assertTrue(lines[0].endswith('le="1"} 1'))
+		self.assertIn('le="+Inf"', lines[-1])
+
+	def test_unknown_endpoints_share_one_label(self):
+		self._request("/api/method/friday_app.api.friday.no_such_method", status=404)
+		self._request("/api/method/friday_app.api.nonexistent_module.x1", status=404)
+		# existuje, ale nie je whitelistovaná
+		self._request("/api/method/friday_app.api.metrics.render", status=403)
+		metrics.flush(force=True)
+
+		text = metrics.render()
+		self.assertIn(
+			'friday_request_duration_seconds_count{endpoint="other",outcome="4xx"} 3', text
+		)
+		self.assertNotIn("no_such_method", text)
+		self.assertNotIn("nonexistent_module", text)
+		self.assertNotIn("metrics.render", text)
+
+	def test_label_values_are_escaped(self):
+		series = metrics._series("friday_outbound_total", {"operation": 'a"b\\c\nd'})
+		self.assertEqual(series, 'friday_outbound_total{operation="a\\"b\\\\c\\nd"}')
+
+	def test_outbound_timer(self):
+		with metrics.timed("clerk", "verify"):
+			pass
+		with self.assertRaises(ValueError), metrics.timed("stripe", "construct_event"):
+			raise ValueError("bad signature")
+		with metrics.timed("apns", "push") as call:
+			call["outcome"] = "410"
+		metrics.flush(force=True)
+
+		text = metrics.render()
+		self.assertIn("# TYPE friday_outbound_total counter", text)
+		self.assertIn('friday_outbound_total{service="clerk",operation="verify",outcome="ok"} 1', text)
+		self.assertIn('friday_outbound_total{service="stripe",operation="construct_event",outcome="error"} 1', text)
+		self.assertIn('friday_outbound_total{service="apns",operation="push",outcome="410"} 1', text)
+		self.assertIn('friday_outbound_duration_seconds_count{service="apns",operation="push"} 1', text)
+
+	def test_flush_is_batched(self):
+		metrics.flush(force=True)
+		metrics.inc("friday_outbound_total", service="clerk", operation="jwks", outcome="ok")
+		metrics.flush()
+		self.assertNotIn("jwks", metrics.render())
+
+		metrics.flush(force=True)
+		self.assertIn('friday_outbound_total{service="clerk",operation="jwks",outcome="ok"} 1', metrics.render())
+
+	def test_endpoint_requires_token(self):
+		frappe.set_user("Guest")
+		self.addCleanup(frappe.set_user, "Administrator")
+		with patch.dict(frappe.conf, {"friday_metrics_token": "secret"}):
+			with patch.object(frappe, "get_request_header", return_value="Bearer wrong"):
+				self.assertRaises(frappe.PermissionError, metrics.metrics)
+			with patch.object(frappe, "get_request_header", return_value="Bearer secret"):
+				response = metrics.metrics()
+		self.assertEqual(response.status_code, 200)
+		self.assertTrue(response.content_type.startswith("text/plain"))
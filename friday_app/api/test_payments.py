@@ -0,0 +1,123 @@
+# Copyright (c) 2025, andrej and Contributors
+# See license.txt
+
+import json
+import time
+from unittest.mock import patch
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from friday_app.api import issuance, payments
+from friday_app.api.balance import get_balance
+
+
+def checkout_event(session_id, user, quantity=1, amount_cents=1000, event_type="checkout.session.completed", **meta):
+	return {
+		"id": f"evt_{frappe.generate_hash(length=16)}",
+		"type": event_type,
+		"data": {
+			"object": {
+				"id": session_id,
+				"object": "checkout.session",
+				"payment_status": "paid",
+				"payment_intent": f"pi_{session_id}",
+				"amount_total": amount_cents,
+				"metadata": {"type": "friday_purchase", "user_id": user, "quantity": quantity, "year": 2025, **meta},
+			}
+		},
+	}
+
+
+class IntegrationTestStripePayments(IntegrationTestCase):
+	"""
+	Webhook ukladá eventy raz (aj pri opakovanom doručení), worker ich aplikuje práve raz.
+	"""
+
+	def setUp(self):
+		suffix = frappe.generate_hash(length=8)
+		self.user = frappe.get_doc(
+			{
+				"doctype": "Friday User",
+				"clerk_id": f"user_pay_{suffix}",
+				"email": f"pay_{suffix}@friday.test",
+				"username": f"pay_{suffix}",
+				"role": "client",
+				"status": "active",
+			}
+		).insert(ignore_permissions=True).name
+		frappe.db.commit()
+		self.enqueued = []
+		enqueue = patch.object(payments, "_enqueue", side_effect=self.enqueued.append)
+		enqueue.start()
+		self.addCleanup(enqueue.stop)
+		self.addCleanup(self._cleanup)
+
+	def _cleanup(self):
+		frappe.db.rollback()
+		payment_names = frappe.get_all("Payment", filters={"buyer": self.user}, pluck="name")
+		frappe.db.delete("Stripe Event", {"name": ("in", self.enqueued or [""])})
+		frappe.db.delete("Transaction", {"user": self.user})
+		frappe.db.delete("Friday Purchase Item", {"user": self.user})
+		frappe.db.delete("Friday Token", {"owner_user": self.user})
+		frappe.db.delete("Friday Balance", {"user": self.user})
+		frappe.db.delete("Payment", {"name": ("in", payment_names or [""])})
+		frappe.db.delete("Friday User", {"name": self.user})
+		frappe.db.commit()
+
+	def _ingest(self, event):
+		return payments.ingest_stripe_event(event["id"], event["type"], json.dumps(event))
+
+	def test_duplicate_deliveries_are_stored_once(self):
+		event = checkout_event("cs_dup", self.user)
+		self.assertTrue(self._ingest(event))
+		self.assertFalse(self._ingest(event))
+		self.assertEqual(self.enqueued, [event["id"]])
+		self.assertEqual(frappe.db.get_value("Stripe Event", event["id"], "status"), "queued")
+
+	def test_checkout_applied_exactly_once(self):
+		event = checkout_event("cs_once", self.user, quantity=3, amount_cents=4500)
+		self._ingest(event)
+		payments.process_stripe_event(event["id"])
+		payments.process_stripe_event(event["id"])
+
+		# iný event pre tú istú session (napr. async_payment_succeeded) už nič nepridá
+		late = checkout_event("cs_once", self.user, quantity=3, event_type="checkout.session.async_payment_succeeded")
+		self._ingest(late)
+		payments.process_stripe_event(late["id"])
+
+		self.assertEqual(frappe.db.get_value("Stripe Event", event["id"], "status"), "processed")
+		self.assertEqual(frappe.db.get_value("Stripe Event", late["id"], "status"), "ignored")
+		self.assertEqual(frappe.db.get_value("Payment", {"stripe_session_id": "cs_once"}, "status"), "paid")
+		self.assertEqual(frappe.db.count("Friday Token", {"owner_user": self.user}), 3)
+		self.assertEqual(frappe.db.count("Friday Purchase Item", {"user": self.user}), 3)
+		self.assertEqual(frappe.db.count("Transaction", {"user": self.user}), 1)
+		self.assertEqual(get_balance(self.user)["total_minutes"], 3 * issuance.MINUTES_PER_TOKEN)
+
+	def test_failed_event_is_recorded_for_retry(self):
+		event = checkout_event("cs_fail", self.user)
+		self._ingest(event)
+		with patch.dict(payments.EVENT_HANDLERS, {event["type"]: lambda obj: 1 / 0}):
+			payments.process_stripe_event(event["id"])
+		status, attempts = frappe.db.get_value("Stripe Event", event["id"], ["status", "attempts"])
+		self.assertEqual((status, attempts), ("failed", 1))
+
+		payments.process_stripe_event(event["id"])
+		self.assertEqual(frappe.db.get_value("Stripe Event", event["id"], "status"), "processed")
+
+	def test_replayed_burst_throughput(self):
+		# nahraný burst: 200 eventov, každý doručený trikrát (Stripe retry)
+		burst = [checkout_event(f"cs_burst_{i}", self.user) for i in range(200)]
+		deliveries = [event for event in burst for _ in range(3)]
+
+		start = time.perf_counter()
+		for event in deliveries:
+			self._ingest(event)
+		ack = time.perf_counter() - start
+
+		for event_id in list(self.enqueued):
+			payments.process_stripe_event(event_id)
+
+		self.assertEqual(len(self.enqueued), len(burst))
+		self.assertEqual(frappe.db.count("Friday Token", {"owner_user": self.user}), len(burst))
+		self.assertLess(ack / len(deliveries), 0.05)
@@ -0,0 +1,123 @@
+# Copyright (c) 2025, andrej and Contributors
+# See license.txt
+
+import time
+from unittest.mock import patch
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from friday_app.api import friday, metering, presence
+from friday_app.api.test_friday import make_client
+
+
+class IntegrationTestPresence(IntegrationTestCase):
+	"""
+	Presence v Redise: TTL, hromadné čítanie a rýchle odmietnutie v start_call.
+	"""
+
+	def setUp(self):
+		self.caller, self.advisor = make_client(600), make_client(601)
+		for user in (self.caller, self.advisor):
+			self.addCleanup(presence.set_presence, user.name, "offline")
+
+	def _heartbeat(self, user, status, role="admin"):
+		with (
+			patch.object(presence, "get_current_user_id", return_value=user.name),
+			patch.object(presence, "get_auth_context", return_value=frappe._dict(role=role)),
+		):
+			return presence.heartbeat(status)
+
+	def test_heartbeat_and_expiry(self):
+		self._heartbeat(self.advisor, "online")
+		self.assertEqual(presence.get_presence([self.advisor.name, self.caller.name]), {
+			self.advisor.name: "online",
+			self.caller.name: "offline",
+		})
+
+		later = time.time() + presence.presence_ttl() + 1
+		with patch.object(presence.time, "time", return_value=later):
+			self.assertEqual(presence.is_available(self.advisor.name), (False, "offline"))
+			presence.prune_presence()
+		self.assertNotIn(self.advisor.name, presence.all_presence())
+
+	def test_available_advisors(self):
+		self._heartbeat(self.advisor, "online")
+		self._heartbeat(self.caller, "busy")
+		result = presence.available_advisors()
+		self.assertIn(self.advisor.name, result["available"])
+		self.assertIn(self.caller.name, result["busy"])
+
+		self._heartbeat(self.caller, "offline")
+		self.assertNotIn(self.caller.name, presence.available_advisors()["busy"])
+
+	def test_only_advisors_publish_presence(self):
+		self.assertRaises(frappe.PermissionError, self._heartbeat, self.caller, "online", role="client")
+		self.assertNotIn(self.caller.name, presence.all_presence())
+
+	def test_online_heartbeat_keeps_busy_during_call(self):
+		call_id = frappe.generate_hash(length=12)
+		metering.register_call(call_id, self.caller.name, self.advisor.name)
+		self.addCleanup(metering.unregister_call, call_id)
+		presence.set_presence(self.advisor.name, "busy", call_id)
+
+		self.assertEqual(self._heartbeat(self.advisor, "online")["status"], "busy")
+		self.assertEqual(presence.is_available(self.advisor.name), (False, "busy"))
+
+		# po konci hovoru heartbeat opäť hlási online
+		metering.unregister_call(call_id)
+		self.assertEqual(self._heartbeat(self.advisor, "online")["status"], "online")
+
+	def test_start_call_fails_fast_when_unavailable(self):
+		frappe.local.request = frappe._dict(get_json=lambda: {"advisorId": self.advisor.name})
+		self.addCleanup(setattr, frappe.local, "request", None)
+		ctx = frappe._dict(user_id=self.caller.name, role="client", username="caller")
+
+		def start():
+			with (
+				patch.object(friday, "get_current_user_id", return_value=self.caller.name),
+				patch.object(friday, "get_auth_context", return_value=ctx),
+				patch.object(friday, "has_minutes") as has_minutes,
+			):
+				return friday.start_call(), has_minutes
+
+		calls = frappe.db.count("Call Log")
+		result, has_minutes = start()
+		self.assertEqual((result["success"], result["presence"]), (False, "offline"))
+
+		self._heartbeat(self.advisor, "busy")
+		result, has_minutes = start()
+		self.assertEqual(result["error"], "Advisor is busy")
+		# žiadna ďalšia práca – ani kontrola minút, ani Call Log
+		has_minutes.assert_not_called()
+		self.assertEqual(frappe.db.count("Call Log"), calls)
+
+	def test_advisor_is_busy_while_ringing(self):
+		self._heartbeat(self.advisor, "online")
+		frappe.local.request = frappe._dict(get_json=lambda: {"advisorId": self.advisor.name})
+		self.addCleanup(setattr, frappe.local, "request", None)
+		ctx = frappe._dict(user_id=self.caller.name, role="client", username="caller")
+
+		def start():
+			with (
+				patch.object(friday, "get_current_user_id", return_value=self.caller.name),
+				patch.object(friday, "get_auth_context", return_value=ctx),
+				patch.object(friday, "has_minutes", return_value=True),
+				patch.object(friday, "live_device_tokens", return_value=[("voip-ring", "voip")]),
+				patch.object(friday, "enqueue_call_push"),
+				patch.object(frappe.db, "commit"),
+			):
+				return friday.start_call()
+
+		first = start()
+		self.assertTrue(first["success"])
+		self.addCleanup(metering.unregister_call, first["callId"])
+		# zvonenie = busy, heartbeat "online" ho neprepíše
+		self.assertEqual(self._heartbeat(self.advisor, "online")["status"], "busy")
+		self.assertEqual(start()["error"], "Advisor is busy")
+
+		# súbežný start_call prečítal presence pred zápisom busy – zastaví ho zvoniaci Call Log
+		presence.set_presence(self.advisor.name, "online")
+		calls = frappe.db.count("Call Log")
+		self.assertEqual(start()["presence"], "busy")
+		self.assertEqual(frappe.db.count("Call Log"), calls)
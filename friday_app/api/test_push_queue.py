@@ -0,0 +1,177 @@
+# Copyright (c) 2025, andrej and Contributors
+# See license.txt
+
+import json
+import time
+from unittest.mock import patch
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from friday_app.api import auth, push_queue
+from friday_app.api.device_tokens import live_device_tokens
+from friday_app.api.utils import build_apns_request
+
+OK = {"success": True, "status": 200, "reason": None, "retryable": False, "dead": False}
+THROTTLED = {"success": False, "status": 429, "reason": "TooManyRequests", "retryable": True, "dead": False}
+BAD_TOKEN = {"success": False, "status": 400, "reason": "BadDeviceToken", "retryable": False, "dead": True}
+TOO_LARGE = {"success": False, "status": 413, "reason": "PayloadTooLarge", "retryable": False, "dead": False}
+
+
+class IntegrationTestPushQueue(IntegrationTestCase):
+	"""
+	Doručenie pushu z fronty: retry s backoffom, deadline a dead-letter.
+	"""
+
+	def setUp(self):
+		self.call_log = frappe.get_doc(
+			{"doctype": "Call Log", "call_id": frappe.generate_hash(length=12), "status": "started", "push_status": "queued"}
+		).insert(ignore_permissions=True)
+		self.sleep = patch.object(push_queue.time, "sleep")
+		self.sleep_mock = self.sleep.start()
+
+	def tearDown(self):
+		self.sleep.stop()
+
+	def _deliver(self, results, deadline=None):
+		with patch.object(push_queue, "send_apns_notification", side_effect=results) as send:
+			push_queue.deliver_call_push(
+				self.call_log.name, "device-token", "title", "body", deadline=deadline or time.time() + 30
+			)
+		self.call_log.reload()
+		return send
+
+	def test_retries_with_backoff_then_sent(self):
+		send = self._deliver([THROTTLED, THROTTLED, OK])
+		self.assertEqual(send.call_count, 3)
+		self.assertEqual(self.call_log.push_status, "sent")
+		self.assertEqual(self.call_log.push_attempts, 3)
+		self.assertEqual([c.args[0] for c in self.sleep_mock.call_args_list], [0.5, 1.0])
+
+	def test_permanent_error_is_dead_lettered(self):
+		send = self._deliver([TOO_LARGE])
+		self.assertEqual(send.call_count, 1)
+		self.assertEqual(self.call_log.push_status, "failed")
+		self.assertEqual(self.call_log.push_error, "PayloadTooLarge")
+
+		frappe.set_user("Administrator")
+		letters = push_queue.dead_letters(limit=1)["dead_letters"]
+		self.assertEqual(letters[0]["call_log"], self.call_log.name)
+		# zoznam je pod kľúčom s jedným prefixom site
+		self.assertTrue(frappe.cache().exists(push_queue.DEAD_LETTER_KEY))
+
+	def test_dead_token_is_not_retried(self):
+		send = self._deliver([BAD_TOKEN, OK])
+		self.assertEqual(send.call_count, 1)
+		self.assertEqual(self.call_log.push_status, "failed")
+		self.assertEqual(self.call_log.push_error, "BadDeviceToken")
+
+	def test_late_push_expires(self):
+		send = self._deliver([OK], deadline=time.time() - 1)
+		send.assert_not_called()
+		self.assertEqual(self.call_log.push_status, "expired")
+
+
+class IntegrationTestMultiDeviceRing(IntegrationTestCase):
+	"""
+	Viac zariadení na používateľa: zvonenie naraz na všetkých, prvé zdvihnutie vyhráva.
+	"""
+
+	def setUp(self):
+		self.user = frappe.get_doc(
+			{
+				"doctype": "Friday User",
+				"clerk_id": "user_multi_device",
+				"email": "multi_device@friday.test",
+				"username": "multi_device",
+				"role": "client",
+				"status": "active",
+			}
+		).insert(ignore_permissions=True)
+		self.addCleanup(setattr, frappe.local, "request", None)
+		sleep = patch.object(push_queue.time, "sleep")
+		self.sleep = sleep.start()
+		self.addCleanup(sleep.stop)
+
+	def _register(self, **data):
+		frappe.local.request = frappe._dict(get_json=lambda: data)
+		with patch.object(auth, "get_current_user_id", return_value=self.user.name):
+			return auth.register_device()
+
+	def test_devices_are_keyed_by_token(self):
+		self._register(voip_token="voip-phone", device_id="phone")
+		self._register(voip_token="voip-tablet", device_id="tablet")
+		self.assertEqual(set(live_device_tokens(self.user.name)), {("voip-phone", "voip"), ("voip-tablet", "voip")})
+
+		# nový token toho istého zariadenia prepíše starý, nepridá tretie zariadenie
+		self.assertTrue(self._register(voip_token="voip-phone-2", device_id="phone")["updated"])
+		self.assertEqual(set(live_device_tokens(self.user.name)), {("voip-phone-2", "voip"), ("voip-tablet", "voip")})
+
+		# zariadenie bez VoIP tokenu zvoní cez bežný APNs token
+		self._register(apns_token="apns-watch", device_id="watch")
+		self.assertIn(("apns-watch", "apns"), live_device_tokens(self.user.name))
+
+	def test_all_devices_ring_in_one_round(self):
+		call_log = frappe.get_doc(
+			{"doctype": "Call Log", "call_id": frappe.generate_hash(length=12), "status": "ringing"}
+		).insert(ignore_permissions=True)
+		bulk = [dict(OK, device_token="phone"), dict(THROTTLED, device_token="tablet")]
+		with (
+			patch.object(push_queue, "send_bulk_notifications", return_value=bulk) as send_bulk,
+			patch.object(push_queue, "send_apns_notification", return_value=OK) as send_one,
+		):
+			push_queue.deliver_call_push(call_log.name, ["phone", "tablet"], "t", "b", deadline=time.time() + 30)
+
+		self.assertEqual(send_bulk.call_args.args[0], ["phone", "tablet"])
+		# druhé kolo len pre zariadenie s dočasnou chybou
+		self.assertEqual(send_one.call_args.kwargs["device_token"], "tablet")
+		call_log.reload()
+		self.assertEqual((call_log.push_status, call_log.push_attempts), ("sent", 1))
+
+	def test_push_type_follows_token_kind(self):
+		call_log = frappe.get_doc(
+			{"doctype": "Call Log", "call_id": frappe.generate_hash(length=12), "status": "ringing"}
+		).insert(ignore_permissions=True)
+		with patch.object(push_queue, "send_apns_notification", return_value=OK) as send_one:
+			push_queue.deliver_call_push(
+				call_log.name, [("voip-phone", "voip"), ("apns-watch", "apns")], "t", "b", deadline=time.time() + 30
+			)
+		self.assertEqual(
+			{c.kwargs["device_token"]: c.kwargs["push_type"] for c in send_one.call_args_list},
+			{"voip-phone": "voip", "apns-watch": "alert"},
+		)
+
+	def test_retries_stop_once_answered(self):
+		call_log = frappe.get_doc(
+			{"doctype": "Call Log", "call_id": frappe.generate_hash(length=12), "status": "ringing"}
+		).insert(ignore_permissions=True)
+
+		def throttled_then_answered(**kwargs):
+			frappe.db.set_value("Call Log", call_log.name, "status", "accepted")
+			return THROTTLED
+
+		with patch.object(push_queue, "send_apns_notification", side_effect=throttled_then_answered) as send:
+			push_queue.deliver_call_push(call_log.name, ["phone"], "t", "b", deadline=time.time() + 30)
+		self.assertEqual(send.call_count, 1)
+
+	def test_cancel_push_skips_answering_device(self):
+		self._register(voip_token="voip-phone", device_id="phone")
+		self._register(voip_token="voip-tablet", device_id="tablet")
+		with patch.object(frappe, "enqueue") as enqueue:
+			push_queue.enqueue_cancel_push("call", self.user.name, except_token="voip-phone", reason="accepted")
+		self.assertEqual(enqueue.call_args.kwargs["device_tokens"], [("voip-tablet", "voip")])
+
+	def test_cancel_push_is_silent_voip(self):
+		with patch.object(push_queue, "send_apns_notification", return_value=OK) as send_one:
+			push_queue.deliver_cancel_push("call", [("voip-tablet", "voip"), ("apns-watch", "apns")], reason="accepted")
+		self.assertEqual(
+			{c.kwargs["device_token"]: c.kwargs["push_type"] for c in send_one.call_args_list},
+			{"voip-tablet": "voip", "apns-watch": "background"},
+		)
+
+		settings = frappe._dict(team_id="TEAM123", key_id="KEY123", auth_key="key", bundle_id="com.friday.app")
+		with patch("friday_app.api.apns_client.get_provider_token", return_value="jwt"):
+			headers, content = build_apns_request(settings, "", "", {"type": "call_cancelled"}, push_type="voip")
+		self.assertEqual((headers["apns-push-type"], headers["apns-topic"]), ("voip", "com.friday.app.voip"))
+		# žiadny banner ani zvuk na ostatných zariadeniach
+		self.assertEqual(json.loads(content), {"aps": {}, "type": "call_cancelled"})
@@ -0,0 +1,94 @@
+# Copyright (c) 2025, andrej and Contributors
+# See license.txt
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests import IntegrationTestCase
+from frappe.utils import get_first_day, getdate, now_datetime
+
+from friday_app.api import rollups
+from friday_app.api.test_friday import make_client
+
+
+class IntegrationTestCallRollups(IntegrationTestCase):
+	"""
+	Skončené hovory sa do denných a mesačných súhrnov pripočítajú práve raz.
+	"""
+
+	def setUp(self):
+		commit = patch.object(frappe.db, "commit")
+		commit.start()
+		self.addCleanup(commit.stop)
+		frappe.db.sql("update `tabCall Log` set rolled_up = 1")
+		self.caller, self.advisor = make_client(500), make_client(501)
+		self.today = getdate(now_datetime())
+
+	def _call(self, status="ended", duration=120, billed=2):
+		return frappe.get_doc(
+			{
+				"doctype": "Call Log",
+				"caller": self.caller.name,
+				"advisor": self.advisor.name,
+				"call_id": frappe.generate_hash(length=12),
+				"status": status,
+				"started_at": now_datetime(),
+				"duration": duration,
+				"billed_minutes": billed,
+			}
+		).insert(ignore_permissions=True)
+
+	def _daily(self):
+		return frappe.db.get_value(
+			"Call Daily Rollup",
+			{"advisor": self.advisor.name, "client": self.caller.name, "day": self.today},
+			["calls", "completed", "declined", "missed", "failed", "total_seconds", "billed_minutes"],
+			as_dict=True,
+		)
+
+	def test_rolls_up_each_call_once(self):
+		self._call()
+		self._call(status="missed", duration=0, billed=0)
+		self._call(status="started")
+
+		self.assertEqual(rollups.roll_up_calls(), 2)
+		self.assertEqual(rollups.roll_up_calls(), 0)
+		self.assertEqual(
+			self._daily(),
+			{
+				"calls": 2, "completed": 1, "declined": 0, "missed": 1, "failed": 0,
+				"total_seconds": 120, "billed_minutes": 2,
+			},
+		)
+
+		self._call(status="failed", duration=0, billed=0)
+		rollups.roll_up_calls()
+		self.assertEqual(self._daily().calls, 3)
+		monthly = frappe.db.get_value(
+			"Call Monthly Rollup",
+			{"advisor": self.advisor.name, "month": get_first_day(self.today)},
+			["calls", "failed"],
+			as_dict=True,
+		)
+		self.assertEqual((monthly.calls, monthly.failed), (3, 1))
+
+	def test_backfill_matches_incremental(self):
+		for _ in range(3):
+			self._call()
+		rollups.roll_up_calls()
+		incremental = self._daily()
+
+		rollups.backfill_rollups(get_first_day(self.today))
+		self.assertEqual(self._daily(), incremental)
+
+	def test_reports_read_rollups(self):
+		self._call(billed=5)
+		rollups.roll_up_calls()
+		with patch.object(rollups, "get_auth_context", return_value=frappe._dict(role="admin")):
+			advisors = rollups.advisor_minutes()["advisors"]
+			clients = rollups.top_clients(limit=5)["clients"]
+		self.assertIn((self.advisor.name, 5), [(r.advisor, r.billed_minutes) for r in advisors])
+		self.assertIn(self.caller.name, [r.client for r in clients])
+
+		with patch.object(rollups, "get_auth_context", return_value=frappe._dict(role="client")):
+			self.assertRaises(frappe.PermissionError, rollups.advisor_minutes)
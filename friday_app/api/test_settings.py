@@ -0,0 +1,80 @@
+# Copyright (c) 2025, andrej and Contributors
+# See license.txt
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from friday_app.api import settings
+from friday_app.api.utils import get_apns_settings
+
+APNS_CONF = {
+	"apns_key_id": "KEY123",
+	"apns_team_id": "TEAM123",
+	"apns_auth_key": "auth-key",
+	"apns_bundle_id": "com.friday.app",
+	"apns_use_sandbox": 1,
+}
+
+
+class IntegrationTestSettings(IntegrationTestCase):
+	"""
+	Cachované nastavenia: bez DB pri opakovanom čítaní, obnova po zmene configu alebo Friday Settings.
+	"""
+
+	def setUp(self):
+		settings.clear_settings_cache()
+		self.addCleanup(settings.clear_settings_cache)
+
+	def _count_queries(self, fn):
+		queries = []
+		original_sql = frappe.db.sql
+
+		def counting_sql(*args, **kw):
+			queries.append(args[0])
+			return original_sql(*args, **kw)
+
+		frappe.db.sql = counting_sql
+		try:
+			result = fn()
+		finally:
+			frappe.db.sql = original_sql
+		return result, len(queries)
+
+	def test_cached_read_is_free(self):
+		settings.get_settings()
+		with patch.object(settings, "_version", side_effect=AssertionError("Redis hit")):
+			_, queries = self._count_queries(settings.get_settings)
+		self.assertEqual(queries, 0)
+
+	def test_conf_change_is_picked_up(self):
+		with patch.dict(frappe.local.conf, APNS_CONF):
+			apns = get_apns_settings()
+			self.assertEqual((apns.team_id, apns.is_sandbox), ("TEAM123", True))
+
+			frappe.local.conf["apns_team_id"] = "TEAM456"
+			with patch("friday_app.api.apns_client.invalidate_provider_token") as invalidate:
+				self.assertEqual(get_apns_settings().team_id, "TEAM456")
+			invalidate.assert_called_once_with("TEAM123", "KEY123", "auth-key")
+
+		with patch.dict(frappe.local.conf, {"apns_key_id": None}):
+			self.assertIsNone(get_apns_settings())
+
+	def test_price_refreshes_on_update(self):
+		doc = frappe.get_doc({"doctype": "Friday Settings", "current_price_eur": 1.5}).insert(ignore_permissions=True)
+		self.assertEqual(settings.get_settings().pricing.current_price_eur, 1.5)
+
+		doc.current_price_eur = 2.0
+		doc.save(ignore_permissions=True)
+		self.assertEqual(settings.get_settings().pricing.current_price_eur, 2.0)
+
+	def test_other_workers_follow_redis_version(self):
+		settings.get_settings()
+		entry = settings._cache[frappe.local.site]
+		entry["checked_at"] -= settings.VERSION_CHECK_INTERVAL
+
+		frappe.cache().set_value(settings.VERSION_KEY, "bumped-elsewhere")
+		self.addCleanup(frappe.cache().delete_value, settings.VERSION_KEY)
+		settings.get_settings()
+		self.assertEqual(settings._cache[frappe.local.site]["version"], "bumped-elsewhere")
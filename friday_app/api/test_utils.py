@@ -0,0 +1,112 @@
+# Copyright (c) 2025, andrej and Contributors
+# See license.txt
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from friday_app.api.balance import get_balance
+from friday_app.api.utils import deduct_minutes_from_user
+
+
+class IntegrationTestDeductMinutes(IntegrationTestCase):
+	"""
+	Odpočet minút: FIFO cez viac tokenov, jeden zápis, žiadne stratené minúty pri súbehu.
+	"""
+
+	def _make_user(self, suffix):
+		return frappe.get_doc(
+			{
+				"doctype": "Friday User",
+				"clerk_id": f"user_deduct_{suffix}",
+				"email": f"deduct_{suffix}@friday.test",
+				"username": f"deduct_{suffix}",
+				"role": "client",
+				"status": "active",
+			}
+		).insert(ignore_permissions=True).name
+
+	def _tokens(self, user, *minutes):
+		names = []
+		for i, m in enumerate(minutes):
+			names.append(
+				frappe.get_doc(
+					{
+						"doctype": "Friday Token",
+						"owner_user": user,
+						"minutes_remaining": m,
+						"status": "active",
+						"created_at": f"2025-01-0{i + 1} 00:00:00",
+					}
+				).insert(ignore_permissions=True).name
+			)
+		return names
+
+	def test_spills_across_tokens_fifo(self):
+		user = self._make_user("spill")
+		first, second, third = self._tokens(user, 5, 10, 20)
+
+		usage = deduct_minutes_from_user(user, 12)
+
+		self.assertEqual(usage["deducted"], 12)
+		self.assertEqual(usage["missing"], 0)
+		self.assertEqual(
+			usage["tokens"],
+			[{"token": first, "minutes": 5, "remaining": 0}, {"token": second, "minutes": 7, "remaining": 3}],
+		)
+		self.assertEqual(frappe.db.get_value("Friday Token", first, "status"), "spent")
+		self.assertEqual(frappe.db.get_value("Friday Token", second, ["minutes_remaining", "status"]), (3, "active"))
+		self.assertEqual(frappe.db.get_value("Friday Token", third, "minutes_remaining"), 20)
+		self.assertEqual(get_balance(user), {"total_minutes": 23, "active_tokens": 2})
+
+	def test_reports_missing_minutes(self):
+		user = self._make_user("short")
+		self._tokens(user, 3)
+		usage = deduct_minutes_from_user(user, 5)
+		self.assertEqual((usage["deducted"], usage["missing"]), (3, 2))
+		self.assertEqual(get_balance(user)["total_minutes"], 0)
+
+	def test_concurrent_deductions_lose_nothing(self):
+		users = [self._make_user(f"race_{i}") for i in range(4)]
+		for user in users:
+			self._tokens(user, 30, 30, 40)
+		frappe.db.commit()
+		self.addCleanup(self._cleanup, users)
+
+		site = frappe.local.site
+		per_user, workers = 50, 16
+
+		def deduct(user):
+			frappe.init(site=site)
+			frappe.connect()
+			try:
+				start = time.perf_counter()
+				usage = deduct_minutes_from_user(user, 2)
+				frappe.db.commit()
+				return usage["deducted"], time.perf_counter() - start
+			finally:
+				frappe.destroy()
+
+		jobs = [u for u in users for _ in range(per_user)]
+		with ThreadPoolExecutor(max_workers=workers) as pool:
+			results = list(pool.map(deduct, jobs))
+
+		waits = sorted(w for _, w in results)
+
+		self.assertEqual(sum(d for d, _ in results), len(jobs) * 2)
+		for user in users:
+			left = frappe.db.sql(
+				"select sum(minutes_remaining) from `tabFriday Token` where owner_user = %s", user
+			)[0][0]
+			self.assertEqual(left, 0)
+			self.assertEqual(get_balance(user), {"total_minutes": 0, "active_tokens": 0})
+		self.assertLess(waits[-1], 5)
+
+	def _cleanup(self, users):
+		frappe.db.delete("Transaction", {"user": ("in", users)})
+		frappe.db.delete("Friday Token", {"owner_user": ("in", users)})
+		frappe.db.delete("Friday Balance", {"user": ("in", users)})
+		frappe.db.delete("Friday User", {"name": ("in", users)})
+		frappe.db.commit()
@@ -1,165 +1,350 @@
-import frappe
-import time
-import json
-import jwt
-from datetime import datetime
-
-
-# ============= LOGGING =============
-
-def log_info(msg: str):
-    frappe.logger().info(f"[FRIDAY] {msg}")
-
-
-def log_error(msg: str, title: str = "Friday Error"):
-    frappe.log_error(message=msg, title=title)
-
-
-# ============= TIME HELPERS =============
-
-def now_iso() -> str:
-    return datetime.utcnow().isoformat()
-
-
-# ============= CLERK VERIFY =============
-# číta clerk_api_key zo site_config.json
-
-def verify_clerk_token(token: str):
-    """
-    Overí Clerk JWT cez Clerk API a vráti dict s userom.
-    Vráti None ak token nie je validný.
-    """
-    clerk_key = frappe.conf.get("clerk_api_key")
-    if not clerk_key:
-        log_error("Missing clerk_api_key in site_config.json")
-        return None
-
-    import requests
-    try:
-        res = requests.post(
-    		"https://notable-sawfly-17.clerk.accounts.dev/v1/tokens/verify",
-            headers={
-                "Authorization": f"Bearer {clerk_key}",
-                "Content-Type": "application/json"
-            },
-            json={"token": token}
-        )
-    except Exception as e:
-        log_error(f"Clerk verify request failed: {str(e)}", "Clerk Auth Error")
-        return None
-
-    if res.status_code != 200:
-        log_error(f"Clerk verify failed: {res.text}", "Clerk Auth Error")
-        return None
-
-    return res.json()
-
-
-# ============= APNs SEND =============
-
-def send_apns_notification(device_token: str, title: str, body: str, extra: dict | None = None):
-    """
-    Pošle APNs (alebo VoIP) notifikáciu na iOS.
-    Údaje berie z Single Doctype 'APNs Push'.
-    """
-    if not device_token:
-        log_error("send_apns_notification called without device_token")
-        return
-
-    try:
-        settings = frappe.get_single("APNs Push")
-    except Exception:
-        log_error("APNs Push single doctype not found")
-        return
-
-    key_id = settings.key_id
-    team_id = settings.team_id
-    auth_key = settings.auth_key
-    bundle_id = settings.bundle_id
-    use_sandbox = settings.is_sandbox
-
-    if not key_id or not team_id or not auth_key or not bundle_id:
-        log_error("APNs settings incomplete")
-        return
-
-    # vygeneruj JWT pre Apple
-    token = jwt.encode(
-        {
-            "iss": team_id,
-            "iat": int(time.time())
-        },
-        auth_key,
-        algorithm="ES256",
-        headers={
-            "alg": "ES256",
-            "kid": key_id
-        }
-    )
-
-    host = "api.sandbox.push.apple.com" if use_sandbox else "api.push.apple.com"
-
-    from httpx import Client
-    payload = {
-        "aps": {
-            "alert": {
-                "title": title,
-                "body": body
-            },
-            "sound": "default"
-        }
-    }
-    if extra:
-        payload.update(extra)
-
-    headers = {
-        "authorization": f"bearer {token}",
-        "apns-topic": bundle_id,
-        "apns-push-type": "alert",
-        "content-type": "application/json"
-    }
-
-    url = f"https://{host}/3/device/{device_token}"
-
-    try:
-        with Client(http2=True, timeout=10.0) as client:
-            res = client.post(url, headers=headers, content=json.dumps(payload))
-        if res.status_code != 200:
-            log_error(f"APNs push failed ({res.status_code}): {res.text}")
-        else:
-            log_info(f"APNs push OK → {device_token[:8]}…")
-    except Exception as e:
-        log_error(f"APNs request failed: {str(e)}")
-
-
-# ============= TOKEN UTILS =============
-
-def deduct_minutes_from_user(user_id: str, minutes: int = 1):
-    """
-    Zoberie prvý aktívny token používateľa a odpočíta mu minúty.
-    Jednoduchá verzia – stačí na MVP.
-    """
-    tokens = frappe.get_all(
-        "Friday Token",
-        filters={"owner_user": user_id, "status": "active"},
-        fields=["name", "minutes_remaining"],
-        order_by="created_at asc"
-    )
-    if not tokens:
-        log_info(f"User {user_id} has no active tokens")
-        return None
-
-    tok = tokens[0]
-    remaining = int(tok.minutes_remaining or 0)
-    remaining = max(remaining - minutes, 0)
-
-    frappe.db.set_value("Friday Token", tok.name, {
-        "minutes_remaining": remaining,
-        "last_used_at": now_iso()
-    })
-    if remaining == 0:
-        frappe.db.set_value("Friday Token", tok.name, "status", "spent")
-
-    frappe.db.commit()
-    log_info(f"Deducted {minutes} minutes from token {tok.name} ({user_id})")
-    return tok.name
-
+import frappe
+import time
+import json
+import jwt
+from datetime import datetime
+
+
+# ============= LOGGING =============
+
+def log_info(msg: str):
+    frappe.logger().info(f"[FRIDAY] {msg}")
+
+
+def log_error(msg: str, title: str = "Friday Error"):
+    frappe.log_error(message=msg, title=title)
+
+
+# ============= TIME HELPERS =============
+
+def now_iso() -> str:
+    return datetime.utcnow().isoformat()
+
+
+# ============= CLERK VERIFY =============
+# číta clerk_api_key zo site_config.json
+# clerk_verify_mode: "local" (default, JWKS) alebo "remote" (Clerk API)
+
+def verify_clerk_token(token: str):
+    """
+    Overí Clerk JWT a vráti dict s userom (claimy tokenu).
+    Lokálne cez JWKS, Clerk API len ak JWKS nie je dostupné.
+    Vráti None ak token nie je validný.
+    """
+    if not token:
+        return None
+
+    from .settings import get_settings
+
+    if get_settings().clerk.verify_mode != "remote":
+        from .clerk import JWKSUnavailable, verify_clerk_jwt
+        try:
+            return verify_clerk_jwt(token)
+        except JWKSUnavailable as e:
+            log_error(f"Clerk JWKS unavailable, falling back to API: {e}", "Clerk Auth Error")
+
+    return verify_clerk_token_remote(token)
+
+
+def verify_clerk_token_remote(token: str):
+    """
+    Overí Clerk JWT cez Clerk API a vráti dict s userom.
+    Vráti None ak token nie je validný.
+    """
+    from .settings import get_settings
+
+    clerk = get_settings().clerk
+    clerk_key = clerk.api_key
+    if not clerk_key:
+        log_error("Missing clerk_api_key in site_config.json")
+        return None
+
+    import requests
+
+    from .metrics import timed
+
+    try:
+        with timed("clerk", "verify") as call:
+            res = requests.post(
+                "https://notable-sawfly-17.clerk.accounts.dev/v1/tokens/verify",
+                headers={
+                    "Authorization": f"Bearer {clerk_key}",
+                    "Content-Type": "application/json"
+                },
+                json={"token": token},
+                timeout=clerk.timeout
+            )
+            call["outcome"] = "ok" if res.status_code == 200 else str(res.status_code)
+    except Exception as e:
+        log_error(f"Clerk verify request failed: {str(e)}", "Clerk Auth Error")
+        return None
+
+    if res.status_code != 200:
+        log_error(f"Clerk verify failed: {res.text}", "Clerk Auth Error")
+        return None
+
+    return res.json()
+
+
+# ============= APNs SEND =============
+
+def get_apns_settings():
+    """
+    APNs nastavenia (apns_* v site_config.json) z cachovaných settings.
+    Vráti None (a zaloguje) ak chýbajú.
+    """
+    from .settings import get_settings
+
+    settings = get_settings().apns
+    if not settings.complete:
+        log_error("APNs settings incomplete")
+        return None
+    return settings
+
+
+def apns_topic(settings, push_type: str = "alert") -> str:
+    """apns_bundle_id je bez prípony – VoIP (PushKit) topic je <bundle>.voip, len tu."""
+    return f"{settings.bundle_id}.voip" if push_type == "voip" else settings.bundle_id
+
+
+def build_apns_request(settings, title: str, body: str, extra: dict | None = None,
+                       expiration: int | None = None, push_type: str = "alert"):
+    """
+    Hlavičky a telo APNs requestu – rovnaké pre jeden push aj hromadné posielanie.
+    push_type: "alert" (banner + zvuk), "voip" (PushKit, bez alertu) alebo
+    "background" (tichý push, content-available).
+    """
+    from .apns_client import get_provider_token
+
+    # JWT pre Apple – cachovaný ~50 minút, nepodpisujeme pri každom pushi
+    token = get_provider_token(settings.team_id, settings.key_id, settings.auth_key)
+
+    if push_type == "alert":
+        aps = {
+            "alert": {
+                "title": title,
+                "body": body
+            },
+            "sound": "default"
+        }
+    elif push_type == "voip":
+        aps = {}
+    else:
+        aps = {"content-available": 1}
+    payload = {"aps": aps}
+    if extra:
+        payload.update(extra)
+
+    headers = {
+        "authorization": f"bearer {token}",
+        "apns-topic": apns_topic(settings, push_type),
+        "apns-push-type": push_type,
+        "content-type": "application/json"
+    }
+    if push_type == "background":
+        # Apple odmietne tichý push s prioritou 10
+        headers["apns-priority"] = "5"
+    if expiration:
+        headers["apns-expiration"] = str(int(expiration))
+
+    return headers, json.dumps(payload).encode()
+
+
+def apns_result(settings, res=None, error: Exception | None = None) -> dict:
+    """
+    Prevedie odpoveď APNs (alebo výnimku) na {"success", "status", "reason", "retryable", "dead"}.
+    dead = token je natrvalo neplatný (410 Unregistered, 400 BadDeviceToken).
+    """
+    if error is not None:
+        from .apns_client import RETRYABLE_ERRORS
+        # push, ktorý mohol k Apple dôjsť, neopakujeme (dvojité zvonenie)
+        retryable = isinstance(error, RETRYABLE_ERRORS)
+        return {"success": False, "status": None, "reason": str(error), "retryable": retryable, "dead": False}
+
+    if res.status_code == 200:
+        return {"success": True, "status": 200, "reason": None, "retryable": False, "dead": False}
+
+    if res.status_code == 403:
+        # ExpiredProviderToken / InvalidProviderToken → ďalší push podpíše nový
+        from .apns_client import invalidate_provider_token
+        invalidate_provider_token(settings.team_id, settings.key_id, settings.auth_key)
+
+    from .device_tokens import is_dead_token
+
+    result = {
+        "success": False,
+        "status": res.status_code,
+        "reason": _apns_reason(res),
+        # 403 = starý provider token, 429 = throttling, 5xx = výpadok Apple
+        "retryable": res.status_code in (403, 429) or res.status_code >= 500,
+    }
+    result["dead"] = is_dead_token(result)
+    return result
+
+
+def send_apns_notification(device_token: str, title: str, body: str, extra: dict | None = None,
+                           expiration: int | None = None, push_type: str = "alert"):
+    """
+    Pošle APNs (alebo VoIP) notifikáciu na iOS.
+    Údaje berie z get_apns_settings (apns_* v site_config.json, cachované v settings.get_settings).
+    expiration – unix čas, po ktorom už Apple push nedoručí.
+    Vráti {"success", "status", "reason", "retryable", "dead"}.
+    Mŕtvy token (410 / BadDeviceToken) rovno vymaže z Device.
+    """
+    if not device_token:
+        log_error("send_apns_notification called without device_token")
+        return {"success": False, "status": None, "reason": "MissingDeviceToken", "retryable": False,
+                "dead": False}
+
+    settings = get_apns_settings()
+    if not settings:
+        return {"success": False, "status": None, "reason": "MissingSettings", "retryable": False,
+                "dead": False}
+
+    from .apns_client import get_transport
+    from .metrics import timed
+
+    headers, content = build_apns_request(settings, title, body, extra, expiration, push_type)
+
+    try:
+        with timed("apns", "push") as call:
+            res = get_transport(settings.is_sandbox).post(device_token, headers, content)
+            call["outcome"] = str(res.status_code)
+    except Exception as e:
+        log_error(f"APNs request failed: {str(e)}")
+        return apns_result(settings, error=e)
+
+    from .device_tokens import invalidate_device_tokens, is_config_error, log_config_errors
+
+    result = apns_result(settings, res)
+    if result["success"]:
+        log_info(f"APNs push OK → {device_token[:8]}…")
+    elif result["dead"]:
+        # mŕtvy token nie je chyba – len ho zmažeme, nech ďalší hovor neplatí zbytočný push
+        invalidate_device_tokens({device_token: result["reason"]})
+    elif is_config_error(result):
+        # zlý topic / push type – token je v poriadku, hlásime konfiguráciu
+        log_config_errors([result], headers)
+    else:
+        log_error(f"APNs push failed ({res.status_code}): {res.text}")
+    return result
+
+
+def _apns_reason(res) -> str:
+    try:
+        return res.json().get("reason") or res.text
+    except Exception:
+        return res.text
+
+
+# ============= TOKEN UTILS =============
+
+def deduct_minutes_from_user(user_id: str, minutes: int = 1, reference: str | None = None) -> dict:
+    """
+    Odpočíta minúty z aktívnych tokenov používateľa – najstaršie najprv (FIFO),
+    a ak jeden token nestačí, pokračuje ďalším.
+    Tokeny zamkne jedným SELECT ... FOR UPDATE a zmeny zapíše jedným UPDATE,
+    takže súbežné end_call sa zoradia a nestratia žiadnu minútu.
+    Necommituje – commit patrí volajúcemu (spolu s Call Log).
+    Odpočet sa zapíše aj do ledgera (Transaction call_usage, reference = napr. call_id).
+
+    Vráti {"requested", "deducted", "missing", "tokens": [{"token", "minutes", "remaining"}]}.
+    """
+    return deduct_minutes_batch([(user_id, minutes, reference)])[0]
+
+
+def deduct_minutes_batch(requests: list) -> list:
+    """
+    Odpočet pre viac používateľov naraz (flush bežiacich hovorov).
+    requests = [(user_id, minutes, reference)] – ten istý používateľ môže byť viackrát.
+    Jeden zamykajúci SELECT na tokeny všetkých používateľov, jeden UPDATE tokenov,
+    jeden upsert zostatkov a jeden zápis do ledgera. Výsledky v poradí requests.
+    """
+    from .balance import apply_balance_deltas
+    from .ledger import record_entries
+
+    results = []
+    for _user_id, minutes, _reference in requests:
+        minutes = max(int(minutes or 0), 0)
+        results.append({"requested": minutes, "deducted": 0, "missing": minutes, "tokens": []})
+    users = sorted({user_id for (user_id, _, _), r in zip(requests, results, strict=True) if r["requested"]})
+    if not users:
+        return results
+
+    tokens = {}
+    for tok in frappe.db.sql(
+        """
+        select name, owner_user, minutes_remaining
+        from `tabFriday Token`
+        where owner_user in %(users)s and status = 'active' and minutes_remaining > 0
+        order by owner_user asc, created_at asc, creation asc, name asc
+        for update
+        """,
+        {"users": tuple(users)},
+        as_dict=True,
+    ):
+        tokens.setdefault(tok.owner_user, []).append(tok)
+
+    remaining = {}
+    deltas, entries = {}, []
+    for (user_id, _minutes, reference), result in zip(requests, results, strict=True):
+        left = result["requested"]
+        for tok in tokens.get(user_id, ()):
+            if not left:
+                break
+            available = remaining.get(tok.name, int(tok.minutes_remaining))
+            take = min(available, left)
+            if not take:
+                continue
+            left -= take
+            remaining[tok.name] = available - take
+            result["tokens"].append({"token": tok.name, "minutes": take, "remaining": available - take})
+
+        if not result["tokens"]:
+            if result["requested"]:
+                log_info(f"User {user_id} has no active tokens")
+            continue
+
+        result["deducted"] = result["requested"] - left
+        result["missing"] = left
+        spent = sum(1 for t in result["tokens"] if t["remaining"] == 0)
+        minutes_delta, tokens_delta = deltas.get(user_id, (0, 0))
+        deltas[user_id] = (minutes_delta - result["deducted"], tokens_delta - spent)
+        entries.append({
+            "user": user_id,
+            "type": "call_usage",
+            "seconds_delta": -result["deducted"] * 60,
+            "reference": reference,
+        })
+        if left:
+            log_info(f"User {user_id} ran out of minutes, {left} minute(s) not covered")
+        log_info(f"Deducted {result['deducted']} minutes from {len(result['tokens'])} token(s) ({user_id})")
+
+    if remaining:
+        _write_token_deductions([{"token": name, "remaining": left} for name, left in remaining.items()])
+        apply_balance_deltas(deltas)
+        record_entries(entries)
+    return results
+
+
+def _write_token_deductions(changes: list):
+    """Jeden UPDATE pre všetky dotknuté tokeny (CASE podľa name)."""
+    case = " ".join("when %s then %s" for _ in changes)
+    remaining, status = [], []
+    for c in changes:
+        remaining += [c["token"], c["remaining"]]
+        status += [c["token"], "spent" if c["remaining"] == 0 else "active"]
+    names = tuple(c["token"] for c in changes)
+    now = frappe.utils.now_datetime()
+
+    frappe.db.sql(
+        f"""
+        update `tabFriday Token`
+        set minutes_remaining = case name {case} end,
+            status = case name {case} end,
+            last_used_at = %s,
+            modified = %s
+        where name in %s
+        """,
+        (*remaining, *status, now, now, names),
+    )
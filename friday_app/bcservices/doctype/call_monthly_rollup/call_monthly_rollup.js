@@ -0,0 +1,8 @@
+// Copyright (c) 2025, andrej and contributors
+// For license information, please see license.txt
+
+// frappe.ui.form.on("Call Monthly Rollup", {
+// 	refresh(frm) {
+
+// 	},
+// });
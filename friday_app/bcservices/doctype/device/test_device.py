@@ -1,8 +1,11 @@
 # Copyright (c) 2025, andrej and Contributors
 # See license.txt
 
-# import frappe
+import frappe
 from frappe.tests import IntegrationTestCase
+from frappe.utils import add_days, now_datetime
+
+from friday_app.api.device_tokens import cleanup_dead_devices, invalidate_device_tokens
 
 
 # On IntegrationTestCase, the doctype test records and all
@@ -19,4 +22,35 @@ class IntegrationTestDevice(IntegrationTestCase):
 	Use this class for testing interactions between multiple components.
 	"""
 
-	pass
+	def _device(self, voip_token, apns_token):
+		return frappe.get_doc(
+			{"doctype": "Device", "voip_token": voip_token, "apns_token": apns_token, "device_type": "iOS"}
+		).insert(ignore_permissions=True)
+
+	def test_dead_tokens_are_cleared(self):
+		device = self._device("voip-dead-1", "apns-alive-1")
+		other = self._device("voip-alive-2", "apns-dead-2")
+
+		invalidate_device_tokens({"voip-dead-1": "Unregistered", "apns-dead-2": "BadDeviceToken"})
+
+		device.reload()
+		other.reload()
+		self.assertFalse(device.voip_token)
+		self.assertEqual(device.apns_token, "apns-alive-1")
+		self.assertEqual(device.invalid_reason, "Unregistered")
+		self.assertTrue(device.invalidated_at)
+		self.assertEqual(other.voip_token, "voip-alive-2")
+		self.assertFalse(other.apns_token)
+		self.assertEqual(other.invalid_reason, "BadDeviceToken")
+
+	def test_cleanup_removes_devices_without_tokens(self):
+		dead = self._device("voip-dead-3", None)
+		invalidate_device_tokens({"voip-dead-3": "Unregistered"})
+		frappe.db.set_value("Device", dead.name, "invalidated_at", add_days(now_datetime(), -60))
+		recent = self._device("voip-dead-4", None)
+		invalidate_device_tokens({"voip-dead-4": "Unregistered"})
+
+		cleanup_dead_devices()
+
+		self.assertFalse(frappe.db.exists("Device", dead.name))
+		self.assertTrue(frappe.db.exists("Device", recent.name))
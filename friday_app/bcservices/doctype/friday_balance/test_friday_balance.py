@@ -0,0 +1,103 @@
+# Copyright (c) 2025, andrej and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from friday_app.api import friday
+from friday_app.api.balance import get_balance, rebuild_balances, verify_balances
+from friday_app.api.utils import deduct_minutes_from_user
+from friday_app.patches import backfill_friday_balance
+
+
+# On IntegrationTestCase, the doctype test records and all
+# link-field test record dependencies are recursively loaded
+# Use these module variables to add/remove to/from that list
+EXTRA_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
+IGNORE_TEST_RECORD_DEPENDENCIES = []  # eg. ["User"]
+
+
+class IntegrationTestFridayBalance(IntegrationTestCase):
+	"""
+	Friday Balance sa udržiava inkrementálne a zhoduje sa s prepočtom z tokenov.
+	"""
+
+	def setUp(self):
+		self.user = self._make_user("balance_a")
+
+	def _make_user(self, suffix):
+		return frappe.get_doc(
+			{
+				"doctype": "Friday User",
+				"clerk_id": f"user_{suffix}",
+				"email": f"{suffix}@friday.test",
+				"username": suffix,
+				"role": "client",
+				"status": "active",
+			}
+		).insert(ignore_permissions=True).name
+
+	def _token(self, minutes, status="active", user=None):
+		return frappe.get_doc(
+			{"doctype": "Friday Token", "owner_user": user or self.user, "minutes_remaining": minutes, "status": status}
+		).insert(ignore_permissions=True)
+
+	def test_incremental_updates(self):
+		first = self._token(60)
+		second = self._token(30)
+		self._token(45, status="listed")
+		self.assertEqual(get_balance(self.user), {"total_minutes": 90, "active_tokens": 2})
+
+		first.minutes_remaining = 50
+		first.save(ignore_permissions=True)
+		second.status = "listed"
+		second.save(ignore_permissions=True)
+		self.assertEqual(get_balance(self.user), {"total_minutes": 50, "active_tokens": 1})
+
+		other = self._make_user("balance_b")
+		first.owner_user = other
+		first.save(ignore_permissions=True)
+		self.assertEqual(get_balance(self.user)["total_minutes"], 0)
+		self.assertEqual(get_balance(other), {"total_minutes": 50, "active_tokens": 1})
+
+		first.delete(ignore_permissions=True)
+		self.assertEqual(get_balance(other)["total_minutes"], 0)
+		self.assertEqual(verify_balances(), [])
+
+	def test_direct_deduction_keeps_balance(self):
+		self._token(2)
+		deduct_minutes_from_user(self.user, 1)
+		self.assertEqual(get_balance(self.user)["total_minutes"], 1)
+		deduct_minutes_from_user(self.user, 1)
+		self.assertEqual(get_balance(self.user), {"total_minutes": 0, "active_tokens": 0})
+		self.assertEqual(verify_balances(self.user), [])
+
+	def test_rebuild_repairs_drift(self):
+		self._token(60)
+		frappe.db.set_value("Friday Balance", self.user, "total_minutes", 999)
+		self.assertEqual(len(verify_balances(self.user)), 1)
+
+		self.assertEqual(rebuild_balances(self.user), 1)
+		self.assertEqual(get_balance(self.user)["total_minutes"], 60)
+		self.assertEqual(verify_balances(self.user), [])
+
+	def test_backfill_patch_for_existing_tokens(self):
+		# tokeny spred zavedenia Friday Balance – riadok zostatku neexistuje
+		self._token(60)
+		frappe.db.delete("Friday Balance", {"user": self.user})
+		self.assertEqual(get_balance(self.user)["total_minutes"], 0)
+
+		backfill_friday_balance.execute()
+		self.assertEqual(get_balance(self.user), {"total_minutes": 60, "active_tokens": 1})
+
+		deduct_minutes_from_user(self.user, 1)
+		self.assertEqual(get_balance(self.user)["total_minutes"], 59)
+		self.assertEqual(verify_balances(self.user), [])
+
+	def test_balance_endpoint_keeps_tokens_by_default(self):
+		token = self._token(60)
+		response = friday.balance(user_id=self.user)
+		self.assertEqual(response["total_minutes"], 60)
+		self.assertEqual([t.name for t in response["tokens"]], [token.name])
+
+		self.assertNotIn("tokens", friday.balance(user_id=self.user, with_tokens=0))
@@ -1,9 +1,20 @@
 # Copyright (c) 2025, andrej and contributors
 # For license information, please see license.txt
 
-# import frappe
+import frappe
 from frappe.model.document import Document
 
+from friday_app.api.market import remove_from_book, sync_listing_after_commit
+
 
 class FridayListing(Document):
-	pass
+	def validate(self):
+		if self.token and not self.issued_year:
+			self.issued_year = frappe.db.get_value("Friday Token", self.token, "issued_year")
+
+	def on_update(self):
+		# kniha sa mení až po commite – inak by ukazovala ponuku, ktorá v DB nie je
+		sync_listing_after_commit(self.name)
+
+	def on_trash(self):
+		remove_from_book(self.name)
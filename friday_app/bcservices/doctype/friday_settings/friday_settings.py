@@ -1,9 +1,20 @@
 # Copyright (c) 2025, andrej and contributors
 # For license information, please see license.txt
 
-# import frappe
+import frappe
 from frappe.model.document import Document
 
+from friday_app.api.settings import bump_settings_version, clear_settings_cache
+
 
 class FridaySettings(Document):
-	pass
+	def on_update(self):
+		self._invalidate()
+
+	def on_trash(self):
+		self._invalidate()
+
+	def _invalidate(self):
+		# tento worker hneď, ostatné po commite (inak by si mohli načítať ešte starú cenu)
+		clear_settings_cache(frappe.local.site)
+		frappe.db.after_commit.add(bump_settings_version)
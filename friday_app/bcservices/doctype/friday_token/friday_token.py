@@ -4,6 +4,29 @@
 # import frappe
 from frappe.model.document import Document
 
+from friday_app.api.balance import apply_balance_delta, token_contribution
+
 
 class FridayToken(Document):
-	pass
+	def after_insert(self):
+		minutes, tokens = token_contribution(self.status, self.minutes_remaining)
+		apply_balance_delta(self.owner_user, minutes, tokens)
+
+	def on_update(self):
+		# after_insert už zostatok upravil
+		if self.flags.in_insert:
+			return
+		before = self.get_doc_before_save()
+		if not before:
+			return
+		old_minutes, old_tokens = token_contribution(before.status, before.minutes_remaining)
+		new_minutes, new_tokens = token_contribution(self.status, self.minutes_remaining)
+		if before.owner_user != self.owner_user:
+			apply_balance_delta(before.owner_user, -old_minutes, -old_tokens)
+			apply_balance_delta(self.owner_user, new_minutes, new_tokens)
+		else:
+			apply_balance_delta(self.owner_user, new_minutes - old_minutes, new_tokens - old_tokens)
+
+	def on_trash(self):
+		minutes, tokens = token_contribution(self.status, self.minutes_remaining)
+		apply_balance_delta(self.owner_user, -minutes, -tokens)
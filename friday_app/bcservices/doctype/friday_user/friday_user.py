@@ -1,5 +1,16 @@
 import frappe
 from frappe.model.document import Document
 
+from friday_app.api.auth_context import invalidate_auth_cache
+
+
 class FridayUser(Document):
-    pass
+    def on_update(self):
+        # rola / status / username sú v auth cache – zmena (aj ban) ju musí zneplatniť
+        invalidate_auth_cache(self.clerk_id)
+        before = self.get_doc_before_save()
+        if before and before.clerk_id != self.clerk_id:
+            invalidate_auth_cache(before.clerk_id)
+
+    def on_trash(self):
+        invalidate_auth_cache(self.clerk_id)
@@ -1,9 +1,17 @@
 # Copyright (c) 2025, andrej and contributors
 # For license information, please see license.txt
 
-# import frappe
+import frappe
+from frappe import _
 from frappe.model.document import Document
 
 
 class Transaction(Document):
-	pass
+	# ledger je append-only: zápisy idú cez friday_app.api.ledger.record_entries,
+	# oprava = nový protizápis, nie úprava ani mazanie
+	def validate(self):
+		if not self.is_new():
+			frappe.throw(_("Transactions are append-only"))
+
+	def on_trash(self):
+		frappe.throw(_("Transactions are append-only"))
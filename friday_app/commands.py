@@ -0,0 +1,69 @@
+import click
+from frappe.commands import get_site, pass_context
+
+
+@click.command("rebuild-friday-balances")
+@click.option("--user", help="Prepočítať len jedného Friday User")
+@click.option("--verify", is_flag=True, default=False, help="Len porovnať, nič nezapisovať")
+@pass_context
+def rebuild_friday_balances(context, user=None, verify=False):
+	"""Prepočíta Friday Balance z aktívnych Friday Tokenov."""
+	import frappe
+
+	from friday_app.api.balance import rebuild_balances, verify_balances
+
+	site = get_site(context)
+	frappe.init(site=site)
+	frappe.connect()
+	try:
+		if verify:
+			mismatches = verify_balances(user)
+			for m in mismatches:
+				click.echo(f"{m['user']}: stored {m['stored']} != expected {m['expected']}")
+			click.echo(f"{len(mismatches)} mismatch(es)")
+			if mismatches:
+				raise SystemExit(1)
+		else:
+			fixed = rebuild_balances(user)
+			frappe.db.commit()
+			click.echo(f"Rebuilt {fixed} balance(s)")
+	finally:
+		frappe.destroy()
+
+
+@click.command("rebuild-friday-order-book")
+@pass_context
+def rebuild_friday_order_book(context):
+	"""Postaví Redis order book znova z otvorených Friday Listing."""
+	import frappe
+
+	from friday_app.api.market import rebuild_order_book
+
+	frappe.init(site=get_site(context))
+	frappe.connect()
+	try:
+		click.echo(f"Indexed {rebuild_order_book()} open listing(s)")
+	finally:
+		frappe.destroy()
+
+
+@click.command("backfill-friday-rollups")
+@click.option("--from-date", help="Prepočítať od dátumu (začiatok mesiaca), inak celú históriu")
+@pass_context
+def backfill_friday_rollups(context, from_date=None):
+	"""Prepočíta denné a mesačné súhrny hovorov z Call Log a archívu."""
+	import frappe
+
+	from friday_app.api.rollups import backfill_rollups
+
+	frappe.init(site=get_site(context))
+	frappe.connect()
+	try:
+		days = backfill_rollups(from_date)
+		frappe.db.commit()
+		click.echo(f"Rebuilt {days} daily rollup row(s)")
+	finally:
+		frappe.destroy()
+
+
+commands = [rebuild_friday_balances, rebuild_friday_order_book, backfill_friday_rollups]
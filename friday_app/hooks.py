@@ -88,6 +88,11 @@ app_license = "unlicense"
 # before_install = "friday_app.install.before_install"
 # after_install = "friday_app.install.after_install"
 
+after_migrate = [
+	"friday_app.api.indexes.ensure_indexes",
+	"friday_app.api.archive.ensure_archive_partitions",
+]
+
 # Uninstallation
 # ------------
 
@@ -161,6 +166,25 @@ app_license = "unlicense"
 # 	],
 # }
 
+scheduler_events = {
+	"cron": {
+		"* * * * *": [
+			"friday_app.api.metering.flush_call_meters",
+			"friday_app.api.call_state.expire_ringing_calls"
+		],
+		"*/5 * * * *": [
+			"friday_app.api.payments.retry_stripe_events",
+			"friday_app.api.rollups.roll_up_calls",
+			"friday_app.api.presence.prune_presence"
+		],
+	},
+	"daily": [
+		"friday_app.api.device_tokens.cleanup_dead_devices",
+		"friday_app.api.ledger.daily_snapshots",
+		"friday_app.api.archive.archive_calls"
+	],
+}
+
 # Testing
 # -------
 
@@ -199,13 +223,13 @@ app_license = "unlicense"
 
 # Request Events
 # ----------------
-# before_request = ["friday_app.utils.before_request"]
-# after_request = ["friday_app.utils.after_request"]
+before_request = ["friday_app.api.metrics.before_request"]
+after_request = ["friday_app.api.metrics.after_request"]
 
 # Job Events
 # ----------
 # before_job = ["friday_app.utils.before_job"]
-# after_job = ["friday_app.utils.after_job"]
+after_job = ["friday_app.api.metrics.after_job"]
 
 # User Data Protection
 # --------------------
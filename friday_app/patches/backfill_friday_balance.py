@@ -0,0 +1,9 @@
+from friday_app.api.balance import rebuild_balances
+
+
+def execute():
+	"""
+	Friday Balance pre používateľov, ktorí mali tokeny pred jeho zavedením.
+	Bez toho by prvý odpočet / nákup založil riadok len so zmenou.
+	"""
+	rebuild_balances()
@@ -0,0 +1,19 @@
+import frappe
+
+from friday_app.api.market import rebuild_order_book
+
+
+def execute():
+	"""
+	Friday Listing.issued_year pre ponuky spred zavedenia poľa – inak by otvorené
+	ponuky skončili v knihe pod rokom 0 a browse podľa roka by ich nenašiel.
+	"""
+	frappe.db.sql(
+		"""
+		update `tabFriday Listing` l
+		join `tabFriday Token` t on t.name = l.token
+		set l.issued_year = t.issued_year
+		where ifnull(l.issued_year, 0) = 0 and ifnull(t.issued_year, 0) != 0
+		"""
+	)
+	rebuild_order_book()
@@ -0,0 +1,20 @@
+import frappe
+
+
+def execute():
+	"""
+	Call Log sa odteraz volá podľa call_id (unikátny) – zosúladí staré záznamy
+	ešte pred syncom doctype, inak by unikátny index na call_id zlyhal.
+	"""
+	# chýbajúce alebo duplicitné call_id nahradí doterajším name (ten je unikátny)
+	frappe.db.sql(
+		"""
+		update `tabCall Log` cl
+		left join (
+			select call_id from `tabCall Log` group by call_id having count(*) > 1
+		) dup on dup.call_id = cl.call_id
+		set cl.call_id = cl.name
+		where ifnull(cl.call_id, '') = '' or dup.call_id is not null
+		"""
+	)
+	frappe.db.sql("update `tabCall Log` set name = call_id where name != call_id")
@@ -0,0 +1,40 @@
+import frappe
+from frappe.utils import cint
+
+from friday_app.api.ledger import record_entries
+
+CHUNK = 500
+
+
+def execute():
+	"""
+	Otvárací zápis ledgera pre minúty, ktoré používatelia mali pred jeho zavedením.
+	Hlavička (ledger_seq / ledger_seconds) by inak začínala na nule a balance_after_seconds,
+	position_at aj my_statement by nesedeli so zostatkom.
+	Počítajú sa vlastnené tokeny (active + listed) – predaj ponúknutého tokenu z ledgera odpočíta.
+	"""
+	owned = frappe.db.sql(
+		"""
+		select owner_user as user, sum(minutes_remaining) * 60 as seconds
+		from `tabFriday Token`
+		where status in ('active', 'listed') and ifnull(owner_user, '') != ''
+		group by owner_user
+		""",
+		as_dict=True,
+	)
+	heads = dict(frappe.db.sql("select user, ledger_seconds from `tabFriday Balance`"))
+	opened = set(frappe.db.sql_list("select distinct user from `tabTransaction` where type = 'opening_balance'"))
+
+	entries = [
+		{
+			"user": row.user,
+			"type": "opening_balance",
+			"seconds_delta": cint(row.seconds) - cint(heads.get(row.user)),
+			"note": "Opening balance",
+		}
+		for row in owned
+		if row.user not in opened and cint(row.seconds) != cint(heads.get(row.user))
+	]
+	for i in range(0, len(entries), CHUNK):
+		record_entries(entries[i:i + CHUNK])
+		frappe.db.commit()
@@ -1,5 +1,5 @@
-import frappe, stripe, json
-from bcservices.api.payments import handle_stripe_event
+import frappe
+from friday_app.api.payments import stripe_webhook
 
 no_cache = 1
 no_sitemap = 1
@@ -10,15 +10,5 @@ def get_context(context):
 
 @frappe.whitelist(allow_guest=True, methods=["POST"])
 def index():
-    payload = frappe.request.data
-    sig = frappe.get_request_header("Stripe-Signature")
-    secret = frappe.conf.get("STRIPE_WEBHOOK_SECRET")
-    if not secret:
-        frappe.throw("Missing STRIPE_WEBHOOK_SECRET")
-    stripe.api_key = frappe.conf.get("STRIPE_SECRET_KEY")
-    try:
-        event = stripe.Webhook.construct_event(payload=payload, sig_header=sig, secret=secret)
-    except Exception as e:
-        frappe.throw(f"Webhook error: {e}")
-    handle_stripe_event(event)
-    return "ok"
+    # spracovanie je v friday_app.api.payments.stripe_webhook (rýchle potvrdenie + fronta)
+    return stripe_webhook()